@@ -41,9 +41,9 @@ class PerformanceAnalysisView(LoginRequiredMixin, UserPassesTestMixin, View):
 
             # 2. Class-wise Averages by Subject for the selected Examination
             class_subject_averages = Mark.objects.filter(examination=selected_examination) \
-                                                .values('student__current_class__name', 'subject__name') \
+                                                .values('school_class__name', 'subject__name') \
                                                 .annotate(avg_score=Avg('score'), student_count=Count('student', distinct=True)) \
-                                                .order_by('student__current_class__name', 'subject__name')
+                                                .order_by('school_class__name', 'subject__name')
 
             # Re-structure class_subject_averages for easier template rendering
             # { 'ClassName': { 'SubjectName': avg_score, ... }, ... }
@@ -51,7 +51,7 @@ class PerformanceAnalysisView(LoginRequiredMixin, UserPassesTestMixin, View):
             all_subjects = Subject.objects.all().order_by('name') # Get all subjects for consistent headers
 
             for item in class_subject_averages:
-                class_name = item['student__current_class__name']
+                class_name = item['school_class__name']
                 subject_name = item['subject__name']
                 avg_score = item['avg_score']
                 student_count = item['student_count']
@@ -143,15 +143,17 @@ class OverallSchoolPerformanceView(LoginRequiredMixin, UserPassesTestMixin, View
         # Per-Class Passing/Failing Rate for the selected examination
         per_class_pass_fail = []
         classes_in_exam = Class.objects.filter(
-            students__mark__examination=selected_examination_for_overall
+            marks__examination=selected_examination_for_overall
         ).distinct().order_by('name')
 
         for cls in classes_in_exam:
-            students_in_class_for_exam = all_students_in_exam.filter(current_class=cls)
+            students_in_class_for_exam = Student.objects.filter(
+                mark__examination=selected_examination_for_overall, mark__school_class=cls
+            ).distinct()
             total_students_in_class = students_in_class_for_exam.count()
 
             students_in_class_with_avg_scores = students_in_class_for_exam.annotate(
-                avg_score_in_exam=Avg('mark__score', filter=Q(mark__examination=selected_examination_for_overall, mark__student__current_class=cls))
+                avg_score_in_exam=Avg('mark__score', filter=Q(mark__examination=selected_examination_for_overall, mark__school_class=cls))
             )
             
             passed_in_class_count = students_in_class_with_avg_scores.filter(
@@ -6,4 +6,11 @@ class ExaminationSelectionForm(forms.Form):
         queryset=Examination.objects.all().order_by('-date'),
         empty_label="Select an Examination",
         label="Select Exam"
-    )
\ No newline at end of file
+    )
+
+class ExaminationComparisonForm(forms.Form):
+    examinations = forms.ModelMultipleChoiceField(
+        queryset=Examination.objects.all().order_by('-academic_year', 'term', 'date'),
+        widget=forms.CheckboxSelectMultiple,
+        label="Examinations to compare"
+    )
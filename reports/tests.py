@@ -1,3 +1,113 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from students.models import Class, Examination, Mark, Student, Subject
+from users.models import CustomUser
+
+from .views import overall_report_with_attempt_status
+
+
+class AttemptStatusReportTests(TestCase):
+    """The overall attempt-status report, built from exam enrollments in one grouped query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.subject = Subject.objects.create(name='English', code='ENG')
+        cls.examination = Examination.objects.create(
+            name='First Term Examination', date=datetime.date(2026, 3, 1), academic_year=2026, term='1',
+        )
+        cls.classes = {}
+        # class name: [(gender, score or None), ...]
+        pupils = {
+            'Standard 4': [('M', 70), ('M', 0), ('F', 55), ('F', None)],
+            'Standard 5': [('F', 80), ('M', None)],
+            'Standard 6': [],
+        }
+        for class_name, rows in pupils.items():
+            class_obj = cls.classes[class_name] = Class.objects.create(name=class_name, year=2026)
+            for index, (gender, score) in enumerate(rows):
+                student = Student.objects.create(
+                    prem_number=f'{class_name[-1]}-{index}', first_name='Pupil', last_name=str(index),
+                    date_of_birth=datetime.date(2015, 1, 1), gender=gender, current_class=class_obj,
+                )
+                if score is not None:
+                    Mark.objects.create(student=student, subject=cls.subject, examination=cls.examination, score=score)
+        cls.examination.classes_taking_exam.add(cls.classes['Standard 4'], cls.classes['Standard 5'])
+
+    def report(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = overall_report_with_attempt_status(request, self.examination.pk)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def report_rows(self):
+        user, _ = CustomUser.objects.get_or_create(username='head', defaults={'role': 'headteacher'})
+        self.client.force_login(user)
+        response = self.client.get(reverse('reports:overall_report_with_attempt_status', args=[self.examination.pk]))
+        self.totals = response.context['totals']
+        return response.context['report_data']
+
+    def test_counts_per_class_and_gender(self):
+        rows = {row['class_name']: row for row in self.report_rows()}
+
+        standard_4 = rows['Standard 4']
+        self.assertEqual(
+            (standard_4['total_students'], standard_4['attempted_count'], standard_4['not_attempted_count']), (4, 2, 2),
+        )
+        self.assertEqual((standard_4['boys_total'], standard_4['boys_attempted']), (2, 1))
+        self.assertEqual((standard_4['girls_total'], standard_4['girls_attempted'], standard_4['girls_not_attempted']), (2, 1, 1))
+        self.assertEqual((rows['Standard 5']['attempted_count'], rows['Standard 5']['boys_not_attempted']), (1, 1))
+        # A class not sitting the examination has no enrollments
+        self.assertEqual(rows['Standard 6']['total_students'], 0)
+
+        totals = self.totals
+        self.assertEqual((totals['total_students'], totals['attempted_count'], totals['not_attempted_count']), (6, 3, 3))
+
+    def test_students_joining_after_the_examination_was_set_are_counted(self):
+        Student.objects.create(
+            prem_number='5-late', first_name='Late', last_name='Joiner',
+            date_of_birth=datetime.date(2015, 1, 1), gender='F', current_class=self.classes['Standard 5'],
+        )
+        standard_5 = next(row for row in self.report_rows() if row['class_name'] == 'Standard 5')
+        self.assertEqual((standard_5['total_students'], standard_5['girls_not_attempted']), (3, 1))
+
+    def test_query_count_does_not_grow_with_classes(self):
+        # The examination, then one grouped query for every class
+        with self.assertNumQueries(2):
+            self.report()
+        for index in range(5):
+            class_obj = Class.objects.create(name=f'Extra {index}', year=2026)
+            self.examination.classes_taking_exam.add(class_obj)
+        with self.assertNumQueries(2):
+            self.report()
+
+
+class NotAttemptedSchoolTests(TestCase):
+    """The school-wide not-attempted list, page and CSV."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.class_obj = Class.objects.create(name='Standard 4', year=2026)
+        cls.examination = Examination.objects.create(
+            name='First Term Examination', date=datetime.date(2026, 3, 1), academic_year=2026, term='1',
+        )
+        cls.examination.classes_taking_exam.add(cls.class_obj)
+        cls.user = CustomUser.objects.create_user(username='head', password='secret', role='headteacher')
+
+    def test_lists_students_who_joined_after_the_examination_was_set(self):
+        Student.objects.create(
+            prem_number='LATE-1', first_name='Late', last_name='Joiner',
+            date_of_birth=datetime.date(2015, 1, 1), gender='M', current_class=self.class_obj,
+        )
+        self.client.force_login(self.user)
+        url = reverse('reports:not_attempted_school', args=[self.examination.pk])
+
+        response = self.client.get(url)
+        self.assertEqual([enrollment.student.prem_number for enrollment in response.context['enrollments']], ['LATE-1'])
+
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertIn('LATE-1', b''.join(response.streaming_content).decode())
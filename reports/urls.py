@@ -22,10 +22,13 @@ path('top-bottom-pdf/<int:class_id>/<int:examination_id>/',views.top_bottom_pdf,
 path('select-exam-for-not-attempted/', views.select_exam_for_not_attempted, name='select_exam_for_not_attempted'),
 path("overall-report/<int:examination_id>/", views.overall_report_with_attempt_status, name="overall_report_with_attempt_status"),
 path('not-attempted-students/<int:class_id>/<int:examination_id>/', views.not_attempted_students, name='not_attempted_students'),
+path('not-attempted/<int:examination_id>/', views.not_attempted_school, name='not_attempted_school'),
 
 # --- STUDENT PERFORMANCE REPORTS ---
 path('student/trend/<int:student_id>/', views.student_performance_trend, name='student_performance_trend'),
+path('class/<int:class_id>/trends/', views.class_trends, name='class_trends'),
 path('select-comparison-exam/', views.select_comparison_exam, name='select_comparison_exam'),
 path('handle-comparison/', views.handle_comparison_selection, name='handle_comparison_selection'),
 path('class/comparison/<int:examination_id>/', views.class_comparison, name='class_comparison'),
+path('class/comparison/', views.class_comparison_matrix, name='class_comparison_matrix'),
 ]
\ No newline at end of file
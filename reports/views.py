@@ -1,31 +1,24 @@
 # reports/views.py
 
 from django.shortcuts import render, get_object_or_404, redirect
-from django.db.models import Count, Avg, Q, F, Sum
+from django.db.models import Count, Avg, Q, F, FilteredRelation
 from students.models import Student, Class, Examination, Mark
+from students.results import ranked_exam_results, get_published_snapshot, get_exam_class_summaries, get_student_trends
+from students.cache import cached_results
+from students.enrollment import not_attempted_enrollments
+from students.exports import not_attempted_csv
 from users.models import CustomUser
 from .utils import role_required
 from django.db.models import Count
 from django.template.loader import render_to_string
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.text import slugify
 from weasyprint import HTML, CSS
 from io import BytesIO
 import os
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .forms import ExaminationSelectionForm
-
-def get_grade(avg):
-    if avg >= 81:
-        return "A"
-    elif avg >= 61:
-        return "B"
-    elif avg >= 41:
-        return "C"
-    elif avg >= 21:
-        return "D"
-    else:
-        return "F"
+from .forms import ExaminationSelectionForm, ExaminationComparisonForm
 
 def select_exam_for_report(request):
     if request.method == 'POST':
@@ -39,34 +32,49 @@ def select_exam_for_report(request):
     
     return render(request, 'reports/select_exam.html', {'form': form})
 
-def overall_report_with_attempt_status(request, examination_id):
-    classes = Class.objects.all().order_by('name')
-    report_data = []
+ATTEMPT_REPORT_GENDERS = [('boys', 'M'), ('girls', 'F')]
 
-    for cls in classes:
-        total_students = Student.objects.filter(current_class=cls).count()
 
-        # Count distinct students who have a Mark entry for this exam,
-        # where the score is greater than 0.
-        attempted_students_count = Mark.objects.filter(
-            student__current_class=cls,
-            examination_id=examination_id,
-            score__gt=0  # <-- CORRECTED: Use 'score' instead of 'mark'
-        ).values('student').distinct().count()
+def overall_report_with_attempt_status(request, examination_id):
+    examination = get_object_or_404(Examination, pk=examination_id)
 
-        not_attempted_students_count = total_students - attempted_students_count
+    # Every class with its enrolled, attempted and per-gender counts in one
+    # grouped query. The examination is part of the join condition, so only
+    # this exam's enrollments are read, through the
+    # (examination, school_class, attempted) index.
+    counts = {
+        'total_students': Count('enrolled'),
+        'attempted_count': Count('enrolled', filter=Q(enrolled__attempted=True)),
+    }
+    for label, gender in ATTEMPT_REPORT_GENDERS:
+        counts[f'{label}_total'] = Count('enrolled', filter=Q(enrolled__student__gender=gender))
+        counts[f'{label}_attempted'] = Count('enrolled', filter=Q(enrolled__student__gender=gender, enrolled__attempted=True))
+    classes = Class.objects.annotate(
+        enrolled=FilteredRelation('exam_enrollments', condition=Q(exam_enrollments__examination=examination)),
+    ).annotate(**counts).order_by('name')
 
-        report_data.append({
+    report_data = []
+    totals = dict.fromkeys(counts, 0)
+    for cls in classes:
+        row = {name: getattr(cls, name) for name in counts}
+        for name, value in row.items():
+            totals[name] += value
+        row.update({
             'class_name': cls.name,
-            'total_students': total_students,
-            'attempted_count': attempted_students_count,
-            'not_attempted_count': not_attempted_students_count,
             'class_id': cls.id,
-            'examination_id': examination_id,
+            'examination_id': examination.pk,
         })
-    
+        report_data.append(row)
+    for row in report_data + [totals]:
+        row['not_attempted_count'] = row['total_students'] - row['attempted_count']
+        for label, _ in ATTEMPT_REPORT_GENDERS:
+            row[f'{label}_not_attempted'] = row[f'{label}_total'] - row[f'{label}_attempted']
+
     context = {
         'report_data': report_data,
+        'totals': totals,
+        'examination': examination,
+        'examination_name': str(examination),
     }
     return render(request, 'reports/overall_exam_report.html', context)
 
@@ -114,53 +122,6 @@ def graduated_students(request):
         'selected_year': year
     })
 
-def get_student_performance_data(class_obj, examination_obj):
-    """
-    Efficiently gets and processes student performance data for a specific class and exam.
-    """
-    student_scores_queryset = (
-        Mark.objects.filter(
-            student__current_class=class_obj,
-            examination=examination_obj, # CRITICAL FIX: Filter by examination
-            score__isnull=False
-        )
-        .values('student')
-        .annotate(
-            total_score=Sum('score'),
-            average=Avg('score')
-        )
-        .order_by('-total_score')
-    )
-    
-    students_with_position = []
-    
-    # Efficiently get student objects in a single query
-    student_ids = [s['student'] for s in student_scores_queryset]
-    students_map = {
-        s.id: s for s in Student.objects.filter(id__in=student_ids)
-    }
-
-    # Assign position and grade while handling ties
-    previous_score = None
-    current_position = 1
-    for i, s in enumerate(student_scores_queryset):
-        # Handle ties: if the score is the same as the previous one, use the same position
-        if s['total_score'] != previous_score:
-            current_position = i + 1
-        previous_score = s['total_score']
-        
-        avg = s['average']
-        
-        students_with_position.append({
-            'student': students_map.get(s['student']), # Use the pre-fetched student object
-            'total_score': s['total_score'],
-            'average': avg,
-            'grade': get_grade(avg),
-            'position': current_position
-        })
-
-    return students_with_position
-
 @role_required(['headteacher', 'academic_teacher', 'statistic_teacher', 'class_teacher'])
 def top_and_bottom_students(request, class_id, examination_id):
     """View for displaying Top and Bottom Students"""
@@ -215,26 +176,15 @@ def select_exam_for_not_attempted(request):
 def not_attempted_students(request, class_id, examination_id):
     # Get the class object to be used in the template
     current_class = get_object_or_404(Class, pk=class_id)
-    
-    # Get all students in the class
-    all_students_in_class = Student.objects.filter(current_class=current_class)
-
-    # Get the IDs of students who attempted the exam (mark > 0)
-    # This query finds the IDs of students who have a Mark entry for this exam.
-    attempted_student_ids = Mark.objects.filter(
-        student__current_class=current_class,
-        examination_id=examination_id,
-        score__gt=0  # Use your corrected field name
-    ).values_list('student_id', flat=True)
-
-    # Exclude students who are in the attempted_student_ids list
-    not_attempted_students = all_students_in_class.exclude(
-        id__in=attempted_student_ids
-    ).order_by('first_name', 'last_name')
+    examination = get_object_or_404(Examination, pk=examination_id)
+
+    enrollments = not_attempted_enrollments(examination, current_class)
 
     context = {
-        'students': not_attempted_students,
+        'students': [enrollment.student for enrollment in enrollments],
         'current_class': current_class,
+        'class_name': current_class.name,
+        'examination': examination,
         'examination_id': examination_id,
     }
     return render(request, 'reports/not_attempted_students.html', context)
@@ -244,24 +194,33 @@ def students_not_attempted_exam(request, class_id, examination_id):
     class_obj = get_object_or_404(Class, pk=class_id)
     examination = get_object_or_404(Examination, pk=examination_id)
 
-    # Get a list of student IDs who have at least one mark for this specific exam in this class.
-    students_with_marks_ids = Mark.objects.filter(
-        student__current_class=class_obj,
-        examination=examination
-    ).values_list('student__id', flat=True).distinct()
-    
-    # Now, find all active students in the class and exclude the ones who have a mark.
-    not_attempted = Student.objects.filter(
-        current_class=class_obj,
-        status='active'
-    ).exclude(
-        id__in=students_with_marks_ids
-    ).order_by('first_name')
-    
+    enrollments = not_attempted_enrollments(examination, class_obj)
+
     return render(request, 'reports/not_attempted_students.html', {
         'class_name': class_obj.name,
-        'students': not_attempted,
+        'students': [enrollment.student for enrollment in enrollments],
+        'examination': examination,
+    })
+
+@role_required(['headteacher', 'academic_teacher', 'statistic_teacher', 'admin'])
+def not_attempted_school(request, examination_id):
+    """
+    Every active student enrolled in the examination without a mark above
+    zero, grouped by class, from one anti-join query. ?format=csv streams the
+    same list as a file for follow-up.
+    """
+    examination = get_object_or_404(Examination, pk=examination_id)
+    enrollments = not_attempted_enrollments(examination)
+
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(not_attempted_csv(enrollments), content_type='text/csv; charset=utf-8')
+        filename = f"not_attempted_{slugify(examination.get_name_display())}_{examination.academic_year}_term{examination.term}.csv"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    return render(request, 'reports/not_attempted_school.html', {
         'examination': examination,
+        'enrollments': enrollments,
     })
 
 @login_required
@@ -309,36 +268,28 @@ def select_class_for_top_bottom(request, examination_id):
 
 def get_student_performance_data(class_obj, examination_obj):
     """Helper function to get and process student performance data."""
-    # Filter marks by both class and examination
-    student_scores = (
-        Mark.objects.filter(
-            student__current_class=class_obj,
-            examination=examination_obj,
-            score__isnull=False
-        )
-        .values('student')
-        .annotate(
-            total_score=Sum('score'),
-            average=Avg('score')
-        )
-        .order_by('-total_score')
-    )
-    
-    students_with_position = []
-    position = 1
-    for s in student_scores:
-        student_obj = Student.objects.get(pk=s['student'])
-        avg = s['average']
-        
-        students_with_position.append({
-            'student': student_obj,
-            'total_score': s['total_score'],
-            'average': avg,
-            'grade': get_grade(avg),
-            'position': position
-        })
-        position += 1
-    return students_with_position
+    # Totals and averages come from ExamResult; RANK() gives tied students the same position
+    snapshot = get_published_snapshot(examination_obj, class_obj)
+    if snapshot is not None:
+        return [{
+            'student': r['student'],
+            'total_score': r['total_score'],
+            'average': r['average_score'],
+            'grade': r['overall_grade'],
+            'position': r['position']
+        } for r in snapshot.class_results() if r['position'] is not None]
+
+    def compute():
+        exam_results = ranked_exam_results(examination_obj, class_obj).select_related('student')
+        return [{
+            'student': r.student,
+            'total_score': r.total_score,
+            'average': r.average_score,
+            'grade': r.overall_grade,
+            'position': r.class_rank
+        } for r in exam_results]
+
+    return cached_results('performance_data', examination_obj.pk, class_obj.pk, compute)
 
 @role_required(['headteacher', 'academic_teacher', 'statistic_teacher', 'class_teacher'])
 def top_and_bottom_students(request, class_id, examination_id):
@@ -388,25 +339,89 @@ def top_bottom_pdf(request, class_id, examination_id):
     response['Content-Disposition'] = 'filename="top_bottom_report.pdf"'
     return response
 
+def _trend_label(point):
+    """An examination's label on a trend, as Examination.__str__ renders it."""
+    term = dict(Examination.TERM_CHOICES).get(point['term'], point['term'])
+    return f"{point['name']} ({term} - {point['academic_year']})"
+
+
+# Width and height of the class trends sparklines, in SVG user units
+SPARKLINE_WIDTH = 120
+SPARKLINE_HEIGHT = 32
+
+
+def _sparkline(trend):
+    """
+    SVG polyline points of a trend's averages on a 0-100 scale, with the last
+    point marked separately so a single examination still shows up.
+    """
+    if not trend:
+        return None
+    step = SPARKLINE_WIDTH / max(len(trend) - 1, 1)
+    coordinates = [
+        (round(index * step, 1), round(SPARKLINE_HEIGHT - point['average'] * SPARKLINE_HEIGHT / 100, 1))
+        for index, point in enumerate(trend)
+    ]
+    return {
+        'points': ' '.join(f"{x},{y}" for x, y in coordinates),
+        'last_x': coordinates[-1][0],
+        'last_y': coordinates[-1][1],
+    }
+
+
 @role_required(['headteacher', 'academic_teacher', 'statistic_teacher'])
 def student_performance_trend(request, student_id):
     student = get_object_or_404(Student, pk=student_id)
 
-    # Use the Mark model instead of ExaminationResult
-    performance_data = Mark.objects.filter(
-        student=student
-    ).values(
-        'examination__name'
-    ).annotate(
-        average_score=Avg('score')
-    ).order_by('examination__date')
+    # One point per examination sat, so same-named exams of other terms and years stay apart
+    trend = get_student_trends([student])[student.pk]
+    performance_data = {
+        'labels': [_trend_label(point) for point in trend],
+        'averages': [point['average'] for point in trend],
+    }
 
     context = {
         'student': student,
-        'performance_data': list(performance_data)
+        'trend': trend,
+        'performance_data': performance_data,
     }
     return render(request, 'reports/student_performance_trend.html', context)
 
+
+@role_required(['headteacher', 'academic_teacher', 'statistic_teacher', 'admin', 'class_teacher'])
+def class_trends(request, class_id):
+    """
+    Every student of a class with a sparkline of their averages across the
+    examinations they sat. All the trends are read in one call, so the page
+    costs one results query however many students the class has.
+    """
+    class_obj = get_object_or_404(Class, pk=class_id)
+    if request.user.role == 'class_teacher' and class_obj.class_teacher_id != request.user.pk:
+        return HttpResponseForbidden("You can only view the trends of your own class.")
+
+    students = list(Student.objects.filter(current_class=class_obj).order_by('first_name', 'last_name'))
+    trends = get_student_trends(students)
+
+    rows = []
+    for student in students:
+        trend = trends[student.pk]
+        latest = trend[-1] if trend else None
+        rows.append({
+            'student': student,
+            'exams_sat': len(trend),
+            'latest': latest,
+            'latest_label': _trend_label(latest) if latest else '',
+            'change': round(latest['average'] - trend[-2]['average'], 2) if len(trend) > 1 else None,
+            'sparkline': _sparkline(trend),
+        })
+
+    return render(request, 'reports/class_trends.html', {
+        'class_obj': class_obj,
+        'rows': rows,
+        'sparkline_width': SPARKLINE_WIDTH,
+        'sparkline_height': SPARKLINE_HEIGHT,
+    })
+
 @role_required(['headteacher', 'academic_teacher', 'statistic_teacher'])
 def class_comparison(request, examination_id):
     examination = get_object_or_404(Examination, pk=examination_id)
@@ -415,10 +430,10 @@ def class_comparison(request, examination_id):
     class_averages = Mark.objects.filter(
         examination=examination
     ).values(
-        'student__current_class__name'
+        'school_class__name'
     ).annotate(
         class_average=Avg('score')
-    ).order_by('student__current_class__name')
+    ).order_by('school_class__name')
 
     context = {
         'examination': examination,
@@ -435,3 +450,43 @@ def handle_comparison_selection(request):
     if not exam_id:
         return redirect('reports:select_comparison_exam')
     return redirect('reports:class_comparison', examination_id=exam_id)
+
+@role_required(['headteacher', 'academic_teacher', 'statistic_teacher'])
+def class_comparison_matrix(request):
+    """
+    Class x examination matrix of averages, pass rates and attempted counts
+    for the selected examinations, oldest first. Per-examination figures come
+    from the results cache, so adding an exam to the comparison only computes
+    that exam's column.
+    """
+    form = ExaminationComparisonForm(request.GET or None)
+    examinations = []
+    matrix = []
+    chart = None
+
+    if form.is_valid():
+        examinations = sorted(form.cleaned_data['examinations'], key=lambda exam: (exam.academic_year, exam.term, exam.date))
+        summaries = get_exam_class_summaries([exam.pk for exam in examinations])
+        class_ids = {class_id for classes in summaries.values() for class_id in classes}
+        for class_obj in Class.objects.filter(pk__in=class_ids).order_by('name'):
+            matrix.append({
+                'class_name': class_obj.name,
+                'cells': [summaries[exam.pk].get(class_obj.pk) for exam in examinations],
+            })
+        chart = {
+            'labels': [row['class_name'] for row in matrix],
+            'datasets': [
+                {
+                    'label': str(exam),
+                    'data': [row['cells'][index]['average'] if row['cells'][index] else None for row in matrix],
+                }
+                for index, exam in enumerate(examinations)
+            ],
+        }
+
+    return render(request, 'reports/class_comparison_matrix.html', {
+        'form': form,
+        'examinations': examinations,
+        'matrix': matrix,
+        'chart': chart,
+    })
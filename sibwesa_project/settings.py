@@ -79,6 +79,23 @@ DATABASES = {
     }
 }
 
+# Computed class results are cached under 'results' (see students/cache.py).
+# The web server, the import worker (run_import_worker) and management
+# commands all bump its version keys, so it has to be shared between
+# processes: files on disk need no extra service or setup. Point it at
+# Redis or Memcached instead when the processes run on several machines.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'results': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'results'),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -135,5 +152,9 @@ ADMIN_PHONE_NUMBERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Excel uploads at least this big are stored under MEDIA_ROOT/imports/ and
+# processed by `python manage.py run_import_worker` instead of in the request.
+IMPORT_BACKGROUND_MIN_BYTES = 512 * 1024
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
\ No newline at end of file
@@ -1,7 +1,9 @@
 # students/admin.py
 
 from django.contrib import admin
-from .models import Student, Class, Subject, Examination, Mark, SchoolDocument
+from .models import Student, Class, Subject, Examination, Mark, ExamResult, ExamEnrollment, ResultSnapshot, ImportJob, GradingScheme, GradeBand, SchoolDocument
+from .grading import invalidate_grading_cache
+from .results import regrade_exam_results, publish_examination, unpublish_examination
 
 # Create a custom admin class for Student
 class StudentAdmin(admin.ModelAdmin):
@@ -13,8 +15,87 @@ class StudentAdmin(admin.ModelAdmin):
 admin.site.register(Student, StudentAdmin)
 admin.site.register(Class)
 admin.site.register(Subject)
-admin.site.register(Examination)
-admin.site.register(Mark)
+
+@admin.register(Mark)
+class MarkAdmin(admin.ModelAdmin):
+    # Marks of a published examination are locked (see students/signals.py)
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.examination.is_published:
+            return False
+        return super().has_delete_permission(request, obj)
+
+@admin.register(Examination)
+class ExaminationAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'date', 'academic_year', 'term', 'is_published', 'published_at')
+    list_filter = ('academic_year', 'term', 'is_published')
+    readonly_fields = ('is_published', 'published_at')
+    actions = ['publish_results', 'unpublish_results']
+
+    @admin.action(description="Publish results (freeze snapshots and lock marks)")
+    def publish_results(self, request, queryset):
+        for examination in queryset:
+            publish_examination(examination)
+        self.message_user(request, f"Published {queryset.count()} examination(s).")
+
+    @admin.action(description="Unpublish results")
+    def unpublish_results(self, request, queryset):
+        for examination in queryset:
+            unpublish_examination(examination)
+        self.message_user(request, f"Unpublished {queryset.count()} examination(s).")
+
+@admin.register(ResultSnapshot)
+class ResultSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('examination', 'school_class', 'created_at')
+    list_filter = ('examination', 'school_class')
+    readonly_fields = ('examination', 'school_class', 'data', 'created_at')
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'original_name', 'examination', 'created_by', 'processed_rows', 'failed_rows', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('total_rows', 'processed_rows', 'failed_rows', 'summary', 'errors', 'created_at', 'started_at', 'finished_at')
+    actions = ['requeue_jobs']
+
+    @admin.action(description="Queue again (e.g. after the worker was stopped mid-import)")
+    def requeue_jobs(self, request, queryset):
+        count = queryset.update(status='queued', processed_rows=0, failed_rows=0, summary='', errors=[], started_at=None, finished_at=None)
+        self.message_user(request, f"Queued {count} import job(s) again.")
+
+@admin.register(ExamResult)
+class ExamResultAdmin(admin.ModelAdmin):
+    list_display = ('student', 'examination', 'school_class', 'total_score', 'average_score', 'overall_grade', 'position')
+    list_filter = ('examination', 'school_class')
+    search_fields = ('student__prem_number', 'student__first_name', 'student__last_name')
+    readonly_fields = [f.name for f in ExamResult._meta.fields]
+
+@admin.register(ExamEnrollment)
+class ExamEnrollmentAdmin(admin.ModelAdmin):
+    list_display = ('student', 'examination', 'school_class', 'attempted')
+    list_filter = ('examination', 'school_class', 'attempted')
+    search_fields = ('student__prem_number', 'student__first_name', 'student__last_name')
+    readonly_fields = [f.name for f in ExamEnrollment._meta.fields]
+
+class GradeBandInline(admin.TabularInline):
+    model = GradeBand
+    extra = 0
+
+@admin.register(GradingScheme)
+class GradingSchemeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'academic_year', 'is_default')
+    list_filter = ('academic_year', 'is_default')
+    filter_horizontal = ('classes',)
+    inlines = [GradeBandInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Stored overall grades were computed with the old bands
+        invalidate_grading_cache()
+        regrade_exam_results()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_grading_cache()
+        regrade_exam_results()
 
 @admin.register(SchoolDocument)
 class SchoolDocumentAdmin(admin.ModelAdmin):
@@ -0,0 +1,149 @@
+# students/cache.py
+
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+# Cache alias used for computed results; see CACHES in settings.
+RESULTS_CACHE_ALIAS = 'results'
+
+GENERATION_KEY = 'results:generation'
+
+
+def _cache():
+    return caches[RESULTS_CACHE_ALIAS]
+
+
+def _version_key(examination_id, class_id):
+    return f'results:version:{examination_id}:{class_id}'
+
+
+# Version of everything cached for an examination across all its classes
+EXAM_WIDE = 'all'
+
+
+def _student_version_key(student_id):
+    return f'results:student-version:{student_id}'
+
+
+def _fresh_version():
+    # A version that has never been used before, so an evicted counter can't
+    # bring back entries cached under an older number.
+    return time.time_ns()
+
+
+def _get_version(key):
+    return _cache().get_or_set(key, _fresh_version, timeout=None)
+
+
+def _bump(key):
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _fresh_version(), timeout=None)
+
+
+def bump_results_version(examination_id, class_id):
+    """
+    Invalidates every cached result for one (examination, class) pair, and
+    the examination-wide results (cached_exam_results) with it.
+    Inside a transaction the bump happens on commit, so a request can't cache
+    the old rows under the new version.
+    """
+    keys = [_version_key(examination_id, class_id), _version_key(examination_id, EXAM_WIDE)]
+    for key in keys:
+        _bump(key)
+    transaction.on_commit(lambda: [_bump(key) for key in keys])
+
+
+def bump_student_versions(student_ids):
+    """
+    Invalidates the per-student cached results (cached_student_results) of
+    the given students, in one cache round trip; on commit inside a
+    transaction, like bump_results_version.
+    """
+    keys = [_student_version_key(student_id) for student_id in student_ids]
+    if not keys:
+        return
+
+    def bump():
+        _cache().set_many(dict.fromkeys(keys, _fresh_version()), timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def bump_results_generation():
+    """
+    Invalidates every cached result. Used for changes that aren't tied to one
+    examination and class (students, subjects, grading schemes).
+    """
+    _bump(GENERATION_KEY)
+    transaction.on_commit(lambda: _bump(GENERATION_KEY))
+
+
+def cached_results(name, examination_id, class_id, compute, timeout=DEFAULT_TIMEOUT):
+    """
+    Returns compute() from the results cache, keyed by `name` and the current
+    version of the (examination, class) pair.
+    """
+    generation = _get_version(GENERATION_KEY)
+    version = _get_version(_version_key(examination_id, class_id))
+    key = f'results:{name}:{examination_id}:{class_id}:{generation}:{version}'
+
+    value = _cache().get(key)
+    if value is None:
+        value = compute()
+        _cache().set(key, value, timeout)
+    return value
+
+
+def _cached_many(name, ids, version_key, compute):
+    """
+    {id: value} for many cache entries, each versioned by its own version
+    key. Versions and values are read with get_many, and compute(missing_ids)
+    runs once for all the ids that aren't cached, returning {id: value}.
+    """
+    cache = _cache()
+    generation = _get_version(GENERATION_KEY)
+    version_keys = {item_id: version_key(item_id) for item_id in ids}
+    versions = cache.get_many(version_keys.values())
+    new_versions = {key: _fresh_version() for key in version_keys.values() if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+        versions.update(new_versions)
+
+    keys = {
+        item_id: f'results:{name}:{item_id}:{generation}:{versions[key]}'
+        for item_id, key in version_keys.items()
+    }
+    cached = cache.get_many(keys.values())
+    values = {item_id: cached[key] for item_id, key in keys.items() if key in cached}
+
+    missing = [item_id for item_id in keys if item_id not in values]
+    if missing:
+        computed = compute(missing)
+        cache.set_many({keys[item_id]: value for item_id, value in computed.items()})
+        values.update(computed)
+    return values
+
+
+def cached_exam_results(name, examination_ids, compute):
+    """
+    Per-examination results covering all classes, for several examinations
+    at once: {examination_id: value}. compute(missing_ids) is called only for
+    the examinations that aren't cached.
+    """
+    return _cached_many(name, examination_ids, lambda examination_id: _version_key(examination_id, EXAM_WIDE), compute)
+
+
+def cached_student_results(name, student_ids, compute):
+    """
+    Per-student results, e.g. trends across examinations: {student_id: value}.
+    compute(missing_ids) is called once for all the students that aren't
+    cached. Invalidated by bump_student_versions().
+    """
+    return _cached_many(name, student_ids, _student_version_key, compute)
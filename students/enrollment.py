@@ -0,0 +1,144 @@
+# students/enrollment.py
+
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Class, ExamEnrollment, Examination, Mark, Student
+
+
+def _attempted(student_ref, examination_ref):
+    return Exists(Mark.objects.filter(student_id=student_ref, examination_id=examination_ref, score__gt=0))
+
+
+def sitting_class_ids(examination):
+    """The classes sitting an examination: classes_taking_exam, or every class if none are set."""
+    class_ids = set(examination.classes_taking_exam.values_list('pk', flat=True))
+    return class_ids or set(Class.objects.values_list('pk', flat=True))
+
+
+def sync_exam_enrollment(examination, classes=None):
+    """
+    Enrolls, in one INSERT, every student on the roster of a class sitting
+    `examination` who isn't enrolled yet, with `attempted` taken from their
+    marks. Syncing all classes also drops the unattempted enrollments of
+    classes no longer sitting it. Pass `classes` to sync only those rosters.
+    Returns the number of students enrolled.
+    """
+    class_ids = sitting_class_ids(examination)
+    if classes is None:
+        ExamEnrollment.objects.filter(examination=examination, attempted=False).exclude(
+            school_class_id__in=class_ids
+        ).delete()
+    else:
+        class_ids &= {getattr(class_obj, 'pk', class_obj) for class_obj in classes}
+
+    students = Student.objects.filter(current_class_id__in=class_ids).exclude(
+        exam_enrollments__examination=examination
+    ).annotate(
+        has_attempted=_attempted(OuterRef('pk'), examination.pk),
+    ).order_by().values_list('pk', 'current_class_id', 'has_attempted')
+    created = ExamEnrollment.objects.bulk_create(
+        [
+            ExamEnrollment(examination=examination, student_id=student_id, school_class_id=class_id, attempted=attempted)
+            for student_id, class_id, attempted in students
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return len(created)
+
+
+def enroll_students(students):
+    """
+    Enrolls `students` (a Student queryset) in every unpublished examination
+    their current class sits, for students created, imported or promoted
+    after the examination's enrollment was synced. Students already enrolled
+    in an examination keep their row. Runs a fixed number of queries however
+    many students and examinations there are. Returns the number of students
+    enrolled.
+    """
+    current_classes = dict(students.exclude(current_class=None).order_by().values_list('pk', 'current_class_id'))
+    if not current_classes:
+        return 0
+
+    open_exams = Examination.objects.filter(is_published=False)
+    sitting = {exam_id: set() for exam_id in open_exams.values_list('pk', flat=True)}
+    for exam_id, class_id in Examination.classes_taking_exam.through.objects.filter(
+        examination__is_published=False,
+    ).values_list('examination_id', 'class_id'):
+        sitting[exam_id].add(class_id)
+    # No classes_taking_exam means every class sits it (see sitting_class_ids)
+    wanted = {
+        (exam_id, student_id): class_id
+        for student_id, class_id in current_classes.items()
+        for exam_id, class_ids in sitting.items()
+        if not class_ids or class_id in class_ids
+    }
+    if not wanted:
+        return 0
+
+    enrolled = set(ExamEnrollment.objects.filter(
+        student_id__in=current_classes, examination_id__in=sitting,
+    ).values_list('examination_id', 'student_id'))
+    attempted = set(Mark.objects.filter(
+        student_id__in=current_classes, examination_id__in=sitting, score__gt=0,
+    ).order_by().values_list('examination_id', 'student_id').distinct())
+    created = ExamEnrollment.objects.bulk_create(
+        [
+            ExamEnrollment(
+                examination_id=exam_id, student_id=student_id, school_class_id=class_id,
+                attempted=(exam_id, student_id) in attempted,
+            )
+            for (exam_id, student_id), class_id in wanted.items()
+            if (exam_id, student_id) not in enrolled
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    return len(created)
+
+
+def not_attempted_enrollments(examination, class_obj=None):
+    """
+    Enrollments of active students with no mark above zero in `examination`,
+    for the whole school or one class, found with a single NOT EXISTS
+    anti-join against the marks table. Ordered by class, then student name.
+    """
+    enrollments = ExamEnrollment.objects.filter(examination=examination, student__status='Active').filter(
+        ~_attempted(OuterRef('student_id'), OuterRef('examination_id'))
+    )
+    if class_obj is not None:
+        enrollments = enrollments.filter(school_class=class_obj)
+    return enrollments.select_related('student', 'school_class').order_by(
+        'school_class__name', 'student__first_name', 'student__last_name',
+    )
+
+
+def refresh_attempts(examination_id, student_ids=(), class_id=None):
+    """
+    Re-derives `attempted` from the marks table in one UPDATE for the given
+    students' enrollments in an examination (and, with `class_id`, for every
+    enrollment of that class). Students with a mark above zero who weren't
+    enrolled, e.g. because they joined the class later, are enrolled.
+    """
+    student_ids = set(student_ids)
+    scope = Q(student_id__in=student_ids)
+    if class_id is not None:
+        scope |= Q(school_class_id=class_id)
+    ExamEnrollment.objects.filter(scope, examination_id=examination_id).update(
+        attempted=_attempted(OuterRef('student_id'), OuterRef('examination_id')),
+    )
+
+    if not student_ids:
+        return
+    unenrolled = Mark.objects.filter(
+        examination_id=examination_id, student_id__in=student_ids, score__gt=0,
+    ).exclude(
+        student__exam_enrollments__examination_id=examination_id
+    ).order_by().values_list('student_id', 'school_class_id').distinct()
+    ExamEnrollment.objects.bulk_create(
+        [
+            ExamEnrollment(examination_id=examination_id, student_id=student_id, school_class_id=school_class_id, attempted=True)
+            for student_id, school_class_id in dict(unenrolled).items()
+        ],
+        ignore_conflicts=True,
+    )
@@ -0,0 +1,209 @@
+# students/exports.py
+
+import csv
+import zipfile
+
+import openpyxl
+from django.utils.text import slugify
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Protection
+from openpyxl.utils import get_column_letter
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from .models import Class, Examination, Mark, Student
+
+# Student columns of the mark template; the importer ignores them (WIDE_INFO_COLUMNS)
+TEMPLATE_STUDENT_HEADERS = ['Prem_Number', 'First_Name', 'Middle_Name', 'Last_Name']
+TEMPLATE_STUDENT_FIELDS = ['prem_number', 'first_name', 'middle_name', 'last_name']
+
+_HEADER_FONT = Font(bold=True)
+_HEADER_FILL = PatternFill('solid', start_color='D9D9D9')
+_LOCKED_FILL = PatternFill('solid', start_color='F2F2F2')
+_UNLOCKED = Protection(locked=False)
+
+
+def template_filename(examination, class_obj, extension='xlsx'):
+    return f"marks_{slugify(examination.name)}_{examination.academic_year}_{slugify(class_obj.name)}.{extension}"
+
+
+def write_mark_template(target, examination, class_obj, students, subjects, scores):
+    """
+    Writes the wide-format mark sheet for one class to `target` (a path or
+    file object) using openpyxl's write-only mode, so rows are streamed to
+    disk rather than held in memory.
+
+    `students` are Student objects in row order, `subjects` the score columns
+    and `scores` {(student_id, subject_id): score} for the existing marks.
+    Student columns are locked and shaded and the sheet is protected (without
+    a password), so only score cells can be edited; for a published
+    examination every cell is locked. The file round-trips through
+    import_marks().
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=slugify(class_obj.name)[:31] or 'Marks')
+    sheet.freeze_panes = 'B2'
+    sheet.protection.sheet = True
+    for index, width in enumerate([16, 16, 16, 16] + [10] * len(subjects), start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+
+    if subjects and students and not examination.is_published:
+        first_score, last_score = len(TEMPLATE_STUDENT_HEADERS) + 1, len(TEMPLATE_STUDENT_HEADERS) + len(subjects)
+        validation = DataValidation(
+            type='whole', operator='between', formula1='0', formula2='100', allow_blank=True,
+            showErrorMessage=True, errorTitle='Invalid score', error='Scores are whole numbers from 0 to 100.',
+        )
+        validation.add(f"{get_column_letter(first_score)}2:{get_column_letter(last_score)}{len(students) + 1}")
+        sheet.data_validations.append(validation)
+
+    def cell(value, header=False, editable=False):
+        c = WriteOnlyCell(sheet, value=value)
+        if header:
+            c.font = _HEADER_FONT
+            c.fill = _HEADER_FILL
+        elif editable:
+            c.protection = _UNLOCKED
+        else:
+            c.fill = _LOCKED_FILL
+        return c
+
+    sheet.append([cell(name, header=True) for name in TEMPLATE_STUDENT_HEADERS + [subject.code for subject in subjects]])
+    editable = not examination.is_published
+    for student in students:
+        sheet.append(
+            [cell(getattr(student, field)) for field in TEMPLATE_STUDENT_FIELDS]
+            + [cell(scores.get((student.pk, subject.pk)), editable=editable) for subject in subjects]
+        )
+    workbook.save(target)
+
+
+def _class_roster(class_ids):
+    """{class_id: [Student, ...]} in mark entry order, in one query."""
+    rosters = {class_id: [] for class_id in class_ids}
+    students = Student.objects.filter(current_class_id__in=class_ids).order_by('first_name', 'last_name').only(
+        'pk', 'current_class_id', *TEMPLATE_STUDENT_FIELDS,
+    )
+    for student in students:
+        rosters[student.current_class_id].append(student)
+    return rosters
+
+
+def _exam_scores(examination, student_ids=None):
+    marks = Mark.objects.filter(examination=examination).order_by()
+    if student_ids is not None:
+        marks = marks.filter(student_id__in=student_ids)
+    return {
+        (student_id, subject_id): score
+        for student_id, subject_id, score in marks.values_list('student_id', 'subject_id', 'score')
+    }
+
+
+def mark_template(target, examination, class_obj):
+    """The pre-filled mark template for one class (see write_mark_template)."""
+    students = _class_roster([class_obj.pk])[class_obj.pk]
+    subjects = list(class_obj.subjects.order_by('name'))
+    scores = _exam_scores(examination, [student.pk for student in students])
+    write_mark_template(target, examination, class_obj, students, subjects, scores)
+
+
+def mark_template_set(target, examination):
+    """
+    A zip of mark templates for every class with students and subjects. All
+    rosters, subjects and existing marks are loaded in three queries.
+    Returns the number of templates written.
+    """
+    classes = list(Class.objects.prefetch_related('subjects').order_by('year', 'name'))
+    rosters = _class_roster([class_obj.pk for class_obj in classes])
+    scores = _exam_scores(examination)
+    written = 0
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for class_obj in classes:
+            subjects = sorted(class_obj.subjects.all(), key=lambda subject: subject.name)
+            if not rosters[class_obj.pk] or not subjects:
+                continue
+            with archive.open(template_filename(examination, class_obj), 'w') as member:
+                write_mark_template(member, examination, class_obj, rosters[class_obj.pk], subjects, scores)
+            written += 1
+    return written
+
+
+# Mark list export: (header, values_list field) pairs, one row per mark
+MARK_EXPORT_COLUMNS = [
+    ('Academic Year', 'examination__academic_year'),
+    ('Term', 'examination__term'),
+    ('Examination', 'examination__name'),
+    ('Class', 'school_class__name'),
+    ('Prem Number', 'student__prem_number'),
+    ('First Name', 'student__first_name'),
+    ('Middle Name', 'student__middle_name'),
+    ('Last Name', 'student__last_name'),
+    ('Subject Code', 'subject__code'),
+    ('Subject', 'subject__name'),
+    ('Score', 'score'),
+]
+MARK_EXPORT_CHUNK_SIZE = 2000
+
+
+def mark_export_rows(marks):
+    """
+    The header and then one tuple per mark of `marks` (a filtered, ordered
+    Mark queryset). Rows come from a single values_list query read in chunks,
+    so memory stays flat however many marks are exported.
+    """
+    terms = dict(Examination.TERM_CHOICES)
+    term_index = [field for _, field in MARK_EXPORT_COLUMNS].index('examination__term')
+    yield [header for header, _ in MARK_EXPORT_COLUMNS]
+    rows = marks.values_list(*[field for _, field in MARK_EXPORT_COLUMNS])
+    for row in rows.iterator(chunk_size=MARK_EXPORT_CHUNK_SIZE):
+        row = list(row)
+        row[term_index] = terms.get(row[term_index], row[term_index])
+        yield row
+
+
+class _Echo:
+    """A file-like object whose write() returns the line, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def mark_export_csv(marks):
+    """CSV lines for StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    # Byte order mark so Excel opens the file as UTF-8
+    yield '\ufeff'
+    for row in mark_export_rows(marks):
+        yield writer.writerow(row)
+
+
+NOT_ATTEMPTED_COLUMNS = ['Class', 'Prem Number', 'First Name', 'Middle Name', 'Last Name', 'Gender', 'Status']
+
+
+def not_attempted_csv(enrollments):
+    """CSV lines of the not-attempted report (see enrollment.not_attempted_enrollments) for StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    yield '\ufeff'
+    yield writer.writerow(NOT_ATTEMPTED_COLUMNS)
+    for enrollment in enrollments.iterator(chunk_size=MARK_EXPORT_CHUNK_SIZE):
+        student = enrollment.student
+        yield writer.writerow([
+            enrollment.school_class.name if enrollment.school_class else '',
+            student.prem_number, student.first_name, student.middle_name or '', student.last_name,
+            student.get_gender_display(), student.get_status_display(),
+        ])
+
+
+def mark_export_xlsx(target, marks):
+    """Writes the export to `target` with openpyxl's write-only mode."""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title='Marks')
+    sheet.freeze_panes = 'A2'
+    rows = mark_export_rows(marks)
+    header = []
+    for name in next(rows):
+        cell = WriteOnlyCell(sheet, value=name)
+        cell.font = _HEADER_FONT
+        header.append(cell)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(target)
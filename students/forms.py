@@ -73,12 +73,37 @@ class MarkEntrySelectionForm(forms.Form):
         label="Select Subject"
     )
 
+UPLOAD_MODE_CHOICES = [
+    ('save', 'Save the valid rows and skip the rest'),
+    ('if_clean', 'Save only if every row is valid'),
+    ('dry_run', 'Check the file only (nothing is saved)'),
+]
+
 class MarkExcelUploadForm(forms.Form):
     excel_file = forms.FileField(
         label="Select Excel File (.xlsx)",
-        help_text="Upload an Excel file with columns: prem_Number, Subject_Code, Score"
+        help_text="Upload an Excel file with columns: prem_Number, Subject_Code, Score, or with Prem_Number and one column per subject code"
+    )
+    upload_mode = forms.ChoiceField(
+        label="When some rows have problems",
+        choices=UPLOAD_MODE_CHOICES,
+        initial='save',
+        required=False,
+        widget=forms.RadioSelect(attrs={'class': 'form-check-input'}),
     )
 
+class MarkScoreForm(forms.Form):
+    """One student's score on the mark entry sheet. An empty score means no mark."""
+    student_id = forms.IntegerField(widget=forms.HiddenInput())
+    score = forms.IntegerField(
+        min_value=0,
+        max_value=100,
+        required=False,
+        widget=forms.NumberInput()
+    )
+
+MarkScoreFormSet = forms.formset_factory(MarkScoreForm, extra=0)
+
 class MarkEntrySelectionForm(forms.Form):
     examination = forms.ModelChoiceField(
         queryset=Examination.objects.all().order_by('-academic_year', 'term', 'date', 'name'),
@@ -145,6 +170,13 @@ class StudentExcelUploadForm(forms.Form):
         help_text='Upload an Excel file (.xlsx or .xls) with student data.',
         widget=forms.ClearableFileInput(attrs={'class': 'form-control'})
     )
+    upload_mode = forms.ChoiceField(
+        label="When some rows have problems",
+        choices=UPLOAD_MODE_CHOICES,
+        initial='save',
+        required=False,
+        widget=forms.RadioSelect(attrs={'class': 'form-check-input'}),
+    )
 
 class SchoolDocumentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,126 @@
+# students/grading.py
+
+import threading
+
+from django.db.models import Case, Value, When
+
+from .models import GradingScheme
+
+# Used when no GradingScheme has been saved yet. Lowest score for each grade, best grade first.
+DEFAULT_BANDS = [('A', 81, True), ('B', 61, True), ('C', 41, True), ('D', 21, True), ('F', 0, False)]
+
+MAX_SCORE = 100
+
+_lock = threading.Lock()
+_schemes = None # Loaded on first use, cleared by invalidate_grading_cache()
+
+
+class CompiledScheme:
+    """
+    A grading scheme compiled into a 0-100 score -> grade lookup table.
+    Grading a score is a list index instead of a chain of comparisons.
+    """
+
+    def __init__(self, bands, name='Default', pk=None):
+        # bands: [(grade, min_score, is_pass), ...]
+        self.pk = pk
+        self.name = name
+        self.bands = sorted(bands, key=lambda band: band[1], reverse=True)
+        self.grades = [grade for grade, _, _ in self.bands]
+        self.pass_grades = frozenset(grade for grade, _, is_pass in self.bands if is_pass)
+        self.lowest_grade = self.bands[-1][0]
+
+        table = [self.lowest_grade] * (MAX_SCORE + 1)
+        for score in range(MAX_SCORE + 1):
+            for grade, min_score, _ in self.bands:
+                if score >= min_score:
+                    table[score] = grade
+                    break
+        self.table = tuple(table)
+
+    def grade(self, score):
+        if score is None:
+            return "N/A"
+        # Thresholds are whole numbers, so flooring an average keeps it in the right band.
+        index = int(score)
+        if index < 0:
+            return self.lowest_grade
+        if index > MAX_SCORE:
+            index = MAX_SCORE
+        return self.table[index]
+
+    def is_pass(self, grade):
+        return grade in self.pass_grades
+
+    def case_expression(self, field='score'):
+        """CASE expression mapping `field` to this scheme's grade letters in SQL."""
+        whens = [
+            When(**{f'{field}__gte': min_score, 'then': Value(grade)})
+            for grade, min_score, _ in self.bands[:-1]
+        ]
+        return Case(*whens, default=Value(self.lowest_grade))
+
+
+DEFAULT_SCHEME = CompiledScheme(DEFAULT_BANDS)
+
+
+def _load_schemes():
+    schemes = []
+    for scheme in GradingScheme.objects.prefetch_related('bands', 'classes'):
+        bands = [(band.grade, band.min_score, band.is_pass) for band in scheme.bands.all()]
+        if not bands:
+            continue
+        schemes.append({
+            'academic_year': scheme.academic_year,
+            'class_ids': {class_obj.pk for class_obj in scheme.classes.all()},
+            'is_default': scheme.is_default,
+            'compiled': CompiledScheme(bands, name=scheme.name, pk=scheme.pk),
+        })
+    return schemes
+
+
+def invalidate_grading_cache():
+    global _schemes
+    with _lock:
+        _schemes = None
+
+
+def get_grading_scheme(academic_year=None, class_id=None):
+    """
+    Picks the compiled scheme for an academic year and class.
+
+    A scheme restricted to the class beats one restricted to the year, which
+    beats the scheme marked as default. Schemes restricted to a different year
+    or to other classes are never used.
+    """
+    global _schemes
+    schemes = _schemes
+    if schemes is None:
+        with _lock:
+            if _schemes is None:
+                _schemes = _load_schemes()
+            schemes = _schemes
+
+    best = None
+    best_key = None
+    for scheme in schemes:
+        if scheme['academic_year'] is not None and scheme['academic_year'] != academic_year:
+            continue
+        if scheme['class_ids'] and class_id not in scheme['class_ids']:
+            continue
+        key = (bool(scheme['class_ids']), scheme['academic_year'] is not None, scheme['is_default'])
+        if best_key is None or key > best_key:
+            best, best_key = scheme['compiled'], key
+    return best or DEFAULT_SCHEME
+
+
+def scheme_for(examination=None, class_obj=None):
+    """Convenience wrapper taking model instances (either may be None)."""
+    academic_year = examination.academic_year if examination is not None else None
+    class_id = getattr(class_obj, 'pk', class_obj)
+    return get_grading_scheme(academic_year, class_id)
+
+
+def get_grade(score):
+    """Grades a score with the default scheme."""
+    return get_grading_scheme().grade(score)
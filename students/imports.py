@@ -0,0 +1,709 @@
+# students/imports.py
+
+import datetime
+import uuid
+from contextlib import nullcontext
+
+import openpyxl
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .cache import bump_results_generation
+from .enrollment import enroll_students
+from .marks import reject_published, save_scores
+from .models import Class, Student, Subject
+from .results import deferred_result_refresh
+
+# Marks are written in bulk every this many rows.
+MARK_CHUNK_SIZE = 1000
+
+MARK_COLUMNS = ['prem_number', 'subject_code', 'score']
+
+# Columns of a wide mark sheet that are not subject codes
+WIDE_INFO_COLUMNS = {
+    'no', '#', 's/n', 'sn', 'name', 'student_name', 'full_name',
+    'first_name', 'middle_name', 'last_name', 'gender', 'class', 'class_name',
+}
+
+# Students are diffed and written in batches of this many rows.
+STUDENT_CHUNK_SIZE = 500
+
+# Accepted spellings of the roster columns (after normalize_header)
+STUDENT_COLUMN_ALIASES = {
+    'current_class_name': 'class_name',
+    'class': 'class_name',
+    'current_class_year': 'class_year',
+    'year': 'class_year',
+    'dob': 'date_of_birth',
+    'prem_no': 'prem_number',
+}
+STUDENT_COLUMNS = ['prem_number', 'first_name', 'last_name', 'class_name']
+STUDENT_FIELDS = ['first_name', 'middle_name', 'last_name', 'date_of_birth', 'gender', 'current_class_id']
+
+DATE_FORMATS = [
+    '%Y-%m-%d',  # 2000-01-15
+    '%d-%m-%Y',  # 15-01-2000
+    '%m/%d/%Y',  # 01/15/2000
+    '%d/%m/%Y',  # 15/01/2000
+    '%Y/%m/%d',  # 2000/01/15
+    '%b %d, %Y',  # Jun 18, 2009
+    '%B %d, %Y',  # June 18, 2009
+]
+GENDERS = {'M': 'M', 'MALE': 'M', 'F': 'F', 'FEMALE': 'F', 'O': 'O', 'OTHER': 'O'}
+
+
+class ImportFormatError(Exception):
+    """The uploaded file can't be imported at all (wrong type, missing columns)."""
+
+
+class ImportReport:
+    """Counts and per-row errors collected while importing a sheet."""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.saved = 0
+        self.skipped = 0
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.errors = []
+
+    def add_error(self, row, message, column=None, value=None):
+        self.errors.append({'row': row, 'column': column, 'value': value, 'message': message})
+
+    @property
+    def failed(self):
+        return len({error['row'] for error in self.errors})
+
+    def summary(self):
+        return (
+            f"{self.saved} rows imported ({self.created} added, {self.updated} updated), "
+            f"{self.failed} rows rejected, {self.skipped} blank rows skipped."
+        )
+
+    def check_summary(self):
+        """Summary of a dry run (validate_marks / validate_students)."""
+        return (
+            f"{self.total_rows} rows checked: {self.total_rows - self.failed} valid, "
+            f"{self.failed} with problems, {self.skipped} blank rows skipped."
+        )
+
+
+def normalize_header(value):
+    return str(value).strip().replace(' ', '_').lower() if value is not None else None
+
+
+def cell_text(value):
+    """A cell as stripped text; whole-number floats lose their '.0' (Excel stores prem numbers as numbers)."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_score(value):
+    """Returns (score, error message)."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None, "Score is empty."
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None, f"Score must be a whole number, found '{value}'."
+    if not number.is_integer():
+        return None, f"Score must be a whole number, found '{value}'."
+    score = int(number)
+    if not 0 <= score <= 100:
+        return None, f"Score must be between 0 and 100, found {value}."
+    return score, None
+
+
+def student_lookup():
+    """{prem_number: student_id} for every student, in one query."""
+    return dict(Student.objects.values_list('prem_number', 'pk'))
+
+
+def subject_lookup():
+    """{SUBJECT_CODE: subject_id} for every subject, in one query."""
+    return {code.strip().upper(): pk for code, pk in Subject.objects.values_list('code', 'pk')}
+
+
+def parse_date(value):
+    """Returns (date, error message) for a date cell (a real date or text in one of DATE_FORMATS)."""
+    if isinstance(value, datetime.datetime):
+        return value.date(), None
+    if isinstance(value, datetime.date):
+        return value, None
+    text = cell_text(value)
+    if not text:
+        return None, "Date of Birth is missing."
+    # The whole cell first (for 'Jun 18, 2009'), then without a trailing time
+    for candidate in (text, text.split(' ')[0]):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.datetime.strptime(candidate, fmt).date(), None
+            except ValueError:
+                continue
+    return None, f"Invalid date format for Date of Birth ('{text}'). Please use YYYY-MM-DD, DD-MM-YYYY, MM/DD/YYYY, or Month Day, Year format."
+
+
+class _PandasSheet:
+    """Old-style .xls files, which openpyxl can't read, loaded through pandas."""
+
+    def __init__(self, file):
+        frame = pd.read_excel(file, header=None, dtype=object)
+        self.rows = (
+            tuple(None if pd.isna(value) else value for value in row)
+            for row in frame.itertuples(index=False, name=None)
+        )
+
+    def close(self):
+        pass
+
+
+def open_sheet(file, aliases=None):
+    """
+    Opens the first sheet of an upload in streaming (read-only) mode.
+    Returns (workbook, header column map, row iterator of value tuples).
+    """
+    try:
+        if getattr(file, 'name', '').lower().endswith('.xls'):
+            workbook = _PandasSheet(file)
+            rows = workbook.rows
+        else:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+            rows = workbook.active.iter_rows(values_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"The file could not be read as an Excel workbook: {e}")
+    header = next(rows, None) or ()
+    aliases = aliases or {}
+    columns = {}
+    for index, name in enumerate(header):
+        name = normalize_header(name)
+        if name:
+            columns.setdefault(aliases.get(name, name), index)
+    return workbook, columns, rows
+
+
+def count_rows(file):
+    """
+    Data rows in an upload (header excluded) as recorded in the workbook's
+    dimensions, without reading the cells. None when the file doesn't say.
+    """
+    try:
+        if getattr(file, 'name', '').lower().endswith('.xls'):
+            return None
+        workbook = openpyxl.load_workbook(file, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+    except Exception:
+        return None
+    finally:
+        if hasattr(file, 'seek'):
+            file.seek(0)
+    return max(max_row - 1, 0) if max_row else None
+
+
+def require_columns(columns, required):
+    missing = [name for name in required if name not in columns]
+    if missing:
+        expected = ', '.join(name.title() for name in required)
+        raise ImportFormatError(
+            f"Missing required column(s): {', '.join(name.title() for name in missing)}. Expected at least: {expected}."
+        )
+
+
+def _value(row, index):
+    return row[index] if index < len(row) else None
+
+
+def is_wide_layout(columns):
+    """Long sheets have Subject_Code/Score columns; wide sheets have one column per subject code."""
+    return 'subject_code' not in columns and 'score' not in columns
+
+
+def wide_subject_columns(names, subjects):
+    """
+    For a wide mark sheet: {header name: subject_id} for every subject-code
+    column. Student details (WIDE_INFO_COLUMNS) are ignored; any other column
+    is an ImportFormatError, so a mistyped code isn't silently dropped.
+    """
+    by_header = {normalize_header(code): pk for code, pk in subjects.items()}
+    subject_columns = {}
+    unknown = []
+    for name in names:
+        if name == 'prem_number' or name in WIDE_INFO_COLUMNS:
+            continue
+        if name in by_header:
+            subject_columns[name] = by_header[name]
+        else:
+            unknown.append(name.upper())
+    if unknown:
+        raise ImportFormatError(f"Unknown subject code column(s): {', '.join(unknown)}.")
+    if not subject_columns:
+        raise ImportFormatError(
+            "No subject columns found. Use either Prem_Number, Subject_Code and Score columns, "
+            "or Prem_Number followed by one column per subject code."
+        )
+    return subject_columns
+
+
+def _long_mark_reader(columns, students, subjects):
+    """Reads one (student, subject, score) row; returns [((student_id, subject_id), score)]."""
+    prem_col = columns['prem_number']
+    subject_col = columns['subject_code']
+    score_col = columns['score']
+
+    def read(row_number, row, report):
+        prem_number = cell_text(_value(row, prem_col))
+        subject_code = cell_text(_value(row, subject_col))
+        if not prem_number or not subject_code:
+            report.add_error(row_number, "Prem Number or Subject Code is empty.")
+            return []
+
+        student_id = students.get(prem_number)
+        if student_id is None:
+            report.add_error(row_number, f"Student with prem number '{prem_number}' not found.", 'Prem_Number', prem_number)
+            return []
+        subject_id = subjects.get(subject_code.upper())
+        if subject_id is None:
+            report.add_error(row_number, f"Subject with code '{subject_code}' not found.", 'Subject_Code', subject_code)
+            return []
+        score, error = parse_score(_value(row, score_col))
+        if error:
+            report.add_error(row_number, error, 'Score', _value(row, score_col))
+            return []
+        return [((student_id, subject_id), score)]
+
+    return read
+
+
+def _wide_mark_reader(columns, students, subjects):
+    """
+    Reads one student row with a score per subject column. Empty cells are
+    skipped (no mark for that subject); a bad cell is reported without
+    rejecting the student's other scores.
+    """
+    prem_col = columns['prem_number']
+    subject_columns = [
+        (columns[name], name.upper(), subject_id)
+        for name, subject_id in wide_subject_columns(columns, subjects).items()
+    ]
+
+    def read(row_number, row, report):
+        prem_number = cell_text(_value(row, prem_col))
+        if not prem_number:
+            report.add_error(row_number, "Prem Number is empty.", 'Prem_Number')
+            return []
+        student_id = students.get(prem_number)
+        if student_id is None:
+            report.add_error(row_number, f"Student with prem number '{prem_number}' not found.", 'Prem_Number', prem_number)
+            return []
+
+        scores = []
+        for index, code, subject_id in subject_columns:
+            value = _value(row, index)
+            if not cell_text(value):
+                continue
+            score, error = parse_score(value)
+            if error:
+                report.add_error(row_number, error, code, value)
+                continue
+            scores.append(((student_id, subject_id), score))
+        return scores
+
+    return read
+
+
+def import_marks(file, examination, chunk_size=MARK_CHUNK_SIZE, progress=None, atomic=True):
+    """
+    Imports a mark sheet into `examination`. Two layouts are accepted:
+
+    - long: one row per student and subject (Prem_Number, Subject_Code, Score);
+    - wide: one row per student, with a column per subject code (as produced
+      by the class mark template). Empty cells are left alone.
+
+    The sheet is streamed, prem numbers and subject codes are resolved through
+    lookups loaded once, and valid scores are written with one bulk upsert
+    per `chunk_size` marks inside one transaction. Invalid rows/cells are
+    skipped and recorded in the returned ImportReport. `progress(report)` is
+    called after every chunk.
+
+    With atomic=False every chunk commits on its own, so progress written to
+    the database from `progress` is visible to other connections (used by the
+    background import worker).
+
+    Raises ValidationError, before reading the file, if the examination is
+    published.
+    """
+    reject_published([examination.pk])
+    workbook, columns, rows = open_sheet(file)
+    try:
+        students = student_lookup()
+        subjects = subject_lookup()
+        if is_wide_layout(columns):
+            require_columns(columns, ['prem_number'])
+            read_row = _wide_mark_reader(columns, students, subjects)
+        else:
+            require_columns(columns, MARK_COLUMNS)
+            read_row = _long_mark_reader(columns, students, subjects)
+
+        report = ImportReport()
+        chunk = {}
+
+        def flush():
+            created, updated, deleted = save_scores(examination, chunk)
+            report.created += created
+            report.updated += updated
+            chunk.clear()
+            if progress:
+                progress(report)
+
+        with deferred_result_refresh(), (transaction.atomic() if atomic else nullcontext()):
+            for row_number, row in enumerate(rows, start=2):
+                if not any(value is not None and str(value).strip() for value in row):
+                    report.skipped += 1
+                    continue
+                report.total_rows += 1
+
+                scores = read_row(row_number, row, report)
+                if not scores:
+                    continue
+                chunk.update(scores)
+                report.saved += 1
+                if len(chunk) >= chunk_size:
+                    flush()
+            flush()
+    finally:
+        workbook.close()
+    return report
+
+
+def class_lookup():
+    """
+    Every class in one query, as {(lowercase name, year): class_id} plus
+    {lowercase name: class_id} for sheets without a year column.
+    """
+    by_name_year = {}
+    by_name = {}
+    for pk, name, year in Class.objects.values_list('pk', 'name', 'year'):
+        by_name_year[(name.strip().lower(), year)] = pk
+        by_name[name.strip().lower()] = pk
+    return by_name_year, by_name
+
+
+def _student_row(row, columns, classes):
+    """Cleans one roster row; returns (values, [(column, value, message), ...])."""
+    def get(name):
+        index = columns.get(name)
+        return _value(row, index) if index is not None else None
+
+    errors = []
+    values = {
+        'prem_number': cell_text(get('prem_number')),
+        'first_name': cell_text(get('first_name')),
+        'last_name': cell_text(get('last_name')),
+    }
+    # A blank middle name keeps the stored one, like the other optional columns
+    if cell_text(get('middle_name')):
+        values['middle_name'] = cell_text(get('middle_name'))
+    for field in ('prem_number', 'first_name', 'last_name'):
+        if not values[field]:
+            errors.append((field.replace('_', ' ').title(), None, f"{field.replace('_', ' ').title()} is missing."))
+
+    class_name = cell_text(get('class_name'))
+    class_year = cell_text(get('class_year'))
+    by_name_year, by_name = classes
+    if not class_name:
+        errors.append(('Class Name', None, "Class Name is missing."))
+    elif class_year:
+        try:
+            values['current_class_id'] = by_name_year.get((class_name.lower(), int(class_year)))
+        except ValueError:
+            errors.append(('Class Year', class_year, f"Invalid Class Year ('{class_year}'). Must be an integer."))
+        else:
+            if values['current_class_id'] is None:
+                errors.append(('Class Name', class_name, f"Class '{class_name}' (Year {class_year}) not found. Please ensure the class exists."))
+    else:
+        values['current_class_id'] = by_name.get(class_name.lower())
+        if values['current_class_id'] is None:
+            errors.append(('Class Name', class_name, f"Class '{class_name}' not found. Please ensure the class exists."))
+
+    # Date of birth and gender may be left out to update existing students only
+    if 'date_of_birth' in columns and cell_text(get('date_of_birth')):
+        values['date_of_birth'], error = parse_date(get('date_of_birth'))
+        if error:
+            errors.append(('Date of Birth', cell_text(get('date_of_birth')), error))
+    if 'gender' in columns and cell_text(get('gender')):
+        gender = cell_text(get('gender')).upper()
+        values['gender'] = GENDERS.get(gender)
+        if values['gender'] is None:
+            errors.append(('Gender', gender, f"Invalid gender ('{gender}'). Use M, F, or O."))
+    return values, errors
+
+
+def import_students(file, chunk_size=STUDENT_CHUNK_SIZE, progress=None, atomic=True):
+    """
+    Imports a student roster, keyed by prem number. Every student upload
+    page goes through this.
+
+    Classes are resolved from one lookup query, each batch of rows is diffed
+    against the existing students with one query, and only new or changed
+    students are written with bulk_create/bulk_update. New students need a
+    date of birth and gender; for existing students blank cells keep the
+    stored value. `progress(report)` is called after every batch; `atomic`
+    works as for import_marks.
+    """
+    workbook, columns, rows = open_sheet(file, STUDENT_COLUMN_ALIASES)
+    try:
+        require_columns(columns, STUDENT_COLUMNS)
+        classes = class_lookup()
+        report = ImportReport()
+        chunk = {}
+
+        def flush():
+            existing = Student.objects.in_bulk(list(chunk), field_name='prem_number')
+            to_create = []
+            to_update = []
+            for prem_number, (row_number, values) in chunk.items():
+                student = existing.get(prem_number)
+                if student is None:
+                    missing = [label for field, label in (('date_of_birth', 'Date of Birth'), ('gender', 'Gender')) if not values.get(field)]
+                    if missing:
+                        report.add_error(row_number, f"{' and '.join(missing)} required for a new student.", missing[0])
+                        continue
+                    to_create.append(Student(**values))
+                    report.saved += 1
+                    continue
+                report.saved += 1
+                changed = False
+                for field in STUDENT_FIELDS:
+                    if field in values and getattr(student, field) != values[field]:
+                        setattr(student, field, values[field])
+                        changed = True
+                if changed:
+                    to_update.append(student)
+
+            with transaction.atomic():
+                Student.objects.bulk_create(to_create, batch_size=chunk_size)
+                Student.objects.bulk_update(to_update, STUDENT_FIELDS, batch_size=chunk_size)
+                # Bulk writes skip the Student signal that enrolls students in open examinations
+                enroll_students(Student.objects.filter(
+                    prem_number__in=[student.prem_number for student in to_create + to_update],
+                ))
+            report.created += len(to_create)
+            report.updated += len(to_update)
+            chunk.clear()
+            if progress:
+                progress(report)
+
+        with transaction.atomic() if atomic else nullcontext():
+            for row_number, row in enumerate(rows, start=2):
+                if not any(value is not None and str(value).strip() for value in row):
+                    report.skipped += 1
+                    continue
+                report.total_rows += 1
+
+                values, errors = _student_row(row, columns, classes)
+                if errors:
+                    for column, value, message in errors:
+                        report.add_error(row_number, message, column, value)
+                    continue
+
+                # A prem number repeated in the sheet keeps its last row
+                chunk[values['prem_number']] = (row_number, values)
+                if len(chunk) >= chunk_size:
+                    flush()
+            flush()
+    finally:
+        workbook.close()
+
+    if report.created or report.updated:
+        # Bulk writes skip the Student signals that invalidate cached results
+        bump_results_generation()
+    return report
+
+
+# Dry-run validation
+#
+# These check a whole sheet column by column with pandas, using the same
+# rules as import_marks/import_students, without writing anything. The
+# rejected rows (original cells plus a Problems column) can be stored for
+# download with store_rejected_rows().
+
+def read_sheet_frame(file, aliases=None):
+    """
+    The first sheet as a DataFrame of raw cell values (None for empty cells),
+    indexed by sheet row number, with blank rows dropped. Returns (frame,
+    {normalized header: original header}, number of blank rows).
+    """
+    try:
+        frame = pd.read_excel(file, dtype=object)
+    except Exception as e:
+        raise ImportFormatError(f"The file could not be read as an Excel workbook: {e}")
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame.index = frame.index + 2  # Row 1 is the header
+
+    aliases = aliases or {}
+    headers = {}
+    for original in frame.columns:
+        name = normalize_header(original)
+        if name and not str(original).startswith('Unnamed:'):
+            headers.setdefault(aliases.get(name, name), original)
+
+    blank = frame.apply(lambda column: column.map(cell_text) == '').all(axis=1)
+    return frame.loc[~blank], headers, int(blank.sum())
+
+
+def _text(frame, headers, name):
+    """A column as stripped text ('' when empty or when the column is missing)."""
+    if name not in headers:
+        return pd.Series('', index=frame.index, dtype=object)
+    return frame[headers[name]].map(cell_text)
+
+
+class _Checks:
+    """Collects failing-row masks and turns them into ImportReport errors."""
+
+    def __init__(self, frame, headers, blank_rows):
+        self.frame = frame
+        self.headers = headers
+        self.report = ImportReport()
+        self.report.total_rows = len(frame)
+        self.report.skipped = blank_rows
+
+    def add(self, mask, message, column=None, values=None):
+        """`message` may be a format string using {value}."""
+        for row in self.frame.index[mask.fillna(False).astype(bool)]:
+            value = values[row] if values is not None else None
+            self.report.add_error(int(row), message.format(value=value), column, value)
+
+    def finish(self):
+        """Returns (report, DataFrame of the failing rows with their problems)."""
+        self.report.errors.sort(key=lambda error: error['row'])
+        problems = {}
+        for error in self.report.errors:
+            problems.setdefault(error['row'], []).append(error['message'])
+        rejected = self.frame.loc[list(problems)].copy()
+        rejected.insert(0, 'Row', rejected.index)
+        rejected['Problems'] = ['; '.join(messages) for messages in problems.values()]
+        return self.report, rejected
+
+
+def validate_marks(file):
+    """Checks a long- or wide-format mark sheet without saving it; returns (report, rejected rows)."""
+    frame, headers, blank_rows = read_sheet_frame(file)
+    wide = is_wide_layout(headers)
+    require_columns(headers, ['prem_number'] if wide else MARK_COLUMNS)
+    subjects = subject_lookup()
+    checks = _Checks(frame, headers, blank_rows)
+    prem = _text(frame, headers, 'prem_number')
+
+    def check_scores(score_text, column, allow_empty):
+        score = pd.to_numeric(score_text, errors='coerce')
+        if not allow_empty:
+            checks.add(score_text == '', "Score is empty.", column)
+        not_whole = (score_text != '') & (score.isna() | (score % 1 != 0))
+        checks.add(not_whole, "Score must be a whole number, found '{value}'.", column, score_text)
+        checks.add(~not_whole & ((score < 0) | (score > 100)),
+                   "Score must be between 0 and 100, found {value}.", column, score_text)
+
+    if wide:
+        subject_columns = wide_subject_columns(headers, subjects)
+        checks.add(prem == '', "Prem Number is empty.", 'Prem_Number')
+        checks.add((prem != '') & ~prem.isin(set(student_lookup())),
+                   "Student with prem number '{value}' not found.", 'Prem_Number', prem)
+        for name in subject_columns:
+            check_scores(_text(frame, headers, name), name.upper(), allow_empty=True)
+        return checks.finish()
+
+    code_text = _text(frame, headers, 'subject_code')
+    code = code_text.str.upper()
+    checks.add((prem == '') | (code == ''), "Prem Number or Subject Code is empty.")
+    checks.add((prem != '') & ~prem.isin(set(student_lookup())),
+               "Student with prem number '{value}' not found.", 'Prem_Number', prem)
+    checks.add((code != '') & ~code.isin(set(subjects)),
+               "Subject with code '{value}' not found.", 'Subject_Code', code_text)
+    check_scores(_text(frame, headers, 'score'), 'Score', allow_empty=False)
+    return checks.finish()
+
+
+def parse_date_column(values):
+    """Parses a column of date cells in one pass per DATE_FORMATS entry; unparseable cells are NaT."""
+    is_date = values.map(lambda value: isinstance(value, (datetime.date, datetime.datetime)))
+    dates = pd.to_datetime(values.where(is_date), errors='coerce')
+    full_text = values.where(~is_date).map(cell_text)
+    # The whole cell first (for 'Jun 18, 2009'), then without a trailing time
+    for text in (full_text, full_text.str.split(' ').str[0]):
+        for fmt in DATE_FORMATS:
+            missing = dates.isna() & (text != '')
+            if not missing.any():
+                return dates
+            dates = dates.where(~missing, pd.to_datetime(text.where(missing), format=fmt, errors='coerce'))
+    return dates
+
+
+def validate_students(file):
+    """Checks a student roster without saving it; returns (report, rejected rows)."""
+    frame, headers, blank_rows = read_sheet_frame(file, STUDENT_COLUMN_ALIASES)
+    require_columns(headers, STUDENT_COLUMNS)
+    checks = _Checks(frame, headers, blank_rows)
+
+    for field in ('prem_number', 'first_name', 'last_name'):
+        label = field.replace('_', ' ').title()
+        checks.add(_text(frame, headers, field) == '', f"{label} is missing.", label)
+
+    class_name = _text(frame, headers, 'class_name')
+    class_year_text = _text(frame, headers, 'class_year')
+    class_year = pd.to_numeric(class_year_text, errors='coerce')
+    bad_year = (class_year_text != '') & (class_year.isna() | (class_year % 1 != 0))
+    by_name_year, by_name = class_lookup()
+
+    def class_exists(name, year_text, year, invalid_year):
+        if not name or invalid_year:
+            return True  # Reported by the missing-name / bad-year checks
+        if year_text:
+            return (name.lower(), int(year)) in by_name_year
+        return name.lower() in by_name
+
+    class_found = pd.Series(
+        [class_exists(*cells) for cells in zip(class_name, class_year_text, class_year, bad_year)],
+        index=frame.index, dtype=bool,
+    )
+    checks.add(class_name == '', "Class Name is missing.", 'Class Name')
+    checks.add(bad_year, "Invalid Class Year ('{value}'). Must be an integer.", 'Class Year', class_year_text)
+    class_label = pd.Series([
+        f"Class '{name}' (Year {year_text})" if year_text else f"Class '{name}'"
+        for name, year_text in zip(class_name, class_year_text)
+    ], index=frame.index, dtype=object)
+    checks.add(~class_found, "{value} not found. Please ensure the class exists.", 'Class Name', class_label)
+
+    dob_text = _text(frame, headers, 'date_of_birth')
+    if 'date_of_birth' in headers:
+        dates = parse_date_column(frame[headers['date_of_birth']])
+        checks.add((dob_text != '') & dates.isna(),
+                   "Invalid date format for Date of Birth ('{value}'). Please use YYYY-MM-DD, DD-MM-YYYY, MM/DD/YYYY, or Month Day, Year format.",
+                   'Date of Birth', dob_text)
+    gender = _text(frame, headers, 'gender').str.upper()
+    checks.add((gender != '') & ~gender.isin(set(GENDERS)), "Invalid gender ('{value}'). Use M, F, or O.", 'Gender', gender)
+
+    # New students (prem numbers not in the system yet) need both
+    new = ~_text(frame, headers, 'prem_number').isin(set(student_lookup()))
+    checks.add(new & (dob_text == ''), "Date of Birth required for a new student.", 'Date of Birth')
+    checks.add(new & (gender == ''), "Gender required for a new student.", 'Gender')
+    return checks.finish()
+
+
+def store_rejected_rows(rejected):
+    """Saves rejected rows as CSV under MEDIA_ROOT/imports/rejected/ and returns the stored name."""
+    name = f"imports/rejected/{uuid.uuid4().hex}.csv"
+    return default_storage.save(name, ContentFile(rejected.to_csv(index=False).encode('utf-8')))
+
+
+def load_rejected_rows(name):
+    with default_storage.open(name, 'rb') as stored:
+        return pd.read_csv(stored, dtype=str, keep_default_na=False)
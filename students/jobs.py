@@ -0,0 +1,108 @@
+# students/jobs.py
+
+import logging
+
+from django.utils import timezone
+
+from .imports import ImportFormatError, count_rows, import_marks, import_students
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Rejected rows kept on a finished job; the counters still cover all of them.
+MAX_STORED_ERRORS = 1000
+
+
+def enqueue_import(kind, upload, user=None, examination=None):
+    """Stores an uploaded file under MEDIA_ROOT/imports/ and queues it for the worker."""
+    return ImportJob.objects.create(
+        kind=kind,
+        file=upload,
+        original_name=upload.name,
+        examination=examination,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def claim_next_job():
+    """
+    Takes the oldest queued job, or returns None. The status check is part of
+    the UPDATE, so two workers can never claim the same job.
+    """
+    for job in ImportJob.objects.filter(status='queued').order_by('created_at')[:5]:
+        claimed = ImportJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_job(job):
+    """Runs one claimed job, recording progress on it as every chunk is written."""
+    def progress(report):
+        ImportJob.objects.filter(pk=job.pk).update(
+            processed_rows=report.total_rows,
+            failed_rows=report.failed,
+        )
+
+    def finish(status, summary, report=None):
+        job.status = status
+        job.summary = summary
+        job.finished_at = timezone.now()
+        if report is not None:
+            job.processed_rows = report.total_rows
+            job.failed_rows = report.failed
+            job.errors = report.errors[:MAX_STORED_ERRORS]
+        job.save()
+
+    try:
+        with job.file.storage.open(job.file.name, 'rb') as upload:
+            # Readers pick the format from the name, not the stored path
+            upload.name = job.original_name or job.file.name
+            job.total_rows = count_rows(upload)
+            ImportJob.objects.filter(pk=job.pk).update(total_rows=job.total_rows)
+
+            if job.kind == 'marks':
+                examination = job.examination
+                if examination is None:
+                    return finish('failed', "The examination for this upload no longer exists.")
+                if examination.is_published:
+                    return finish('failed', f"Results for '{examination}' are published, so its marks can't be changed.")
+                report = import_marks(upload, examination, progress=progress, atomic=False)
+            else:
+                report = import_students(upload, progress=progress, atomic=False)
+    except ImportFormatError as e:
+        return finish('failed', f"Invalid Excel file format. {e}")
+    except Exception as e:
+        logger.exception("Import job %s failed", job.pk)
+        return finish('failed', f"The import stopped with an unexpected error: {e}")
+    finish('done', report.summary(), report)
+
+
+def job_progress(job):
+    """The JSON-ready progress of a job, for the polling endpoint."""
+    eta_seconds = None
+    if job.status == 'running' and job.total_rows and job.processed_rows and job.started_at:
+        elapsed = (timezone.now() - job.started_at).total_seconds()
+        remaining = max(job.total_rows - job.processed_rows, 0)
+        eta_seconds = round(remaining * elapsed / job.processed_rows)
+    percent = None
+    if job.is_finished:
+        percent = 100
+    elif job.total_rows:
+        percent = min(round(100 * job.processed_rows / job.total_rows), 99)
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'failed_rows': job.failed_rows,
+        'percent': percent,
+        'eta_seconds': eta_seconds,
+        'summary': job.summary,
+        'finished': job.is_finished,
+    }
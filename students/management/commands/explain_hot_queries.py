@@ -0,0 +1,113 @@
+# students/management/commands/explain_hot_queries.py
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Sum
+
+from students.models import Class, Examination, Mark, Student
+
+# The composite indexes added for the reporting queries (migrations 0016 and 0017), as (model, fields)
+TUNED_INDEXES = [
+    (Mark, ['examination', 'school_class']),
+    (Mark, ['examination', 'student', 'score']),
+    (Mark, ['student', 'examination', 'score']),
+    (Student, ['current_class', 'status']),
+    (Student, ['status', 'graduation_year']),
+]
+
+
+def hot_queries(examination, class_obj, student):
+    """(label, queryset) for the query shapes the results and report pages run most."""
+    return [
+        ("Class mark matrix (results.class_mark_matrix)",
+         Mark.objects.filter(examination=examination, school_class=class_obj)
+         .order_by().values_list('student_id', 'subject_id', 'score')),
+        ("Class totals and ranks (results.ranked_mark_totals, reports performance data)",
+         Mark.objects.filter(examination=examination, school_class=class_obj, score__isnull=False)
+         .order_by().values('student_id').annotate(total=Sum('score'))),
+        ("Attempted students per class (reports attempt status)",
+         Mark.objects.filter(examination=examination, school_class=class_obj, score__gt=0)
+         .order_by().values('student').distinct()),
+        ("Subject averages (performance analysis)",
+         Mark.objects.filter(examination=examination).values('subject_id')
+         .annotate(avg_score=Avg('score')).order_by('subject_id')),
+        ("Class and subject averages (performance analysis, class comparison)",
+         Mark.objects.filter(examination=examination)
+         .values('school_class_id', 'subject_id')
+         .annotate(avg_score=Avg('score'), student_count=Count('student', distinct=True))
+         .order_by('school_class_id', 'subject_id')),
+        ("One student's marks in an examination (report card)",
+         Mark.objects.filter(student=student, examination=examination).select_related('subject')),
+        ("Student trend across examinations",
+         Mark.objects.filter(student=student).values('examination_id')
+         .annotate(average_score=Avg('score')).order_by('examination_id')),
+        ("Active students of a class (not attempted reports)",
+         Student.objects.filter(current_class=class_obj, status='Active').order_by('first_name')),
+        ("Graduates of a year (graduated students report)",
+         Student.objects.filter(status='Graduated', graduation_year=examination.academic_year)),
+        ("Graduation years (graduated students report)",
+         Student.objects.filter(status='Graduated').values_list('graduation_year', flat=True)
+         .distinct().order_by('-graduation_year')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the query plan of each hot results/report query with and without the "
+        "composite reporting indexes, to show which indexes the database actually uses."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help="Examination ID to plan against (default: the latest).")
+        parser.add_argument('--class', dest='class_id', type=int, help="Class ID to plan against (default: the first).")
+        parser.add_argument('--student', type=int, help="Student ID to plan against (default: the first).")
+
+    def handle(self, *args, **options):
+        examination = self._pick(Examination, options['exam'])
+        class_obj = self._pick(Class, options['class_id'])
+        student = self._pick(Student, options['student'])
+        queries = hot_queries(examination, class_obj, student)
+        self.stdout.write(f"Planning against {examination} / {class_obj.name} / {student}")
+
+        if not connection.features.can_rollback_ddl:
+            self.stdout.write(self.style.WARNING(
+                f"{connection.vendor} can't roll back DROP INDEX, so only the current plans are shown."
+            ))
+            before = None
+        else:
+            before = self._plans_without_tuned_indexes(queries)
+        after = [queryset.explain() for _, queryset in queries]
+
+        for index, (label, _) in enumerate(queries):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{label}"))
+            if before is not None:
+                self.stdout.write("  Without the reporting indexes:")
+                self.stdout.write(self._indent(before[index]))
+                self.stdout.write("  With them:")
+            self.stdout.write(self._indent(after[index]))
+
+    def _pick(self, model, pk):
+        if pk:
+            try:
+                return model.objects.get(pk=pk)
+            except model.DoesNotExist:
+                raise CommandError(f"{model._meta.verbose_name.capitalize()} {pk} does not exist.")
+        obj = model.objects.first()
+        if obj is None:
+            raise CommandError(f"There is no {model._meta.verbose_name} to plan against.")
+        return obj
+
+    def _plans_without_tuned_indexes(self, queries):
+        """Drops the tuned indexes inside a transaction, plans every query, then rolls back."""
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for model, fields in TUNED_INDEXES:
+                    index = next((i for i in model._meta.indexes if i.fields == fields), None)
+                    if index is not None:
+                        cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+            plans = [queryset.explain() for _, queryset in queries]
+            transaction.set_rollback(True)
+        return plans
+
+    def _indent(self, plan):
+        return "\n".join(f"    {line}" for line in plan.splitlines())
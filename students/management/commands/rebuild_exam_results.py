@@ -0,0 +1,42 @@
+# students/management/commands/rebuild_exam_results.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from students.cache import bump_results_generation
+from students.models import Class, Examination, ExamResult
+from students.results import rebuild_exam_results
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the ExamResult summary table from the Mark table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help="Only rebuild this examination ID.")
+        parser.add_argument('--class', dest='class_id', type=int, help="Only rebuild this class ID.")
+
+    def handle(self, *args, **options):
+        examinations = Examination.objects.all()
+        classes = Class.objects.all()
+        if options['exam']:
+            examinations = examinations.filter(pk=options['exam'])
+            if not examinations.exists():
+                raise CommandError(f"Examination {options['exam']} does not exist.")
+        if options['class_id']:
+            classes = classes.filter(pk=options['class_id'])
+            if not classes.exists():
+                raise CommandError(f"Class {options['class_id']} does not exist.")
+
+        if not options['exam'] and not options['class_id']:
+            # Full rebuild: drop rows for students who no longer have a class too.
+            ExamResult.objects.all().delete()
+            bump_results_generation()
+
+        rebuilt = 0
+        for examination in examinations:
+            for class_obj in classes:
+                rebuild_exam_results(examination, class_obj)
+                rebuilt += 1
+                self.stdout.write(f"Rebuilt {examination} / {class_obj.name}")
+
+        total = ExamResult.objects.count()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} class result set(s); {total} ExamResult rows in total."))
@@ -0,0 +1,32 @@
+# students/management/commands/run_import_worker.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from students.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Processes queued Excel uploads (ImportJob rows). Runs until stopped unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process the jobs queued now, then exit.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait between checks when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Import worker started.")
+        try:
+            while True:
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                self.stdout.write(f"Running {job} ({job.original_name})")
+                run_job(job)
+                style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+                self.stdout.write(style(f"{job}: {job.summary}"))
+        except KeyboardInterrupt:
+            self.stdout.write("Import worker stopped.")
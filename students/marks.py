@@ -0,0 +1,182 @@
+# students/marks.py
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Examination, Mark
+from .results import deferred_result_refresh, exam_class_ids, queue_result_refresh
+
+PUBLISHED_MARKS_MESSAGE = "Results for this examination are published. Unpublish it before changing marks."
+
+
+def reject_published(examination_ids):
+    """
+    Raises ValidationError if any of the examinations is published. Bulk
+    writes skip the Mark signals, so every writer checks this itself.
+    """
+    if Examination.objects.filter(pk__in=examination_ids, is_published=True).exists():
+        raise ValidationError(PUBLISHED_MARKS_MESSAGE)
+
+
+def load_marks(examination, student_ids, subject_ids):
+    """Existing marks for the given students and subjects as {(student_id, subject_id): Mark}."""
+    marks = Mark.objects.filter(
+        examination=examination,
+        student_id__in=student_ids,
+        subject_id__in=subject_ids,
+    ).order_by().only('pk', 'student_id', 'subject_id', 'score', 'version')
+    return {(mark.student_id, mark.subject_id): mark for mark in marks}
+
+
+def save_scores(examination, scores, existing=None):
+    """
+    Writes {(student_id, subject_id): score} for one examination. Only cells
+    that differ from the stored mark are written; a score of None removes the
+    mark. Everything goes through one bulk_create, one bulk_update and one
+    delete in a single transaction, then the affected ExamResult rows are
+    rebuilt once per class.
+
+    Pass `existing` (from load_marks) when the caller already has it, to save
+    a query. Returns (created, updated, deleted) counts. Raises
+    ValidationError if the examination is published.
+    """
+    reject_published([examination.pk])
+    if existing is None:
+        existing = load_marks(
+            examination,
+            {student_id for student_id, _ in scores},
+            {subject_id for _, subject_id in scores},
+        )
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    changed_students = set()
+    for (student_id, subject_id), score in scores.items():
+        mark = existing.get((student_id, subject_id))
+        if mark is None:
+            if score is None:
+                continue
+            to_create.append(Mark(student_id=student_id, subject_id=subject_id, examination=examination, score=score))
+        elif score is None:
+            to_delete.append(mark.pk)
+        elif mark.score != score:
+            mark.score = score
+            mark.version += 1
+            mark.updated_at = timezone.now()
+            to_update.append(mark)
+        else:
+            continue
+        changed_students.add(student_id)
+
+    if to_create:
+        # bulk_create skips Mark.save(), which records the class the mark was taken in
+        class_ids = exam_class_ids({(mark.student_id, examination.pk) for mark in to_create})
+        for mark in to_create:
+            mark.school_class_id = class_ids[mark.student_id, examination.pk]
+
+    with deferred_result_refresh():
+        with transaction.atomic():
+            Mark.objects.bulk_create(to_create, batch_size=500)
+            Mark.objects.bulk_update(to_update, ['score', 'version', 'updated_at'], batch_size=500)
+            if to_delete:
+                Mark.objects.filter(pk__in=to_delete).delete()
+        # Bulk writes skip the Mark signals
+        queue_result_refresh((student_id, examination.pk) for student_id in changed_students)
+
+    return len(to_create), len(to_update), len(to_delete)
+
+
+def save_cells(cells):
+    """
+    Saves individual mark cells with an optimistic concurrency check.
+
+    Each cell is a dict with student, subject, examination, score (None to
+    clear) and version: the version the client last saw, or None if it saw no
+    mark. A cell whose stored version differs is not written and comes back
+    in `conflicts` with the stored score, so one teacher can't silently
+    overwrite another. Returns {'saved': [...], 'conflicts': [...]}, each
+    entry in the same shape as the input cells. Raises ValidationError if
+    any cell's examination is published.
+    """
+    saved = []
+    conflicts = []
+    if not cells:
+        return {'saved': saved, 'conflicts': conflicts}
+    reject_published({cell['examination'] for cell in cells})
+
+    current = {
+        (mark.student_id, mark.subject_id, mark.examination_id): mark
+        for mark in Mark.objects.filter(
+            student_id__in={cell['student'] for cell in cells},
+            subject_id__in={cell['subject'] for cell in cells},
+            examination_id__in={cell['examination'] for cell in cells},
+        ).order_by().only('pk', 'student_id', 'subject_id', 'examination_id', 'score', 'version')
+    }
+
+    def cell_state(cell, mark):
+        return {
+            'student': cell['student'],
+            'subject': cell['subject'],
+            'examination': cell['examination'],
+            'score': mark.score if mark is not None else None,
+            'version': mark.version if mark is not None else None,
+        }
+
+    changed = set()
+    with deferred_result_refresh():
+        with transaction.atomic():
+            for cell in cells:
+                key = (cell['student'], cell['subject'], cell['examination'])
+                mark = current.get(key)
+                score = cell['score']
+                seen_version = cell.get('version') or None
+
+                if (mark.version if mark is not None else None) != seen_version:
+                    conflicts.append(cell_state(cell, mark))
+                    continue
+                if mark is not None and mark.score == score:
+                    saved.append(cell_state(cell, mark))
+                    continue
+
+                if mark is None:
+                    if score is None:
+                        saved.append(cell_state(cell, None))
+                        continue
+                    try:
+                        with transaction.atomic():
+                            mark = Mark.objects.create(
+                                student_id=cell['student'], subject_id=cell['subject'],
+                                examination_id=cell['examination'], score=score,
+                            )
+                    except IntegrityError:
+                        # Created by someone else since we looked
+                        conflicts.append(cell_state(cell, Mark.objects.filter(
+                            student_id=cell['student'], subject_id=cell['subject'], examination_id=cell['examination'],
+                        ).first()))
+                        continue
+                    current[key] = mark
+                elif score is None:
+                    # The version filter makes the check and the write one statement
+                    if not Mark.objects.filter(pk=mark.pk, version=mark.version).delete()[0]:
+                        conflicts.append(cell_state(cell, Mark.objects.filter(pk=mark.pk).first()))
+                        continue
+                    mark = current[key] = None
+                else:
+                    updated = Mark.objects.filter(pk=mark.pk, version=mark.version).update(
+                        score=score, version=F('version') + 1, updated_at=timezone.now(),
+                    )
+                    if not updated:
+                        conflicts.append(cell_state(cell, Mark.objects.filter(pk=mark.pk).first()))
+                        continue
+                    mark.score = score
+                    mark.version += 1
+
+                saved.append(cell_state(cell, mark))
+                changed.add((cell['student'], cell['examination']))
+
+        queue_result_refresh(changed)
+
+    return {'saved': saved, 'conflicts': conflicts}
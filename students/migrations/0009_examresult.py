@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+# Lowest average for each grade, best first (the grading in use when this table was added)
+GRADE_BANDS = [('A', 81), ('B', 61), ('C', 41), ('D', 21), ('F', 0)]
+
+
+def backfill_exam_results(apps, schema_editor):
+    # One row per (student, examination) with scored marks, placed in the
+    # student's class and ranked within it by total, ties sharing a position.
+    Mark = apps.get_model('students', 'Mark')
+    Student = apps.get_model('students', 'Student')
+    ExamResult = apps.get_model('students', 'ExamResult')
+    classes = dict(Student.objects.values_list('pk', 'current_class_id'))
+    totals = Mark.objects.filter(score__isnull=False).order_by().values(
+        'student_id', 'examination_id',
+    ).annotate(total=Sum('score'), count=Count('score'))
+
+    groups = {}
+    for row in totals:
+        average = round(row['total'] / row['count'], 2)
+        result = ExamResult(
+            student_id=row['student_id'],
+            examination_id=row['examination_id'],
+            school_class_id=classes.get(row['student_id']),
+            total_score=row['total'],
+            subject_count=row['count'],
+            average_score=average,
+            overall_grade=next(grade for grade, min_score in GRADE_BANDS if average >= min_score or min_score == 0),
+        )
+        groups.setdefault((result.examination_id, result.school_class_id), []).append(result)
+
+    results = []
+    for group in groups.values():
+        group.sort(key=lambda result: result.total_score, reverse=True)
+        for index, result in enumerate(group):
+            if index and result.total_score == group[index - 1].total_score:
+                result.position = group[index - 1].position
+            else:
+                result.position = index + 1
+        results.extend(group)
+    ExamResult.objects.bulk_create(results, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0008_rename_admission_number_student_prem_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_score', models.IntegerField(default=0)),
+                ('subject_count', models.IntegerField(default=0)),
+                ('average_score', models.FloatField(default=0)),
+                ('overall_grade', models.CharField(default='N/A', max_length=3)),
+                ('position', models.PositiveIntegerField(blank=True, null=True)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='students.examination')),
+                ('school_class', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_results', to='students.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_results', to='students.student')),
+            ],
+            options={
+                'ordering': ['examination', 'school_class', 'position'],
+                'indexes': [models.Index(fields=['examination', 'school_class', 'position'], name='students_ex_examina_8b9975_idx')],
+                'unique_together': {('student', 'examination')},
+            },
+        ),
+        migrations.RunPython(backfill_exam_results, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_examresult'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='examresult',
+            options={'ordering': ['examination_id', 'school_class_id', 'position']},
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_default_scheme(apps, schema_editor):
+    GradingScheme = apps.get_model('students', 'GradingScheme')
+    GradeBand = apps.get_model('students', 'GradeBand')
+    scheme = GradingScheme.objects.create(name='Standard A-F', is_default=True)
+    for grade, min_score, is_pass in [('A', 81, True), ('B', 61, True), ('C', 41, True), ('D', 21, True), ('F', 0, False)]:
+        GradeBand.objects.create(scheme=scheme, grade=grade, min_score=min_score, is_pass=is_pass)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0010_alter_examresult_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradingScheme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('academic_year', models.IntegerField(blank=True, help_text='Leave blank to use this scheme for every year.', null=True)),
+                ('is_default', models.BooleanField(default=False, help_text='Used when no year- or class-specific scheme matches.')),
+                ('classes', models.ManyToManyField(blank=True, help_text='Leave empty to use this scheme for every class.', related_name='grading_schemes', to='students.class')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GradeBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(max_length=3)),
+                ('min_score', models.IntegerField(help_text='Lowest score (0-100) that earns this grade.')),
+                ('is_pass', models.BooleanField(default=True)),
+                ('scheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='students.gradingscheme')),
+            ],
+            options={
+                'ordering': ['scheme', '-min_score'],
+                'unique_together': {('scheme', 'grade')},
+            },
+        ),
+        migrations.RunPython(create_default_scheme, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0011_gradingscheme'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examination',
+            name='is_published',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='examination',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ResultSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='students.examination')),
+                ('school_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_snapshots', to='students.class')),
+            ],
+            options={
+                'unique_together': {('examination', 'school_class')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0012_examination_publishing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mark',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mark',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
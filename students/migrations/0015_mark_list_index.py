@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0014_import_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(fields=['examination', 'subject', 'student'], name='students_ma_examina_080a92_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0015_mark_list_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(fields=['examination', 'student', 'score'], name='students_ma_examina_988a17_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(fields=['student', 'examination', 'score'], name='students_ma_student_bca42e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['current_class', 'status'], name='students_st_current_96d1af_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['status', 'graduation_year'], name='students_st_status_964e9f_idx'),
+        ),
+    ]
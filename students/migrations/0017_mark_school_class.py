@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0016_reporting_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='mark',
+            options={'ordering': ['examination__academic_year', 'examination__term', 'school_class__name', 'student__first_name']},
+        ),
+        migrations.AddField(
+            model_name='mark',
+            name='school_class',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='marks', to='students.class'),
+        ),
+        migrations.AddIndex(
+            model_name='mark',
+            index=models.Index(fields=['examination', 'school_class'], name='students_ma_examina_79b150_idx'),
+        ),
+    ]
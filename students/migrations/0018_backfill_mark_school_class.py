@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:34
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_school_class(apps, schema_editor):
+    # The ExamResult row was written with the student's class at the time of
+    # the exam, so it is preferred; otherwise fall back to the current class.
+    Mark = apps.get_model('students', 'Mark')
+    ExamResult = apps.get_model('students', 'ExamResult')
+    Student = apps.get_model('students', 'Student')
+    result_class = ExamResult.objects.filter(
+        student_id=OuterRef('student_id'), examination_id=OuterRef('examination_id'),
+    ).values('school_class_id')[:1]
+    current_class = Student.objects.filter(pk=OuterRef('student_id')).values('current_class_id')[:1]
+    Mark.objects.filter(school_class__isnull=True).update(
+        school_class_id=Coalesce(Subquery(result_class), Subquery(current_class)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0017_mark_school_class'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_school_class, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0018_backfill_mark_school_class'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamEnrollment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempted', models.BooleanField(default=False)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to='students.examination')),
+                ('school_class', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_enrollments', to='students.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_enrollments', to='students.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['examination', 'school_class', 'attempted'], name='students_ex_examina_8da255_idx')],
+                'unique_together': {('examination', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:38
+
+from django.db import migrations
+
+
+def backfill_enrollments(apps, schema_editor):
+    # Same rules as students/enrollment.py: the rosters of the classes sitting
+    # each exam (every class if none are set), plus students with a mark above
+    # zero; marks also record the class the student actually sat it in.
+    Class = apps.get_model('students', 'Class')
+    Examination = apps.get_model('students', 'Examination')
+    Student = apps.get_model('students', 'Student')
+    Mark = apps.get_model('students', 'Mark')
+    ExamEnrollment = apps.get_model('students', 'ExamEnrollment')
+    all_class_ids = list(Class.objects.values_list('pk', flat=True))
+    for examination in Examination.objects.all():
+        class_ids = list(examination.classes_taking_exam.values_list('pk', flat=True)) or all_class_ids
+        enrollments = {
+            student_id: ExamEnrollment(examination_id=examination.pk, student_id=student_id, school_class_id=class_id)
+            for student_id, class_id in Student.objects.filter(current_class_id__in=class_ids).values_list('pk', 'current_class_id')
+        }
+        marks = Mark.objects.filter(examination_id=examination.pk).values_list('student_id', 'school_class_id', 'score')
+        for student_id, class_id, score in marks:
+            attempted = score is not None and score > 0
+            enrollment = enrollments.get(student_id)
+            if enrollment is None:
+                if not attempted:
+                    continue
+                enrollment = enrollments[student_id] = ExamEnrollment(examination_id=examination.pk, student_id=student_id)
+            if class_id is not None:
+                enrollment.school_class_id = class_id
+            enrollment.attempted = enrollment.attempted or attempted
+        ExamEnrollment.objects.bulk_create(enrollments.values(), batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0019_exam_enrollment'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_enrollments, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 # students/models.py
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from users.models import CustomUser
 from django.contrib.auth.models import User
@@ -90,6 +91,11 @@ class Student(models.Model):
 
     class Meta:
         ordering = ['current_class__name', 'first_name', 'last_name']
+        indexes = [
+            # Class rosters filtered by status, and the graduates report
+            models.Index(fields=['current_class', 'status']),
+            models.Index(fields=['status', 'graduation_year']),
+        ]
 
 class Subject(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -125,6 +131,10 @@ class Examination(models.Model):
 
     classes_taking_exam = models.ManyToManyField('Class', related_name='examinations')
 
+    # Published exams are served from ResultSnapshot rows and their marks are locked
+    is_published = models.BooleanField(default=False)
+    published_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         # Use get_name_display() to show the full name from choices
         return f"{self.get_name_display()} ({self.get_term_display()} - {self.academic_year})"
@@ -136,15 +146,183 @@ class Mark(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
     examination = models.ForeignKey(Examination, on_delete=models.CASCADE)
+    # The class the student sat the examination in; unlike student.current_class
+    # it doesn't change when the student is promoted
+    school_class = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True, related_name='marks')
     # CHANGE THIS LINE from DecimalField to IntegerField
     score = models.IntegerField(null=True, blank=True) # Allow null if no score yet, blank for forms
+    # Bumped on every change so concurrent editors can detect stale writes
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
 
     def __str__(self):
         return f"{self.student.first_name}'s {self.subject.name} score in {self.examination.name}: {self.score}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.school_class_id is None and self.student_id:
+            # The class of the student's other marks in this examination, else their current class
+            self.school_class_id = (
+                Mark.objects.filter(student_id=self.student_id, examination_id=self.examination_id)
+                .exclude(school_class=None).values_list('school_class_id', flat=True).first()
+                or Student.objects.filter(pk=self.student_id).values_list('current_class_id', flat=True).first()
+            )
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        if self.examination_id and Examination.objects.filter(pk=self.examination_id, is_published=True).exists():
+            raise ValidationError("Results for this examination are published. Unpublish it before changing marks.")
+
     class Meta:
         unique_together = ('student', 'subject', 'examination')
-        ordering = ['examination__academic_year', 'examination__term', 'student__current_class__name', 'student__first_name']
+        ordering = ['examination__academic_year', 'examination__term', 'school_class__name', 'student__first_name']
+        indexes = [
+            # Mark list filtered by examination and subject; also serves (examination, subject) roll-ups
+            models.Index(fields=['examination', 'subject', 'student']),
+            # Per-class roll-ups of one examination join Student on these; score makes them covering
+            models.Index(fields=['examination', 'student', 'score']),
+            # One student's marks: report cards, trends and ExamResult refreshes
+            models.Index(fields=['student', 'examination', 'score']),
+            # Class reports filter on the class the marks were taken in
+            models.Index(fields=['examination', 'school_class']),
+        ]
+
+class ExamResult(models.Model):
+    """
+    Per-(student, examination) summary of a student's marks, kept in step with
+    Mark writes so results pages can read totals and positions directly.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='exam_results')
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='results')
+    school_class = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_results')
+    total_score = models.IntegerField(default=0)
+    subject_count = models.IntegerField(default=0)
+    average_score = models.FloatField(default=0)
+    overall_grade = models.CharField(max_length=3, default='N/A')
+    position = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.student} - {self.examination}: {self.total_score} (Pos {self.position})"
+
+    class Meta:
+        unique_together = ('student', 'examination')
+        ordering = ['examination_id', 'school_class_id', 'position']
+        indexes = [
+            models.Index(fields=['examination', 'school_class', 'position']),
+        ]
+
+class ExamEnrollment(models.Model):
+    """
+    A student expected to sit an examination, materialized from
+    classes_taking_exam and the class rosters (see students/enrollment.py).
+    `attempted` is kept in step with the student's marks, so attempt reports
+    are indexed counts rather than scans of the marks table.
+    """
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='enrollments')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='exam_enrollments')
+    school_class = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_enrollments')
+    # At least one mark above zero, as the attempt reports have always counted it
+    attempted = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.student} - {self.examination} ({'attempted' if self.attempted else 'not attempted'})"
+
+    class Meta:
+        unique_together = ('examination', 'student')
+        indexes = [
+            models.Index(fields=['examination', 'school_class', 'attempted']),
+        ]
+
+class ResultSnapshot(models.Model):
+    """
+    Frozen results of one class in a published examination: the score matrix,
+    totals, positions, grade distribution and subject statistics, stored as
+    JSON (see students/snapshots.py).
+    """
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='snapshots')
+    school_class = models.ForeignKey(Class, on_delete=models.CASCADE, related_name='result_snapshots')
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.examination} - {self.school_class}"
+
+    class Meta:
+        unique_together = ('examination', 'school_class')
+
+class ImportJob(models.Model):
+    """
+    An uploaded sheet queued for the import worker (manage.py run_import_worker).
+    The worker updates the counters as it goes so the upload page can poll
+    progress (see students/jobs.py).
+    """
+    KIND_CHOICES = [
+        ('marks', 'Marks'),
+        ('students', 'Students'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file = models.FileField(upload_to='imports/')
+    original_name = models.CharField(max_length=255, blank=True)
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, null=True, blank=True, related_name='import_jobs')
+    created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    # Data rows in the sheet, when the file says (used for the ETA)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    failed_rows = models.PositiveIntegerField(default=0)
+    summary = models.TextField(blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+class GradingScheme(models.Model):
+    """
+    Score-to-grade bands. A scheme can be limited to one academic year and/or
+    to particular classes; otherwise it applies school-wide.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    academic_year = models.IntegerField(null=True, blank=True, help_text="Leave blank to use this scheme for every year.")
+    classes = models.ManyToManyField(Class, blank=True, related_name='grading_schemes', help_text="Leave empty to use this scheme for every class.")
+    is_default = models.BooleanField(default=False, help_text="Used when no year- or class-specific scheme matches.")
+
+    def __str__(self):
+        return self.name
+
+class GradeBand(models.Model):
+    scheme = models.ForeignKey(GradingScheme, on_delete=models.CASCADE, related_name='bands')
+    grade = models.CharField(max_length=3)
+    min_score = models.IntegerField(help_text="Lowest score (0-100) that earns this grade.")
+    is_pass = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.grade} (from {self.min_score})"
+
+    class Meta:
+        unique_together = ('scheme', 'grade')
+        ordering = ['scheme', '-min_score']
 
 class SchoolDocument(models.Model):
     DOCUMENT_TYPE_CHOICES = [
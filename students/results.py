@@ -0,0 +1,643 @@
+# students/results.py
+
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.db.models import Sum, Count, F, Q, Subquery, Window
+from django.db.models.functions import Rank, DenseRank
+
+from .cache import (
+    bump_results_generation, bump_results_version, bump_student_versions,
+    cached_exam_results, cached_results, cached_student_results,
+)
+from .enrollment import refresh_attempts
+from .grading import get_grading_scheme, scheme_for
+from .models import Class, Examination, Student, Subject, Mark, ExamResult, ResultSnapshot
+from .snapshots import ClassSnapshot, load_class_snapshot
+
+
+# Columns shown on the class analysis pages (E is kept for the layout).
+ANALYSIS_GRADES = ['A', 'B', 'C', 'D', 'E', 'F']
+
+
+def rank_expression(order_by, dense=False):
+    """
+    RANK() (1, 2, 2, 4) or DENSE_RANK() (1, 2, 2, 3) window over `order_by`.
+    Class positions use RANK() so tied students share a position.
+    """
+    return Window(DenseRank() if dense else Rank(), order_by=order_by)
+
+
+def exam_class_ids(student_exam_pairs):
+    """
+    {(student_id, examination_id): class_id} for the class each student sat
+    each examination in: the class recorded on their marks, else on their
+    ExamResult row, else their current class.
+    """
+    pairs = set(student_exam_pairs)
+    class_ids = {}
+    marks = Mark.objects.filter(
+        student_id__in={s for s, _ in pairs}, examination_id__in={e for _, e in pairs},
+    ).exclude(school_class=None).order_by().values_list('student_id', 'examination_id', 'school_class_id').distinct()
+    for student_id, exam_id, class_id in marks:
+        if (student_id, exam_id) in pairs:
+            class_ids.setdefault((student_id, exam_id), class_id)
+
+    missing = pairs - class_ids.keys()
+    if missing:
+        results = ExamResult.objects.filter(
+            student_id__in={s for s, _ in missing}, examination_id__in={e for _, e in missing},
+        ).exclude(school_class=None).values_list('student_id', 'examination_id', 'school_class_id')
+        for student_id, exam_id, class_id in results:
+            if (student_id, exam_id) in missing:
+                class_ids[student_id, exam_id] = class_id
+        missing -= class_ids.keys()
+    if missing:
+        current = dict(Student.objects.filter(pk__in={s for s, _ in missing}).values_list('pk', 'current_class_id'))
+        for student_id, exam_id in missing:
+            class_ids[student_id, exam_id] = current.get(student_id)
+    return class_ids
+
+
+def load_score_matrix(examination, class_obj):
+    """
+    Loads every mark for an (examination, class) pair in a single query and
+    pivots it into {student_id: {subject_id: score}}.
+    """
+    matrix = {}
+    marks = Mark.objects.filter(
+        examination=examination,
+        school_class=class_obj,
+    ).order_by().values_list('student_id', 'subject_id', 'score')
+    for student_id, subject_id, score in marks:
+        matrix.setdefault(student_id, {})[subject_id] = score
+    return matrix
+
+
+def ranked_mark_totals(examination, class_obj, dense=False):
+    """
+    Ranks a class by summed scores in the database.
+    Returns {student_id: position}; students with no scored marks are absent.
+    """
+    totals = Mark.objects.filter(
+        examination=examination,
+        school_class=class_obj,
+        score__isnull=False,
+    ).order_by().values('student_id').annotate(
+        total=Sum('score'),
+    ).annotate(
+        position=rank_expression(F('total').desc(), dense=dense),
+    )
+    return {row['student_id']: row['position'] for row in totals}
+
+
+def ranked_exam_results(examination, class_obj, dense=False):
+    """ExamResult rows for one class annotated with `class_rank` by total score."""
+    return ExamResult.objects.filter(
+        examination=examination,
+        school_class=class_obj,
+    ).annotate(
+        class_rank=rank_expression(F('total_score').desc(), dense=dense),
+    ).order_by('class_rank', 'pk')
+
+
+def get_student_position(student, examination, dense=False):
+    """
+    Fetches one student's class position without loading the rest of the class.
+    The window has to see the whole class, so the student filter is applied
+    outside the ranked subquery.
+    """
+    # Rank within the class the student sat the examination in
+    exam_class = ExamResult.objects.filter(student=student, examination=examination).values('school_class_id')[:1]
+    ranked = ranked_exam_results(examination, Subquery(exam_class), dense=dense).values('student_id', 'class_rank')
+    sql, params = ranked.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT "class_rank" FROM ({sql}) AS ranked WHERE "student_id" = %s',
+            [*params, student.pk],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _result_row(student, subjects, student_scores, position, scheme):
+    subject_details = []
+    total_score = 0
+    subject_count = 0
+
+    for subject in subjects:
+        score = student_scores.get(subject.pk)
+        subject_details.append({
+            'subject_name': subject.name,
+            'subject_code': subject.code,
+            'score': score,
+            'grade': scheme.grade(score),
+        })
+        if score is not None:
+            total_score += score
+            subject_count += 1
+
+    average_score = total_score / subject_count if subject_count > 0 else 0
+
+    return {
+        'student': student,
+        'total_score': total_score,
+        'average_score': round(average_score, 2),
+        'overall_grade': scheme.grade(average_score),
+        'subject_details': subject_details,
+        'position': position,
+    }
+
+
+def get_class_results(examination, class_obj, subjects=None):
+    """
+    Builds the per-student results table for one class in one examination.
+
+    Runs a fixed number of queries (students, subjects, marks, ranking)
+    regardless of class size and returns the rows sorted by position, in the
+    same shape the results templates expect. Students without any scored
+    mark have no position and are listed last.
+
+    The class list is the students who sat the examination in this class plus
+    current members with no marks in it yet, so promotions don't move old
+    results between classes.
+    """
+    students = Student.objects.filter(
+        Q(pk__in=Mark.objects.filter(examination=examination, school_class=class_obj).values('student_id'))
+        | (Q(current_class=class_obj) & ~Q(pk__in=Mark.objects.filter(examination=examination).values('student_id')))
+    ).order_by('first_name', 'last_name')
+    if subjects is None:
+        subjects = Subject.objects.order_by('name')
+    subjects = list(subjects)
+    matrix = load_score_matrix(examination, class_obj)
+    positions = ranked_mark_totals(examination, class_obj)
+    scheme = scheme_for(examination, class_obj)
+
+    class_results = [
+        _result_row(student, subjects, matrix.get(student.pk, {}), positions.get(student.pk), scheme)
+        for student in students
+    ]
+    class_results.sort(key=lambda r: (r['position'] is None, r['position'] or 0))
+    return class_results
+
+
+def get_student_results(examination, student, subjects=None):
+    """
+    Builds one student's results row (same shape as get_class_results) without
+    computing the rest of the class. Returns None if the student has no marks.
+    """
+    class_id = exam_class_ids([(student.pk, examination.pk)])[(student.pk, examination.pk)]
+    if subjects is None:
+        snapshot = get_published_snapshot(examination, class_id)
+        if snapshot is not None:
+            return snapshot.student_results(student.pk)
+        subjects = Subject.objects.order_by('name')
+    student_scores = dict(
+        Mark.objects.filter(examination=examination, student=student)
+        .order_by().values_list('subject_id', 'score')
+    )
+    if not student_scores:
+        return None
+    scheme = scheme_for(examination, class_id)
+    return _result_row(student, subjects, student_scores, get_student_position(student, examination), scheme)
+
+
+def _percentage(part, whole):
+    return (part / whole) * 100 if whole > 0 else 0
+
+
+def _empty_grade_counts(scheme):
+    counts = {grade: 0 for grade in ANALYSIS_GRADES}
+    counts.update({grade: 0 for grade in scheme.grades})
+    return counts
+
+
+def get_subject_grade_matrix(examination, class_obj, subjects=None, scheme=None):
+    """
+    Returns the subject x grade table for a class in one examination.
+
+    A single query groups the class's scored marks by subject and by the
+    grading scheme's CASE expression, so grading happens in SQL.
+    """
+    if subjects is None:
+        subjects = class_obj.subjects.all().order_by('name')
+    if scheme is None:
+        scheme = scheme_for(examination, class_obj)
+
+    counts = Mark.objects.filter(
+        examination=examination,
+        school_class=class_obj,
+        score__isnull=False,
+    ).order_by().annotate(
+        band=scheme.case_expression('score'),
+    ).values('subject_id', 'band').annotate(count=Count('pk'))
+
+    grades_by_subject = {}
+    for row in counts:
+        grades_by_subject.setdefault(row['subject_id'], {})[row['band']] = row['count']
+
+    subject_analysis = []
+    for subject in subjects:
+        grades = _empty_grade_counts(scheme)
+        grades.update(grades_by_subject.get(subject.pk, {}))
+        total_scored = sum(grades.values())
+        pass_count = sum(count for grade, count in grades.items() if scheme.is_pass(grade))
+        fail_count = total_scored - pass_count
+        subject_analysis.append({
+            'name': subject.name,
+            'code': subject.code,
+            'total_scored': total_scored,
+            'grades': grades,
+            'pass_count': pass_count,
+            'fail_count': fail_count,
+            'pass_percentage': _percentage(pass_count, total_scored),
+            'fail_percentage': _percentage(fail_count, total_scored),
+        })
+    return subject_analysis
+
+
+def get_class_analysis(examination, class_obj):
+    """
+    Everything the class performance page and its PDF show: the overall grade
+    distribution and pass/fail rates (from ExamResult), the subject x grade
+    matrix, and the top and bottom ten students.
+    """
+    scheme = scheme_for(examination, class_obj)
+    exam_results = ExamResult.objects.filter(examination=examination, school_class=class_obj)
+    grade_keys = list(_empty_grade_counts(scheme))
+
+    overall = exam_results.aggregate(
+        total=Count('pk'),
+        pass_count=Count('pk', filter=Q(overall_grade__in=scheme.pass_grades)),
+        **{f'grade_{grade}': Count('pk', filter=Q(overall_grade=grade)) for grade in grade_keys}
+    )
+    total_students_attempted = overall['total']
+    overall_grade_distribution = {grade: overall[f'grade_{grade}'] for grade in grade_keys}
+    overall_grade_distribution['N/A'] = total_students_attempted - sum(overall_grade_distribution.values())
+    overall_pass_count = overall['pass_count']
+    overall_fail_count = total_students_attempted - overall_pass_count
+
+    ranked = exam_results.select_related('student')
+    top_students = list(ranked.order_by('position', 'student__first_name', 'pk')[:10])
+    bottom_students = list(ranked.order_by('-position', '-student__first_name', '-pk')[:10])[::-1]
+
+    return {
+        'total_students_attempted': total_students_attempted,
+        'overall_grade_distribution': overall_grade_distribution,
+        'overall_pass_count': overall_pass_count,
+        'overall_fail_count': overall_fail_count,
+        'overall_pass_rate': round(_percentage(overall_pass_count, total_students_attempted), 2),
+        'overall_fail_rate': round(_percentage(overall_fail_count, total_students_attempted), 2),
+        'subject_analysis': get_subject_grade_matrix(examination, class_obj, scheme=scheme),
+        'top_students': top_students,
+        'bottom_students': bottom_students,
+    }
+
+
+def get_published_snapshot(examination, class_obj):
+    """The frozen ClassSnapshot of a published examination, or None."""
+    if not examination.is_published or class_obj is None:
+        return None
+    return cached_results(
+        'snapshot', examination.pk, getattr(class_obj, 'pk', class_obj),
+        lambda: load_class_snapshot(examination, class_obj),
+    )
+
+
+def get_cached_class_results(examination, class_obj):
+    """
+    get_class_results() for all subjects, served from the examination's
+    snapshot once published and from the results cache before that.
+    """
+    snapshot = get_published_snapshot(examination, class_obj)
+    if snapshot is not None:
+        return snapshot.class_results()
+    return cached_results(
+        'class_results', examination.pk, class_obj.pk,
+        lambda: get_class_results(examination, class_obj),
+    )
+
+
+def get_cached_class_analysis(examination, class_obj):
+    """get_class_analysis(), served from the snapshot or the results cache."""
+    snapshot = get_published_snapshot(examination, class_obj)
+    if snapshot is not None:
+        return snapshot.class_analysis()
+    return cached_results(
+        'class_analysis', examination.pk, class_obj.pk,
+        lambda: get_class_analysis(examination, class_obj),
+    )
+
+
+def get_exam_class_summaries(examination_ids):
+    """
+    {examination_id: {class_id: summary}} for comparing classes across
+    examinations. Each summary has `students` (with a result), `attempted`
+    (with a mark above zero), `average` (mean of the students' averages) and
+    `pass_rate` under the class's grading scheme. Examinations already in the
+    results cache aren't recomputed; the rest come from one grouped query.
+    """
+    return cached_exam_results('class_summaries', examination_ids, _compute_exam_class_summaries)
+
+
+def _compute_exam_class_summaries(examination_ids):
+    rows = ExamResult.objects.filter(examination_id__in=examination_ids).exclude(school_class=None).order_by().values(
+        'examination_id', 'examination__academic_year', 'school_class_id', 'overall_grade',
+    ).annotate(
+        students=Count('pk'),
+        attempted=Count('pk', filter=Q(total_score__gt=0)),
+        average_sum=Sum('average_score'),
+    )
+    summaries = {examination_id: {} for examination_id in examination_ids}
+    for row in rows:
+        summary = summaries[row['examination_id']].setdefault(
+            row['school_class_id'], {'students': 0, 'attempted': 0, 'passed': 0, 'average_sum': 0},
+        )
+        summary['students'] += row['students']
+        summary['attempted'] += row['attempted']
+        summary['average_sum'] += row['average_sum'] or 0
+        if get_grading_scheme(row['examination__academic_year'], row['school_class_id']).is_pass(row['overall_grade']):
+            summary['passed'] += row['students']
+
+    for classes in summaries.values():
+        for summary in classes.values():
+            summary['average'] = round(summary.pop('average_sum') / summary['students'], 2)
+            summary['pass_rate'] = round(_percentage(summary['passed'], summary['students']), 1)
+    return summaries
+
+
+def get_student_trends(students):
+    """
+    {student_id: [point, ...]} of each student's results across every
+    examination they sat, oldest first. Each point has the examination's id,
+    name, academic_year, term and date with the student's average, total and
+    grade, so same-named examinations of different terms and years stay
+    apart. Students already in the results cache aren't recomputed; the rest
+    come from one query over ExamResult.
+    """
+    student_ids = [getattr(student, 'pk', student) for student in students]
+    return cached_student_results('trend', student_ids, _compute_student_trends)
+
+
+def _compute_student_trends(student_ids):
+    rows = ExamResult.objects.filter(student_id__in=student_ids).order_by(
+        'examination__date', 'examination_id',
+    ).values_list(
+        'student_id', 'examination_id', 'examination__name', 'examination__academic_year',
+        'examination__term', 'examination__date', 'average_score', 'total_score', 'overall_grade',
+    )
+    trends = {student_id: [] for student_id in student_ids}
+    for student_id, examination_id, name, academic_year, term, date, average, total, grade in rows:
+        trends[student_id].append({
+            'examination_id': examination_id,
+            'name': name,
+            'academic_year': academic_year,
+            'term': term,
+            'date': date,
+            'average': average,
+            'total': total,
+            'grade': grade,
+        })
+    return trends
+
+
+# --- Publishing ---
+
+def publish_examination(examination):
+    """
+    Freezes the results of every class that sat the examination into
+    ResultSnapshot rows and marks it published. Publishing again replaces the
+    snapshots with the current marks.
+    """
+    subjects = list(Subject.objects.order_by('name'))
+    class_ids = set(
+        ExamResult.objects.filter(examination=examination).exclude(school_class=None)
+        .order_by().values_list('school_class_id', flat=True)
+    )
+    class_ids.update(examination.classes_taking_exam.values_list('pk', flat=True))
+    marked_subjects = {}
+    for class_id, subject_id in (
+        Mark.objects.filter(examination=examination, school_class_id__in=class_ids)
+        .order_by().values_list('school_class_id', 'subject_id').distinct()
+    ):
+        marked_subjects.setdefault(class_id, set()).add(subject_id)
+
+    with transaction.atomic():
+        snapshots = []
+        for class_obj in Class.objects.filter(pk__in=class_ids).prefetch_related('subjects'):
+            snapshot = ClassSnapshot.build(
+                get_class_results(examination, class_obj, subjects),
+                get_class_analysis(examination, class_obj),
+                subjects,
+                marked_subjects.get(class_obj.pk, set()),
+                [subject.pk for subject in class_obj.subjects.all()],
+            )
+            snapshots.append(ResultSnapshot(examination=examination, school_class=class_obj, data=snapshot.data))
+
+        ResultSnapshot.objects.filter(examination=examination).delete()
+        ResultSnapshot.objects.bulk_create(snapshots)
+        examination.is_published = True
+        examination.published_at = timezone.now()
+        examination.save(update_fields=['is_published', 'published_at'])
+    return len(snapshots)
+
+
+def unpublish_examination(examination):
+    """Drops an examination's snapshots so its marks can be edited again."""
+    with transaction.atomic():
+        ResultSnapshot.objects.filter(examination=examination).delete()
+        examination.is_published = False
+        examination.published_at = None
+        examination.save(update_fields=['is_published', 'published_at'])
+
+
+# --- Materialized ExamResult maintenance ---
+
+_deferred = threading.local()
+
+
+def _summary_fields(total_score, subject_count, scheme):
+    average_score = round(total_score / subject_count, 2) if subject_count > 0 else 0
+    return {
+        'total_score': total_score,
+        'subject_count': subject_count,
+        'average_score': average_score,
+        'overall_grade': scheme.grade(average_score),
+    }
+
+
+def rank_exam_results(examination_id, class_id):
+    """
+    Recomputes the stored class positions for one (examination, class) pair
+    with a RANK() window. Only rows whose position changed are written back.
+    """
+    changed = []
+    for row in ranked_exam_results(examination_id, class_id).only('pk', 'position'):
+        if row.position != row.class_rank:
+            row.position = row.class_rank
+            changed.append(row)
+    if changed:
+        ExamResult.objects.bulk_update(changed, ['position'])
+
+
+def refresh_student_result(student_id, examination_id):
+    """
+    Re-aggregates one student's marks for an examination into their ExamResult
+    row and re-ranks the class. A student with no scored marks has no row.
+    """
+    if getattr(_deferred, 'pending', None) is not None:
+        _deferred.pending.add((student_id, examination_id))
+        return
+
+    class_id = exam_class_ids([(student_id, examination_id)])[(student_id, examination_id)]
+    academic_year = Examination.objects.filter(pk=examination_id).values_list('academic_year', flat=True).first()
+    scheme = get_grading_scheme(academic_year, class_id)
+    summary = Mark.objects.filter(
+        student_id=student_id,
+        examination_id=examination_id,
+        score__isnull=False,
+    ).aggregate(total=Sum('score'), count=Count('score'))
+
+    with transaction.atomic():
+        stale_class_id = ExamResult.objects.filter(
+            student_id=student_id, examination_id=examination_id
+        ).values_list('school_class_id', flat=True).first()
+
+        if summary['count']:
+            ExamResult.objects.update_or_create(
+                student_id=student_id,
+                examination_id=examination_id,
+                defaults={'school_class_id': class_id, **_summary_fields(summary['total'], summary['count'], scheme)},
+            )
+        else:
+            ExamResult.objects.filter(student_id=student_id, examination_id=examination_id).delete()
+        refresh_attempts(examination_id, [student_id])
+
+        rank_exam_results(examination_id, class_id)
+        bump_results_version(examination_id, class_id)
+        bump_student_versions([student_id])
+        if stale_class_id != class_id:
+            rank_exam_results(examination_id, stale_class_id)
+            bump_results_version(examination_id, stale_class_id)
+
+
+def rebuild_exam_results(examination, class_obj):
+    """
+    Rebuilds every ExamResult row for one (examination, class) pair from the
+    marks table with one grouped query and bulk writes.
+    """
+    totals = Mark.objects.filter(
+        examination=examination,
+        school_class=class_obj,
+        score__isnull=False,
+    ).order_by().values('student_id').annotate(total=Sum('score'), count=Count('score'))
+    totals = {row['student_id']: row for row in totals}
+    scheme = scheme_for(examination, class_obj)
+
+    with transaction.atomic():
+        removed = ExamResult.objects.filter(examination=examination, school_class=class_obj).exclude(
+            student_id__in=totals.keys()
+        )
+        removed_ids = list(removed.values_list('student_id', flat=True))
+        removed.delete()
+
+        existing = {
+            row.student_id: row
+            for row in ExamResult.objects.filter(examination=examination, student_id__in=totals.keys())
+        }
+        to_create = []
+        to_update = []
+        for student_id, row in totals.items():
+            fields = {'school_class_id': class_obj.pk, **_summary_fields(row['total'], row['count'], scheme)}
+            result = existing.get(student_id)
+            if result is None:
+                to_create.append(ExamResult(student_id=student_id, examination=examination, **fields))
+            else:
+                for name, value in fields.items():
+                    setattr(result, name, value)
+                to_update.append(result)
+
+        ExamResult.objects.bulk_create(to_create, batch_size=500)
+        ExamResult.objects.bulk_update(
+            to_update,
+            ['school_class', 'total_score', 'subject_count', 'average_score', 'overall_grade'],
+            batch_size=500,
+        )
+        refresh_attempts(examination.pk, totals.keys(), class_obj.pk)
+        rank_exam_results(examination.pk, class_obj.pk)
+        bump_results_version(examination.pk, class_obj.pk)
+        bump_student_versions([*totals.keys(), *removed_ids])
+
+
+def regrade_exam_results():
+    """
+    Re-applies the grading schemes to every stored ExamResult after a scheme
+    edit, with one CASE update per (academic year, class).
+    """
+    pairs = ExamResult.objects.order_by().values_list('examination__academic_year', 'school_class_id').distinct()
+    for academic_year, class_id in pairs:
+        scheme = get_grading_scheme(academic_year, class_id)
+        ExamResult.objects.filter(
+            examination__academic_year=academic_year,
+            school_class_id=class_id,
+        ).update(overall_grade=scheme.case_expression('average_score'))
+    bump_results_generation()
+
+
+@contextmanager
+def deferred_result_refresh():
+    """
+    Collects ExamResult refreshes triggered by Mark writes inside the block and
+    rebuilds each affected (examination, class) once on exit. Use this around
+    bulk mark writes instead of refreshing after every row.
+    """
+    if getattr(_deferred, 'pending', None) is not None:
+        # Already deferring; the outermost block does the rebuild.
+        yield
+        return
+
+    _deferred.pending = set()
+    try:
+        yield
+        pending = _deferred.pending
+    finally:
+        _deferred.pending = None
+
+    refresh_results_for(pending)
+
+
+def queue_result_refresh(student_exam_pairs):
+    """
+    Refreshes the ExamResult rows for marks written with bulk queries, which
+    don't send Mark signals. Inside deferred_result_refresh() the pairs join
+    the block's rebuild instead.
+    """
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending.update(student_exam_pairs)
+    else:
+        refresh_results_for(student_exam_pairs)
+
+
+def refresh_results_for(student_exam_pairs):
+    """
+    Rebuilds the ExamResult rows touched by a set of (student_id, examination_id)
+    pairs, one grouped rebuild per (examination, class).
+    """
+    student_exam_pairs = set(student_exam_pairs)
+    if not student_exam_pairs:
+        return
+    class_ids = exam_class_ids(student_exam_pairs)
+    affected = {(exam_id, class_ids[student_id, exam_id]) for student_id, exam_id in student_exam_pairs}
+    examinations = Examination.objects.in_bulk({exam_id for exam_id, _ in affected})
+    classes = Class.objects.in_bulk({class_id for _, class_id in affected if class_id})
+    for exam_id, class_id in affected:
+        if exam_id in examinations and class_id in classes:
+            rebuild_exam_results(examinations[exam_id], classes[class_id])
+
+    # Students without a class are not covered by a class rebuild.
+    for student_id, exam_id in student_exam_pairs:
+        if class_ids[student_id, exam_id] is None:
+            refresh_student_result(student_id, exam_id)
@@ -0,0 +1,102 @@
+# students/signals.py
+
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_results_generation
+from .enrollment import enroll_students, sync_exam_enrollment
+from .grading import invalidate_grading_cache
+from .marks import reject_published
+from .models import Class, Student, Subject, Examination, Mark, GradingScheme, GradeBand
+from .results import refresh_student_result
+
+
+@receiver(pre_save, sender=Mark)
+def reject_marks_for_published_exams(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    reject_published([instance.examination_id])
+
+
+@receiver(pre_delete, sender=Mark)
+def reject_mark_deletes_for_published_exams(sender, instance, origin=None, **kwargs):
+    # Only deletes of marks themselves; removing a student or an examination
+    # still cascades to its marks.
+    if isinstance(origin, Mark) or (isinstance(origin, QuerySet) and origin.model is Mark):
+        reject_published([instance.examination_id])
+
+
+@receiver(post_save, sender=Mark)
+def update_exam_result_on_mark_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return # Skip fixture loading
+    refresh_student_result(instance.student_id, instance.examination_id)
+
+
+@receiver(post_delete, sender=Mark)
+def update_exam_result_on_mark_delete(sender, instance, **kwargs):
+    refresh_student_result(instance.student_id, instance.examination_id)
+
+
+@receiver(post_save, sender=Student)
+def enroll_student(sender, instance, raw=False, **kwargs):
+    # New students and students moved to another class join the open
+    # examinations their class sits.
+    if not raw:
+        enroll_students(Student.objects.filter(pk=instance.pk))
+
+
+# A new examination is enrolled once its classes_taking_exam are saved (post_add
+# below); on post_save the m2m is still empty and would mean "every class".
+@receiver(m2m_changed, sender=Examination.classes_taking_exam.through)
+def sync_enrollment_on_classes_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_exam_enrollment(instance)
+    elif pk_set:
+        # Changed from the Class side: instance is the class
+        for examination in Examination.objects.filter(pk__in=pk_set):
+            sync_exam_enrollment(examination)
+    else:
+        for examination in Examination.objects.all():
+            sync_exam_enrollment(examination)
+
+
+@receiver(post_save, sender=GradingScheme)
+@receiver(post_delete, sender=GradingScheme)
+@receiver(post_save, sender=GradeBand)
+@receiver(post_delete, sender=GradeBand)
+def clear_grading_cache(sender, **kwargs):
+    invalidate_grading_cache()
+    bump_results_generation()
+
+
+@receiver(m2m_changed, sender=GradingScheme.classes.through)
+def clear_grading_cache_on_classes_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_grading_cache()
+        bump_results_generation()
+
+
+# Cached class results include student names, subject lists and exam details,
+# so any change to those invalidates the whole results cache.
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Examination)
+@receiver(post_delete, sender=Examination)
+def clear_results_cache(sender, raw=False, **kwargs):
+    if raw:
+        return
+    bump_results_generation()
+
+
+@receiver(m2m_changed, sender=Class.subjects.through)
+def clear_results_cache_on_subjects_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_results_generation()
@@ -0,0 +1,141 @@
+# students/snapshots.py
+
+from .models import Student, Subject, ExamResult, ResultSnapshot
+
+# Bump when the layout of ResultSnapshot.data changes; older snapshots are
+# then ignored and the exam is served live until it is re-published.
+SNAPSHOT_FORMAT = 1
+
+_STUDENT_FIELDS = ('prem_number', 'first_name', 'middle_name', 'last_name')
+_EXAM_RESULT_FIELDS = ('total_score', 'average_score', 'overall_grade', 'position')
+
+
+class ClassSnapshot:
+    """
+    One class's frozen results, rebuilt into the same shapes as the live
+    results engine (get_class_results, get_class_analysis) so templates don't
+    need to know where the data came from.
+
+    Stored layout (JSON):
+        subjects:         [[id, name, code], ...] in results column order
+        marked_subjects:  ids of subjects with marks in this class
+        class_subjects:   ids of the class's assigned subjects
+        students:         {id: [prem_number, first_name, middle_name, last_name]}
+        rows:             [[student_id, scores, grades, total, average, grade, position], ...]
+        analysis:         get_class_analysis() with top/bottom students as
+                          [student_id, total, average, grade, position]
+    """
+
+    def __init__(self, data, class_id=None):
+        self.data = data
+        self.class_id = class_id
+        self._students = {}
+
+    @classmethod
+    def build(cls, class_results, analysis, subjects, marked_subject_ids, class_subject_ids):
+        students = {}
+
+        def add_student(student):
+            students[str(student.pk)] = [getattr(student, field) for field in _STUDENT_FIELDS]
+            return student.pk
+
+        rows = []
+        for row in class_results:
+            rows.append([
+                add_student(row['student']),
+                [detail['score'] for detail in row['subject_details']],
+                [detail['grade'] for detail in row['subject_details']],
+                row['total_score'],
+                row['average_score'],
+                row['overall_grade'],
+                row['position'],
+            ])
+
+        def exam_result(result):
+            return [add_student(result.student), *(getattr(result, field) for field in _EXAM_RESULT_FIELDS)]
+
+        frozen_analysis = dict(analysis)
+        frozen_analysis['top_students'] = [exam_result(r) for r in analysis['top_students']]
+        frozen_analysis['bottom_students'] = [exam_result(r) for r in analysis['bottom_students']]
+
+        return cls({
+            'format': SNAPSHOT_FORMAT,
+            'subjects': [[subject.pk, subject.name, subject.code] for subject in subjects],
+            'marked_subjects': sorted(marked_subject_ids),
+            'class_subjects': sorted(class_subject_ids),
+            'students': students,
+            'rows': rows,
+            'analysis': frozen_analysis,
+        })
+
+    def _student(self, student_id):
+        student = self._students.get(student_id)
+        if student is None:
+            values = dict(zip(_STUDENT_FIELDS, self.data['students'][str(student_id)]))
+            student = Student(pk=student_id, current_class_id=self.class_id, **values)
+            self._students[student_id] = student
+        return student
+
+    def _subjects(self, subject_ids=None):
+        subjects = [Subject(pk=pk, name=name, code=code) for pk, name, code in self.data['subjects']]
+        if subject_ids is None:
+            return subjects
+        subject_ids = set(subject_ids)
+        return [subject for subject in subjects if subject.pk in subject_ids]
+
+    def marked_subjects(self):
+        """Subjects with at least one mark in the class, ordered by name."""
+        return self._subjects(self.data['marked_subjects'])
+
+    def class_subjects(self):
+        """The class's assigned subjects, ordered by code."""
+        return sorted(self._subjects(self.data['class_subjects']), key=lambda subject: subject.code)
+
+    def _result_row(self, row):
+        student_id, scores, grades, total_score, average_score, overall_grade, position = row
+        return {
+            'student': self._student(student_id),
+            'total_score': total_score,
+            'average_score': average_score,
+            'overall_grade': overall_grade,
+            'subject_details': [
+                {'subject_name': name, 'subject_code': code, 'score': score, 'grade': grade}
+                for (_, name, code), score, grade in zip(self.data['subjects'], scores, grades)
+            ],
+            'position': position,
+        }
+
+    def class_results(self):
+        """Rows in the shape returned by get_class_results()."""
+        return [self._result_row(row) for row in self.data['rows']]
+
+    def student_results(self, student_id):
+        """One student's row, or None if they had no marks in this class."""
+        for row in self.data['rows']:
+            if row[0] == student_id and row[6] is not None:
+                return self._result_row(row)
+        return None
+
+    def _exam_result(self, values):
+        student_id, *fields = values
+        return ExamResult(student=self._student(student_id), school_class_id=self.class_id, **dict(zip(_EXAM_RESULT_FIELDS, fields)))
+
+    def class_analysis(self):
+        """The dict returned by get_class_analysis()."""
+        analysis = dict(self.data['analysis'])
+        analysis['top_students'] = [self._exam_result(values) for values in analysis['top_students']]
+        analysis['bottom_students'] = [self._exam_result(values) for values in analysis['bottom_students']]
+        return analysis
+
+
+def load_class_snapshot(examination, class_obj):
+    """The ClassSnapshot for a published examination, or None."""
+    if not examination.is_published:
+        return None
+    class_id = getattr(class_obj, 'pk', class_obj)
+    data = ResultSnapshot.objects.filter(
+        examination=examination, school_class_id=class_id,
+    ).values_list('data', flat=True).first()
+    if data is None or data.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return ClassSnapshot(data, class_id=class_id)
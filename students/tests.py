@@ -1,3 +1,465 @@
+import datetime
+import io
+
+import openpyxl
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.test import TestCase
+from django.urls import reverse
+
+from users.models import CustomUser
+
+from .cache import RESULTS_CACHE_ALIAS
+from .grading import DEFAULT_SCHEME, invalidate_grading_cache
+from .enrollment import not_attempted_enrollments
+from .models import Class, ExamEnrollment, Examination, ExamResult, GradeBand, GradingScheme, Mark, Student, Subject
+from .exports import mark_template
+from .imports import import_marks, import_students, validate_marks
+from .marks import save_cells, save_scores
+from .results import (
+    get_cached_class_results, get_class_results, get_student_position, publish_examination, unpublish_examination,
+)
+from .views import calculate_student_result
+
+
+def make_student(prem_number, class_obj, first_name='Pupil', gender='M'):
+    return Student.objects.create(
+        prem_number=prem_number, first_name=first_name, last_name=prem_number,
+        date_of_birth=datetime.date(2015, 1, 1), gender=gender, current_class=class_obj,
+    )
+
+
+def sheet_file(rows, name='marks.xlsx'):
+    """An in-memory .xlsx upload with `rows` (the first is the header)."""
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    file = io.BytesIO()
+    workbook.save(file)
+    file.seek(0)
+    file.name = name
+    return file
+
+
+class SchoolTestCase(TestCase):
+    """A class of students sitting one examination in three subjects."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.class_obj = Class.objects.create(name='Standard 4', year=2026)
+        cls.subjects = [
+            Subject.objects.create(name=name, code=code)
+            for name, code in [('English', 'ENG'), ('Kiswahili', 'KIS'), ('Mathematics', 'MAT')]
+        ]
+        cls.class_obj.subjects.set(cls.subjects)
+        cls.examination = Examination.objects.create(
+            name='First Term Examination', date=datetime.date(2026, 3, 1), academic_year=2026, term='1',
+        )
+        cls.students = [make_student(f'P{index}', cls.class_obj, first_name=f'Pupil {index}') for index in range(4)]
+        cls.examination.classes_taking_exam.add(cls.class_obj)
+
+    def setUp(self):
+        # The results cache and the compiled grading schemes outlive a test's rollback
+        caches[RESULTS_CACHE_ALIAS].clear()
+        invalidate_grading_cache()
+
+    def add_marks(self, student, scores, examination=None):
+        """One mark per subject, in order; None leaves the subject unmarked."""
+        for subject, score in zip(self.subjects, scores):
+            if score is not None:
+                Mark.objects.create(
+                    student=student, subject=subject, examination=examination or self.examination, score=score,
+                )
+
+
+class ClassResultsTests(SchoolTestCase):
+    """The set-based results engine, the ExamResult table and RANK() positions."""
+
+    def setUp(self):
+        super().setUp()
+        # Pupils 1 and 2 tie on 210; pupil 3 has no marks
+        for student, scores in zip(self.students, [[90, 80, 70], [70, 70, 70], [60, 70, 80]]):
+            self.add_marks(student, scores)
+
+    def expected_results(self):
+        """The results computed the way calculate_results did, one student at a time."""
+        totals = {}
+        for student in self.students:
+            scores = [mark.score for mark in Mark.objects.filter(student=student, examination=self.examination)]
+            if scores:
+                totals[student.pk] = (sum(scores), len(scores))
+        expected = {}
+        for student_id, (total, count) in totals.items():
+            average = round(total / count, 2)
+            position = 1 + sum(1 for other, _ in totals.values() if other > total)
+            expected[student_id] = (total, average, DEFAULT_SCHEME.grade(average), position)
+        return expected
+
+    def test_class_results_match_per_student_computation(self):
+        results = get_class_results(self.examination, self.class_obj)
+        actual = {
+            row['student'].pk: (row['total_score'], row['average_score'], row['overall_grade'], row['position'])
+            for row in results if row['position'] is not None
+        }
+        self.assertEqual(actual, self.expected_results())
+        # The student without marks is listed last, without a position
+        self.assertEqual(results[-1]['student'], self.students[3])
+        self.assertIsNone(results[-1]['position'])
+
+    def test_tied_students_share_a_position(self):
+        positions = {row['student'].pk: row['position'] for row in get_class_results(self.examination, self.class_obj)}
+        self.assertEqual(positions[self.students[0].pk], 1)
+        self.assertEqual(positions[self.students[1].pk], 2)
+        self.assertEqual(positions[self.students[2].pk], 2)
+        self.assertEqual(get_student_position(self.students[2], self.examination), 2)
+        self.assertEqual(get_student_position(self.students[2], self.examination, dense=True), 2)
+
+    def test_query_count_does_not_grow_with_the_class(self):
+        get_class_results(self.examination, self.class_obj)  # Loads the grading schemes
+        with self.assertNumQueries(4):
+            get_class_results(self.examination, self.class_obj)
+
+        for index in range(10):
+            self.add_marks(make_student(f'X{index}', self.class_obj), [50, 50, 50])
+        with self.assertNumQueries(4):
+            results = get_class_results(self.examination, self.class_obj)
+        self.assertEqual(len(results), 14)
+
+    def test_exam_results_follow_mark_writes(self):
+        expected = self.expected_results()
+        stored = {
+            row.student_id: (row.total_score, row.average_score, row.overall_grade, row.position)
+            for row in ExamResult.objects.filter(examination=self.examination)
+        }
+        self.assertEqual(stored, expected)
+
+        mark = Mark.objects.get(student=self.students[2], subject=self.subjects[0], examination=self.examination)
+        mark.score = 100
+        mark.save()
+        result = ExamResult.objects.get(student=self.students[2], examination=self.examination)
+        self.assertEqual((result.total_score, result.position), (250, 1))
+        self.assertEqual(ExamResult.objects.get(student=self.students[0], examination=self.examination).position, 2)
+
+        Mark.objects.filter(student=self.students[2], examination=self.examination).delete()
+        self.assertFalse(ExamResult.objects.filter(student=self.students[2], examination=self.examination).exists())
+        self.assertEqual(ExamResult.objects.get(student=self.students[0], examination=self.examination).position, 1)
+
+    def test_cached_results_are_busted_by_a_mark_edit(self):
+        def total_of(student):
+            rows = get_cached_class_results(self.examination, self.class_obj)
+            return next(row['total_score'] for row in rows if row['student'] == student)
+
+        self.assertEqual(total_of(self.students[0]), 240)
+        with self.assertNumQueries(0):
+            self.assertEqual(total_of(self.students[0]), 240)
+        mark = Mark.objects.get(student=self.students[0], subject=self.subjects[0], examination=self.examination)
+        mark.score = 50
+        mark.save()
+        self.assertEqual(total_of(self.students[0]), 200)
+
+    def test_student_result_is_graded_for_the_class_the_examination_was_sat_in(self):
+        scheme = GradingScheme.objects.create(name='Standard 4')
+        scheme.classes.add(self.class_obj)
+        GradeBand.objects.create(scheme=scheme, grade='S4', min_score=0)
+        invalidate_grading_cache()
+
+        student = self.students[0]
+        student.current_class = Class.objects.create(name='Standard 5', year=2026)
+        student.save()
+        result = calculate_student_result(student, self.examination)
+        self.assertEqual({detail['grade'] for detail in result['subject_details']}, {'S4'})
+
+
+class PublishLockTests(SchoolTestCase):
+    """Marks of a published examination can't be changed by any write path."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_marks(self.students[0], [90, 80, 70])
+        self.mark = Mark.objects.get(student=self.students[0], subject=self.subjects[0], examination=self.examination)
+        publish_examination(self.examination)
+        self.result = ExamResult.objects.get(student=self.students[0], examination=self.examination)
+
+    def assertUnchanged(self):
+        self.assertEqual(Mark.objects.get(pk=self.mark.pk).score, 90)
+        result = ExamResult.objects.get(pk=self.result.pk)
+        self.assertEqual((result.total_score, result.position), (self.result.total_score, self.result.position))
+
+    def test_saving_a_mark_is_rejected(self):
+        self.mark.score = 10
+        with self.assertRaises(ValidationError):
+            self.mark.save()
+        with self.assertRaises(ValidationError):
+            Mark.objects.create(student=self.students[1], subject=self.subjects[0], examination=self.examination, score=50)
+        self.assertUnchanged()
+
+    def test_deleting_marks_is_rejected(self):
+        # Deletes send pre_delete inside their own transaction, so each gets a savepoint here
+        with self.assertRaises(ValidationError), transaction.atomic():
+            self.mark.delete()
+        with self.assertRaises(ValidationError), transaction.atomic():
+            Mark.objects.filter(examination=self.examination).delete()
+        self.assertUnchanged()
+
+    def test_bulk_writes_are_rejected(self):
+        with self.assertRaises(ValidationError):
+            save_scores(self.examination, {(self.students[0].pk, self.subjects[0].pk): 10})
+        with self.assertRaises(ValidationError):
+            save_scores(self.examination, {(self.students[0].pk, self.subjects[0].pk): None})
+        with self.assertRaises(ValidationError):
+            save_cells([{
+                'student': self.students[0].pk, 'subject': self.subjects[0].pk,
+                'examination': self.examination.pk, 'score': 10, 'version': self.mark.version,
+            }])
+        with self.assertRaises(ValidationError):
+            import_marks(sheet_file([['Prem_Number', 'Subject_Code', 'Score'], ['P0', 'ENG', 10]]), self.examination)
+        self.assertUnchanged()
+
+    def test_deleting_a_student_still_cascades_to_their_marks(self):
+        self.students[0].delete()
+        self.assertFalse(Mark.objects.filter(pk=self.mark.pk).exists())
+
+    def test_marks_can_change_again_once_unpublished(self):
+        unpublish_examination(self.examination)
+        save_scores(self.examination, {(self.students[0].pk, self.subjects[0].pk): 10})
+        self.assertEqual(ExamResult.objects.get(pk=self.result.pk).total_score, 160)
+
+
+class MarkEntryGridTests(SchoolTestCase):
+    """The class x subject mark entry grid."""
+
+    def grid(self, role):
+        user = CustomUser.objects.create_user(username=role, password='secret', role=role)
+        self.client.force_login(user)
+        return self.client.get(reverse('mark_entry_grid', args=[self.examination.pk, self.class_obj.pk]))
+
+    def test_grid_opens_for_mark_entry_roles(self):
+        self.assertEqual(self.grid('academic_teacher').status_code, 200)
+
+    def test_subject_teachers_are_turned_away(self):
+        response = self.grid('subject_teacher')
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+class AutosaveTests(SchoolTestCase):
+    """Per-cell autosave with optimistic version checks."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_marks(self.students[0], [90, 80, 70])
+        self.mark = Mark.objects.get(student=self.students[0], subject=self.subjects[0], examination=self.examination)
+
+    def cell(self, student, score, version, subject=None):
+        return {
+            'student': student.pk, 'subject': (subject or self.subjects[0]).pk,
+            'examination': self.examination.pk, 'score': score, 'version': version,
+        }
+
+    def test_current_version_is_saved_and_bumped(self):
+        result = save_cells([self.cell(self.students[0], 55, self.mark.version)])
+        self.assertEqual(result['conflicts'], [])
+        self.assertEqual(result['saved'][0]['version'], self.mark.version + 1)
+        self.assertEqual(Mark.objects.get(pk=self.mark.pk).score, 55)
+        self.assertEqual(ExamResult.objects.get(student=self.students[0], examination=self.examination).total_score, 205)
+
+    def test_stale_version_comes_back_as_a_conflict(self):
+        save_cells([self.cell(self.students[0], 55, self.mark.version)])
+        # A second teacher still holding the version they loaded
+        result = save_cells([self.cell(self.students[0], 60, self.mark.version)])
+        self.assertEqual(result['saved'], [])
+        self.assertEqual(result['conflicts'][0]['score'], 55)
+        self.assertEqual(result['conflicts'][0]['version'], self.mark.version + 1)
+        self.assertEqual(Mark.objects.get(pk=self.mark.pk).score, 55)
+
+    def test_new_mark_created_by_someone_else_is_a_conflict(self):
+        save_cells([self.cell(self.students[1], 40, None)])
+        result = save_cells([self.cell(self.students[1], 45, None)])
+        self.assertEqual(result['conflicts'][0]['score'], 40)
+        self.assertEqual(Mark.objects.get(student=self.students[1], subject=self.subjects[0]).score, 40)
+
+    def test_clearing_a_cell_deletes_the_mark(self):
+        result = save_cells([self.cell(self.students[0], None, self.mark.version)])
+        self.assertEqual(result['saved'][0]['version'], None)
+        self.assertFalse(Mark.objects.filter(pk=self.mark.pk).exists())
+
+    def test_endpoint_reports_conflicts_and_published_examinations(self):
+        user = CustomUser.objects.create_user(username='head', password='secret', role='headteacher')
+        self.client.force_login(user)
+        url = reverse('mark_autosave')
+
+        stale = self.cell(self.students[0], 60, self.mark.version - 1)
+        response = self.client.post(url, {'cells': [stale]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['conflicts']), 1)
+
+        publish_examination(self.examination)
+        response = self.client.post(url, {'cells': [self.cell(self.students[0], 60, self.mark.version)]}, content_type='application/json')
+        self.assertEqual(response.json()['saved'], [])
+        self.assertEqual(len(response.json()['errors']), 1)
+        self.assertEqual(Mark.objects.get(pk=self.mark.pk).score, 90)
+
+    def test_endpoint_rejects_subject_teachers(self):
+        user = CustomUser.objects.create_user(username='subject', password='secret', role='subject_teacher')
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('mark_autosave'), {'cells': [self.cell(self.students[0], 10, self.mark.version)]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Mark.objects.get(pk=self.mark.pk).score, 90)
+
+
+class MarkImportTests(SchoolTestCase):
+    """Bulk mark imports, the pre-filled template and dry-run validation."""
+
+    def test_long_sheet_imports_valid_rows_and_reports_the_rest(self):
+        report = import_marks(sheet_file([
+            ['Prem_Number', 'Subject_Code', 'Score'],
+            ['P0', 'ENG', 80],
+            ['P0', 'mat', 60],
+            ['P9', 'ENG', 50],
+            ['P1', 'XYZ', 50],
+            ['P1', 'ENG', 101],
+            ['P1', 'KIS', 'abc'],
+            [None, None, None],
+        ]), self.examination)
+
+        self.assertEqual((report.saved, report.created, report.skipped), (2, 2, 1))
+        self.assertEqual([error['row'] for error in report.errors], [4, 5, 6, 7])
+        self.assertEqual(
+            dict(Mark.objects.filter(examination=self.examination).values_list('subject__code', 'score')),
+            {'ENG': 80, 'MAT': 60},
+        )
+        self.assertEqual(ExamResult.objects.get(student=self.students[0], examination=self.examination).total_score, 140)
+
+    def test_template_round_trips_through_the_importer(self):
+        self.add_marks(self.students[0], [90, 80, 70])
+        self.add_marks(self.students[1], [50, None, 40])
+        target = io.BytesIO()
+        mark_template(target, self.examination, self.class_obj)
+        target.seek(0)
+
+        workbook = openpyxl.load_workbook(target)
+        sheet = workbook.active
+        header = [cell.value for cell in sheet[1]]
+        self.assertEqual(header, ['Prem_Number', 'First_Name', 'Middle_Name', 'Last_Name', 'ENG', 'KIS', 'MAT'])
+        self.assertEqual([row[0] for row in sheet.iter_rows(min_row=2, values_only=True)], ['P0', 'P1', 'P2', 'P3'])
+
+        # Unchanged, the template imports without changing anything
+        report = import_marks(sheet_file([[cell.value for cell in row] for row in sheet.rows]), self.examination)
+        self.assertEqual((report.created, report.updated, report.errors), (0, 0, []))
+
+        sheet.cell(row=3, column=header.index('KIS') + 1, value=65)  # P1 sat Kiswahili after all
+        sheet.cell(row=2, column=header.index('ENG') + 1, value=95)
+        report = import_marks(sheet_file([[cell.value for cell in row] for row in sheet.rows]), self.examination)
+        self.assertEqual((report.created, report.updated, report.errors), (1, 1, []))
+        self.assertEqual(Mark.objects.get(student=self.students[1], subject__code='KIS').score, 65)
+        self.assertEqual(Mark.objects.get(student=self.students[0], subject__code='ENG').score, 95)
+
+    def test_validation_lists_rejected_rows_without_saving(self):
+        report, rejected = validate_marks(sheet_file([
+            ['Prem_Number', 'Subject_Code', 'Score'],
+            ['P0', 'ENG', 80],
+            ['P9', 'ENG', 50],
+            ['P1', 'ENG', 2.5],
+        ]))
+        self.assertEqual((report.total_rows, report.failed), (3, 2))
+        self.assertEqual(list(rejected['Row']), [3, 4])
+        self.assertIn("prem number 'P9' not found", rejected['Problems'].iloc[0])
+        self.assertIn('whole number', rejected['Problems'].iloc[1])
+        self.assertFalse(Mark.objects.exists())
+
+
+class StudentImportTests(SchoolTestCase):
+    """Student roster imports keyed by prem number."""
+
+    def test_blank_cells_keep_the_stored_values_on_re_import(self):
+        header = ['Prem_Number', 'First_Name', 'Middle_Name', 'Last_Name', 'Class_Name']
+        Student.objects.filter(pk=self.students[0].pk).update(middle_name='Amani')
+
+        report = import_students(sheet_file([header, ['P0', 'Renamed', '', 'Pupil', 'Standard 4']], name='students.xlsx'))
+        self.assertEqual((report.updated, report.errors), (1, []))
+        student = Student.objects.get(pk=self.students[0].pk)
+        self.assertEqual((student.first_name, student.middle_name), ('Renamed', 'Amani'))
+
+        import_students(sheet_file([header, ['P0', 'Renamed', 'Neema', 'Pupil', 'Standard 4']], name='students.xlsx'))
+        self.assertEqual(Student.objects.get(pk=self.students[0].pk).middle_name, 'Neema')
+
+
+class EnrollmentTests(SchoolTestCase):
+    """Exam enrollments materialized from classes_taking_exam, and the not-attempted report."""
+
+    def enrolled(self, examination=None):
+        return dict(
+            ExamEnrollment.objects.filter(examination=examination or self.examination)
+            .values_list('student__prem_number', 'attempted')
+        )
+
+    def test_sitting_classes_are_enrolled(self):
+        self.assertEqual(self.enrolled(), {'P0': False, 'P1': False, 'P2': False, 'P3': False})
+
+    def test_a_new_examination_enrolls_only_its_classes(self):
+        other_class = Class.objects.create(name='Standard 5', year=2026)
+        make_student('Q0', other_class)
+        examination = Examination.objects.create(
+            name='Annual Examination', date=datetime.date(2026, 11, 1), academic_year=2026, term='3',
+        )
+        # classes_taking_exam is saved after the examination, so nothing is enrolled yet
+        self.assertEqual(self.enrolled(examination), {})
+        examination.classes_taking_exam.add(other_class)
+        self.assertEqual(self.enrolled(examination), {'Q0': False})
+
+    def test_attempted_follows_the_marks(self):
+        self.add_marks(self.students[0], [90, 80, 70])
+        self.add_marks(self.students[1], [0, 0, 0])
+        save_scores(self.examination, {(self.students[2].pk, self.subjects[0].pk): 45})
+        self.assertEqual(self.enrolled(), {'P0': True, 'P1': False, 'P2': True, 'P3': False})
+
+        Mark.objects.filter(student=self.students[0]).delete()
+        self.assertFalse(self.enrolled()['P0'])
+
+    def test_not_attempted_lists_active_students_without_a_scored_mark(self):
+        self.add_marks(self.students[0], [90, 80, 70])
+        self.add_marks(self.students[1], [0, 0, 0])
+        Student.objects.filter(pk=self.students[3].pk).update(status='Transferred')
+
+        enrollments = not_attempted_enrollments(self.examination, self.class_obj)
+        self.assertEqual([enrollment.student.prem_number for enrollment in enrollments], ['P1', 'P2'])
+        with self.assertNumQueries(1):
+            list(not_attempted_enrollments(self.examination))
+
+    def test_students_joining_later_are_enrolled(self):
+        make_student('P4', self.class_obj)
+        import_students(sheet_file([
+            ['Prem_Number', 'First_Name', 'Last_Name', 'Class_Name', 'Date_Of_Birth', 'Gender'],
+            ['P5', 'Imported', 'Pupil', 'Standard 4', '2015-01-01', 'F'],
+        ], name='students.xlsx'))
+        self.assertEqual(set(self.enrolled()), {'P0', 'P1', 'P2', 'P3', 'P4', 'P5'})
+        self.assertEqual(
+            {enrollment.student.prem_number for enrollment in not_attempted_enrollments(self.examination)},
+            {'P0', 'P1', 'P2', 'P3', 'P4', 'P5'},
+        )
+
+    def test_promoted_students_join_the_open_examinations_of_their_new_class(self):
+        next_class = Class.objects.create(name='Standard 5', year=2026)
+        make_student('Q0', next_class)
+        open_exam = Examination.objects.create(
+            name='Annual Examination', date=datetime.date(2026, 11, 1), academic_year=2026, term='3',
+        )
+        open_exam.classes_taking_exam.add(next_class)
+        published_exam = Examination.objects.create(
+            name='Mock Examination', date=datetime.date(2026, 10, 1), academic_year=2026, term='3',
+        )
+        published_exam.classes_taking_exam.add(next_class)
+        publish_examination(published_exam)
+        published_before = self.enrolled(published_exam)
 
-# Create your tests here.
+        user = CustomUser.objects.create_user(username='head', password='secret', role='headteacher')
+        self.client.force_login(user)
+        self.client.post(reverse('student_promotion_and_graduation'), {
+            'action': 'promote', 'current_class': self.class_obj.pk, 'next_class': next_class.pk,
+        })
+        self.assertEqual(set(self.enrolled(open_exam)), {'Q0', 'P0', 'P1', 'P2', 'P3'})
+        # Published examinations are frozen
+        self.assertEqual(self.enrolled(published_exam), published_before)
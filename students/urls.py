@@ -29,12 +29,22 @@ urlpatterns = [
     path('examinations/add/', views.examination_add, name='examination_add'),
     path('examinations/edit/<int:pk>/', views.examination_edit, name='examination_edit'),
     path('examinations/delete/<int:pk>/', views.examination_delete, name='examination_delete'),
+    path('examinations/publish/<int:pk>/', views.examination_publish, name='examination_publish'),
+    path('examinations/unpublish/<int:pk>/', views.examination_unpublish, name='examination_unpublish'),
 
      # Mark Entry URLs
     path('marks/entry-selection/', views.mark_entry_selection, name='mark_entry_selection'),
     path('marks/upload-excel/', views.mark_excel_upload, name='mark_excel_upload'),
     path('marks/list/', views.mark_list, name='mark_list'),
+    path('marks/list/data/', views.mark_list_data, name='mark_list_data'),
     path('marks/entry/<int:exam_id>/<int:subject_id>/<int:class_id>/', views.mark_entry_form, name='mark_entry_form'),
+    path('marks/grid/<int:exam_id>/<int:class_id>/', views.mark_entry_grid, name='mark_entry_grid'),
+    path('marks/template/<int:exam_id>/<int:class_id>/', views.mark_template_download, name='mark_template_download'),
+    path('marks/templates/<int:exam_id>/', views.mark_template_set_download, name='mark_template_set_download'),
+    path('marks/autosave/', views.mark_autosave, name='mark_autosave'),
+    path('imports/<int:pk>/', views.import_job_detail, name='import_job_detail'),
+    path('imports/<int:pk>/progress/', views.import_job_progress, name='import_job_progress'),
+    path('imports/rejected/<str:token>/', views.download_rejected_rows, name='download_rejected_rows'),
      
      # Results URLs
     path('results/selection/', views.result_selection, name='result_selection'),
@@ -4,8 +4,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .models import Student, Class, Subject, Examination, Mark # 
-from django.forms import modelformset_factory, inlineformset_factory
+from django.views.decorators.http import require_POST
+from .models import Student, Class, Subject, Examination, Mark, ExamResult, ImportJob
 from .forms import ( StudentForm, 
                     ClassForm, 
                     SubjectForm, 
@@ -13,11 +13,11 @@ from .forms import ( StudentForm,
                     MarkEntrySelectionForm, 
                     MarkExcelUploadForm, 
                     ResultSelectionForm, 
-                    StudentCreationForm
+                    StudentCreationForm,
+                    MarkScoreFormSet,
         )
 
-from django import forms
-import datetime
+import json
 from django.db import transaction
 from django.template.loader import get_template
 from xhtml2pdf import pisa
@@ -32,18 +32,34 @@ from .models import SchoolDocument
 from .forms import SchoolDocumentForm
 from django.contrib.auth.models import User
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, Http404, FileResponse, StreamingHttpResponse
+from django.utils.text import slugify
+from django.conf import settings
 from django.template.loader import render_to_string
 from weasyprint import HTML
 import tempfile
-
-from django.db.models import Q
-import pandas as pd
+import os
 import openpyxl
+
+from django.core import signing
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
 from users.models import CustomUser
 from students.models import Student, Class
 from django.core.exceptions import ObjectDoesNotExist
-from decimal import Decimal
+from .results import (
+    get_cached_class_results, get_cached_class_analysis, get_student_results, get_published_snapshot,
+    exam_class_ids, load_score_matrix, publish_examination, unpublish_examination,
+)
+from .marks import load_marks, save_scores, save_cells
+from .enrollment import enroll_students, sync_exam_enrollment
+from .imports import (
+    ImportFormatError, import_marks, import_students, validate_marks, validate_students,
+    store_rejected_rows, load_rejected_rows,
+)
+from .jobs import enqueue_import, job_progress
+from .exports import mark_template, mark_template_set, template_filename, mark_export_csv, mark_export_xlsx
+from .grading import scheme_for
 
 def is_admin(user):
     return user.is_authenticated and user.role == 'admin'
@@ -115,100 +131,8 @@ def is_general_school_dashboard_user(user):
 def is_teacher(user):
      return user.is_authenticated and Class.objects.filter(class_teacher=user).exists()
 
-def get_grade(score):
-    if score is None:
-        return "N/A"
-    if score >= 81:
-        return "A"
-    elif score >= 61:
-        return "B"
-    elif score >= 41:
-        return "C"
-    elif score >= 21:
-        return "D"
-    else:
-        return "F"
-
 def calculate_results(examination, class_obj):
-    
-    students_in_class = Student.objects.filter(current_class=class_obj).order_by('first_name', 'last_name')
-
-    all_subjects_for_class = Subject.objects.filter(
-     
-    ).distinct().order_by('name') # Get all subjects for consistent display
-
-    class_results = []
-    student_total_scores = {} # To store total scores for positioning
-
-    for student in students_in_class:
-        # Get all marks for the current student in the given examination
-        student_marks = Mark.objects.filter(
-            student=student,
-            examination=examination
-        ).select_related('subject')
-
-        subject_details = []
-        current_student_total_score = 0
-        current_student_subject_count = 0 # To count subjects with actual scores
-
-        # Iterate through all relevant subjects for this class/exam
-        for subject in all_subjects_for_class:
-            mark_for_subject = student_marks.filter(subject=subject).first() # Get the specific mark for this subject
-
-            score = mark_for_subject.score if mark_for_subject else None
-            grade = get_grade(score) if score is not None else "N/A" # Handle N/A for grade too
-
-            subject_details.append({
-                'subject_name': subject.name,
-                'subject_code': subject.code,
-                'score': score,
-                'grade': grade,
-            })
-
-            if score is not None:
-                current_student_total_score += score
-                current_student_subject_count += 1
-
-        average_score = current_student_total_score / current_student_subject_count if current_student_subject_count > 0 else 0
-        overall_grade = get_overall_grade(average_score) # You need a get_overall_grade function
-
-        student_total_scores[student.pk] = current_student_total_score
-
-        class_results.append({
-            'student': student,
-            'total_score': current_student_total_score,
-            'average_score': round(average_score, 2),
-            'overall_grade': overall_grade,
-            'subject_details': subject_details, # This now includes all subjects
-            'position': None, # Will be set later
-        })
-
-    # Sort students by total score to determine positions
-    class_results_sorted = sorted(class_results, key=lambda x: x['total_score'], reverse=True)
-
-    # Assign positions
-    if class_results_sorted:
-        class_results_sorted[0]['position'] = 1
-        for i in range(1, len(class_results_sorted)):
-            if class_results_sorted[i]['total_score'] == class_results_sorted[i-1]['total_score']:
-                class_results_sorted[i]['position'] = class_results_sorted[i-1]['position']
-            else:
-                class_results_sorted[i]['position'] = i + 1
-
-    return class_results_sorted
-
-# You'll also need to ensure you have a get_overall_grade function
-def get_overall_grade(average_score):
-    if average_score >= 81:
-        return 'A'
-    elif average_score >= 61:
-        return 'B'
-    elif average_score >= 41:
-        return 'C'
-    elif average_score >= 21:
-        return 'D'
-    else:
-        return 'F'
+    return get_cached_class_results(examination, class_obj)
 
 @login_required
 @user_passes_test(can_access_all_students)
@@ -298,149 +222,34 @@ def student_upload_excel(request):
             return render(request, 'students/student_upload_excel.html')
 
         try:
-            workbook = openpyxl.load_workbook(excel_file)
-            sheet = workbook.active
-            header = [cell.value for cell in sheet[1]] # Get header row
-
-            # Expected headers (case-insensitive)
-            expected_headers = {
-                'first name': 'first_name',
-                'middle name': 'middle_name',
-                'last name': 'last_name',
-                'date of birth': 'date_of_birth',
-                'gender': 'gender',
-                'prem number': 'prem_number',
-                'class name': 'current_class_name', # We'll map this to actual Class object
-                'class year': 'current_class_year', # Used with class name
-            }
+            checked = check_upload(request, validate_students, excel_file, request.POST.get('upload_mode'))
+            if checked is not None:
+                return render(request, 'students/student_upload_excel.html', {
+                    'upload_mode': request.POST.get('upload_mode'),
+                    **checked,
+                })
+
+            queued = queue_large_upload(request, 'students', excel_file)
+            if queued:
+                return queued
+
+            report = import_students(excel_file)
+        except ImportFormatError as e:
+            messages.error(request, f"Invalid Excel file format. {e}")
+            return render(request, 'students/student_upload_excel.html')
 
-            # Map actual headers to expected model fields
-            header_map = {}
-            for col_idx, h in enumerate(header):
-                if h and str(h).strip().lower() in expected_headers:
-                    header_map[expected_headers[str(h).strip().lower()]] = col_idx
-
-            required_headers = ['first_name', 'last_name', 'date_of_birth', 'gender', 'prem_number', 'current_class_name', 'current_class_year']
-            if not all(rh in header_map for rh in required_headers):
-                missing_headers = [h.replace('_', ' ').title() for h in required_headers if h not in header_map]
-                messages.error(request, f"Missing required headers in Excel: {', '.join(missing_headers)}")
-                return render(request, 'students/student_upload_excel.html')
-
-            students_added = 0
-            errors = []
-
-            for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2): # Start from second row
-                row_data = {field_name: row[col_idx].value for field_name, col_idx in header_map.items()}
-
-                try:
-                    # Validate and clean data
-                    first_name = row_data.get('first_name')
-                    middle_name = row_data.get('middle_name')
-                    last_name = row_data.get('last_name')
-                    date_of_birth_raw = row_data.get('date_of_birth') # Get raw value
-                    gender = str(row_data.get('gender')).strip().upper()
-                    prem_number = str(row_data.get('prem_number')).strip()
-                    class_name = str(row_data.get('current_class_name')).strip()
-
-                    # Handle class_year potentially being None or non-integer
-                    class_year_raw = row_data.get('current_class_year')
-                    if class_year_raw is None or str(class_year_raw).strip() == '':
-                        class_year = None
-                    else:
-                        try:
-                            class_year = int(class_year_raw)
-                        except (ValueError, TypeError):
-                            errors.append(f"Row {row_idx}: Invalid Class Year ('{class_year_raw}'). Must be an integer.")
-                            continue # Skip this row
-
-                    # Basic validation for non-date fields
-                    if not all([first_name, last_name, gender, prem_number, class_name, class_year is not None]):
-                        errors.append(f"Row {row_idx}: Missing required data (first name, last name, gender, prem number, class name, or class year).")
-                        continue
-
-                    # --- START NEW ROBUST DATE PARSING LOGIC ---
-                    date_of_birth = None
-                    if isinstance(date_of_birth_raw, datetime.datetime):
-                        date_of_birth = date_of_birth_raw.date() # Extract date part from datetime object
-                    elif isinstance(date_of_birth_raw, str) and date_of_birth_raw.strip():
-                        date_of_birth_str = date_of_birth_raw.strip().split(' ')[0] # Remove time if present
-
-                        formats_to_try = [
-                            '%Y-%m-%d',  # YYYY-MM-DD (e.g., 2000-01-15)
-                            '%d-%m-%Y',  # DD-MM-YYYY (e.g., 15-01-2000)
-                            '%m/%d/%Y',  # MM/DD/YYYY (e.g., 01/15/2000)
-                            '%d/%m/%Y',  # DD/MM/YYYY (e.g., 15/01/2000)
-                            '%Y/%m/%d',  # YYYY/MM/DD (e.g., 2000/01/15)
-                            '%b %d, %Y',  # Jun 18, 2009 (Month Abbr Day, Year)
-                            '%B %d, %Y',  # June 18, 2009 (Full Month Name Day, Year)
-                            # Add other formats if you anticipate them, e.g., '%d %b %Y' for '18 Jun 2009'
-                        ]
-
-                        parsed = False
-                        for fmt in formats_to_try:
-                            try:
-                                date_of_birth = datetime.datetime.strptime(date_of_birth_str, fmt).date()
-                                parsed = True
-                                break
-                            except ValueError:
-                                continue
-
-                        if not parsed:
-                            errors.append(f"Row {row_idx}: Invalid date format for Date of Birth ('{date_of_birth_str}'). Please use YYYY-MM-DD, DD-MM-YYYY, MM/DD/YYYY, or Month Day, Year format.")
-                            continue # Skip row if date cannot be parsed
-                    else: # If date_of_birth_raw is None or some other unexpected type
-                        errors.append(f"Row {row_idx}: Date of Birth is missing or has an unexpected format/type ('{date_of_birth_raw}').")
-                        continue
-
-                    if not date_of_birth: # Final check after parsing attempts
-                        errors.append(f"Row {row_idx}: Date of Birth is missing or could not be parsed.")
-                        continue
-                    # --- END NEW ROBUST DATE PARSING LOGIC ---
-
-                    # Gender validation
-                    if gender not in ['M', 'F', 'O']:
-                        errors.append(f"Row {row_idx}: Invalid gender ('{gender}'). Use M, F, or O.")
-                        continue
-
-                    try:
-                        student_class = Class.objects.get(name__iexact=class_name, year=class_year)
-                    except Class.DoesNotExist:
-                        errors.append(f"Row {row_idx}: Class '{class_name}' (Year {class_year}) not found. Please ensure the class exists.")
-                        continue
-
-                    student, created = Student.objects.update_or_create(
-                        prem_number=prem_number,
-                        defaults={
-                            'first_name': first_name,
-                            'middle_name': middle_name if middle_name else None,
-                            'last_name': last_name,
-                            'date_of_birth': date_of_birth,
-                            'gender': gender,
-                            'current_class': student_class
-                        }
-                    )
-                    students_added += 1 if created else 0 # Count as added only if new, updated is implicit
-
-                except Exception as e:
-                    # This catches any other unexpected errors during row processing
-                    errors.append(f"Row {row_idx}: Error processing row: {e}")
-                    continue
-
-            if students_added > 0:
-                messages.success(request, f'Successfully uploaded! Added {students_added} students.')
+        if not report.errors:
+            if report.saved:
+                messages.success(request, f"Students uploaded successfully: {report.summary()}")
             else:
-                messages.info(request, "No new students were added (file might be empty or all students already exist/updated).")
+                messages.info(request, "No students were found in the Excel file.")
+            return redirect('all_students') # Redirect back to the student list
 
-            if errors:
-                for error_msg in errors:
-                    messages.error(request, error_msg)
-
-            return redirect('student_list') # Redirect back to the student list
-
-        except Exception as e:
-            messages.error(request, f"An overall error occurred while processing the Excel file: {e}. Please check file format.")
-            # print(f"DEBUG: Error processing Excel file: {e}") # For debugging
-            return render(request, 'students/student_upload_excel.html')
+        messages.warning(request, report.summary())
+        return render(request, 'students/student_upload_excel.html', {
+            'report': report,
+            'import_errors': report.errors[:MAX_ERRORS_SHOWN],
+        })
     else:
         # This handles GET requests to display the upload form
         return render(request, 'students/student_upload_excel.html')
@@ -593,7 +402,8 @@ def examination_list(request):
 
     context = {
         'examinations': examinations,
-        'can_manage_examinations': can_manage_examinations
+        'can_manage_examinations': can_manage_examinations,
+        'can_publish_results': is_admin_or_headteacher(request.user),
     }
     return render(request, 'students/examination_list.html', context)
 
@@ -647,6 +457,24 @@ def examination_delete(request, pk):
         return redirect('examination_list')
     return render(request, 'students/examination_confirm_delete.html', {'examination': examination})
 
+@login_required
+@user_passes_test(is_admin_or_headteacher, login_url='/users/login/')
+@require_POST
+def examination_publish(request, pk):
+    examination = get_object_or_404(Examination, pk=pk)
+    class_count = publish_examination(examination)
+    messages.success(request, f"Results for '{examination}' published for {class_count} classes. Marks are now locked.")
+    return redirect('examination_list')
+
+@login_required
+@user_passes_test(is_admin_or_headteacher, login_url='/users/login/')
+@require_POST
+def examination_unpublish(request, pk):
+    examination = get_object_or_404(Examination, pk=pk)
+    unpublish_examination(examination)
+    messages.success(request, f"Results for '{examination}' unpublished. Marks can be edited again; publish the examination once they are final.")
+    return redirect('examination_list')
+
 @login_required
 @user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
 def mark_entry_selection(request):
@@ -666,6 +494,18 @@ def mark_entry_selection(request):
             if class_name:
                 params['class_id'] = class_name.pk
 
+            if 'open_grid' in request.POST:
+                if not (examination and class_name):
+                    messages.error(request, "Please select an Examination and a Class to open the class grid.")
+                    return render(request, 'students/mark_entry_selection.html', {'form': form})
+                return redirect('mark_entry_grid', exam_id=examination.pk, class_id=class_name.pk)
+
+            if 'download_template' in request.POST:
+                if not (examination and class_name):
+                    messages.error(request, "Please select an Examination and a Class to download its mark template.")
+                    return render(request, 'students/mark_entry_selection.html', {'form': form})
+                return redirect('mark_template_download', exam_id=examination.pk, class_id=class_name.pk)
+
             if not (examination and subject and class_name):
                 messages.error(request, "Please ensure you select an Examination, Subject, and Class.")
                 return render(request, 'students/mark_entry_selection.html', {'form': form})
@@ -732,10 +572,6 @@ def mark_entry_selection(request):
 @login_required
 @user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
 def mark_entry_form(request, exam_id, subject_id, class_id):
-    print("User:", request.user)
-    print("User authenticated?", request.user.is_authenticated)
-    print("User role:", getattr(request.user, 'role', 'No role attribute'))
-
     try:
         examination = get_object_or_404(Examination, pk=exam_id)
         subject = get_object_or_404(Subject, pk=subject_id)
@@ -774,51 +610,30 @@ def mark_entry_form(request, exam_id, subject_id, class_id):
     if not students.exists():
         messages.warning(request, "No students found for the selected criteria.")
         return redirect('mark_entry_selection')
-    
-    class IndividualMarkForm(forms.ModelForm):
-        class Meta:
-            model = Mark
-            fields = ['score']
-        sscore = forms.IntegerField(
-            min_value=0,
-            max_value=100,
-            required=False,
-            widget=forms.NumberInput()
-        )
 
-    MarkFormSet = modelformset_factory(Mark, form=IndividualMarkForm, extra=0, can_delete=False)
-    initial_data = []
-    for student in students:
-        mark, created = Mark.objects.get_or_create(
-            student=student,
-            subject=subject,
-            examination=examination,
-            defaults={'score': None} 
-        )
-        initial_data.append({
-            'id': mark.id,
-            'student_name': f"{student.first_name} {student.middle_name} {student.last_name}",
-            'score': mark.score,
-            'student_id': student.id 
-        })
-    queryset = Mark.objects.filter(
-        student__in=students,
-        subject=subject,
-        examination=examination
-    )
+    if examination.is_published:
+        messages.error(request, f"Results for '{examination}' are published, so its marks can't be changed. Ask the head teacher to unpublish it first.")
+        return redirect('mark_entry_selection')
+    
+    # One query for the students and one for their existing marks; students
+    # without a score simply have no Mark row.
+    students = list(students)
+    students_by_id = {student.pk: student for student in students}
+    existing_marks = load_marks(examination, list(students_by_id), [subject.pk])
+    initial_data = [{
+        'student_id': student.pk,
+        'score': existing_marks[(student.pk, subject.pk)].score if (student.pk, subject.pk) in existing_marks else None,
+    } for student in students]
 
     if request.method == 'POST':
-        formset = MarkFormSet(request.POST, queryset=queryset)
+        formset = MarkScoreFormSet(request.POST, initial=initial_data)
         if formset.is_valid():
-            for form in formset:
-                if form.has_changed(): 
-                    mark_instance = form.save(commit=False)
-                    if not mark_instance.pk: 
-                        student_id_from_form = form.cleaned_data.get('student_id') 
-                        mark_instance.student = Student.objects.get(pk=student_id_from_form)
-                        mark_instance.subject = subject
-                        mark_instance.examination = examination
-                    mark_instance.save()
+            scores = {
+                (form.cleaned_data['student_id'], subject.pk): form.cleaned_data.get('score')
+                for form in formset
+                if form.has_changed() and form.cleaned_data['student_id'] in students_by_id
+            }
+            save_scores(examination, scores, existing_marks)
             messages.success(request, 'Marks saved successfully!')
             return redirect('mark_entry_selection')
         else:
@@ -829,26 +644,360 @@ def mark_entry_form(request, exam_id, subject_id, class_id):
                         for error in errors:
                             messages.error(request, f"Error for Student (ID: {form.initial.get('student_id')}): {field.replace('_', ' ').title()}: {error}")
     else:
-        mark_instances_for_formset = []
-        for student in students:
-            mark_instance, created = Mark.objects.get_or_create(
-                student=student,
-                subject=subject,
-                examination=examination
-            )
-            mark_instances_for_formset.append(mark_instance)
-
-        formset = MarkFormSet(queryset=Mark.objects.filter(pk__in=[m.pk for m in mark_instances_for_formset]))
+        formset = MarkScoreFormSet(initial=initial_data)
+
+    # (student, form, stored score, mark version); the autosave script needs the last two
+    rows = []
+    for student, form in zip(students, formset):
+        mark = existing_marks.get((student.pk, subject.pk))
+        if mark is None:
+            rows.append((student, form, '', ''))
+        else:
+            rows.append((student, form, '' if mark.score is None else mark.score, mark.version))
 
     context = {
         'examination': examination,
         'selected_class': selected_class,
         'subject': subject,
         'formset': formset,
-        'students': students 
+        'students': students,
+        'rows': rows,
     }
     return render(request, 'students/mark_entry_form.html', context)
 
+@login_required
+@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
+def mark_entry_grid(request, exam_id, class_id):
+    """
+    Marks for every student x subject of one class in one examination on a
+    single screen. The page posts only the changed cells (as JSON in the
+    `changes` field) and they are saved in one batch.
+    """
+    if not is_admin_or_teacher(request.user):
+        messages.error(request, "You do not have permission to enter marks.")
+        return redirect('login')
+
+    examination = get_object_or_404(Examination, pk=exam_id)
+    class_obj = get_object_or_404(Class, pk=class_id)
+
+    if is_class_teacher(request.user):
+        if not Class.objects.filter(pk=class_obj.pk, class_teacher=request.user).exists():
+            messages.error(request, "You can only enter marks for your assigned class.")
+            return redirect('mark_entry_selection')
+
+    if examination.is_published:
+        messages.error(request, f"Results for '{examination}' are published, so its marks can't be changed. Ask the head teacher to unpublish it first.")
+        return redirect('mark_entry_selection')
+
+    students = list(Student.objects.filter(current_class=class_obj).order_by('first_name', 'last_name'))
+    subjects = list(class_obj.subjects.all().order_by('name'))
+    if not students or not subjects:
+        messages.warning(request, f"{class_obj.name} has no students or no subjects assigned.")
+        return redirect('mark_entry_selection')
+
+    student_ids = {student.pk for student in students}
+    subject_ids = {subject.pk for subject in subjects}
+    existing_marks = load_marks(examination, student_ids, subject_ids)
+    submitted = {}
+
+    if request.method == 'POST':
+        errors = []
+        scores = {}
+        try:
+            changes = json.loads(request.POST.get('changes') or '{}')
+        except ValueError:
+            changes = None
+        if not isinstance(changes, dict):
+            errors.append("The submitted marks could not be read. Please try again.")
+            changes = {}
+
+        for key, value in changes.items():
+            try:
+                student_id, subject_id = (int(part) for part in key.split(':'))
+            except ValueError:
+                continue
+            if student_id not in student_ids or subject_id not in subject_ids:
+                continue
+            submitted[key] = value
+            if value in (None, ''):
+                scores[(student_id, subject_id)] = None
+                continue
+            try:
+                score = int(value)
+            except (TypeError, ValueError):
+                score = None
+            if score is None or not 0 <= score <= 100:
+                errors.append(f"'{value}' is not a valid score (0-100).")
+                continue
+            scores[(student_id, subject_id)] = score
+
+        if errors:
+            for error in errors:
+                messages.error(request, error)
+        else:
+            created, updated, deleted = save_scores(examination, scores, existing_marks)
+            messages.success(request, f"Marks saved: {created} added, {updated} changed, {deleted} cleared.")
+            return redirect('mark_entry_grid', exam_id=examination.pk, class_id=class_obj.pk)
+    else:
+        # Opening the class for entry picks up students who joined it since the exam was set
+        sync_exam_enrollment(examination, [class_obj])
+
+    rows = []
+    for student in students:
+        cells = []
+        for subject in subjects:
+            key = f"{student.pk}:{subject.pk}"
+            mark = existing_marks.get((student.pk, subject.pk))
+            original = mark.score if mark is not None and mark.score is not None else ''
+            cells.append({
+                'key': key,
+                'subject_id': subject.pk,
+                'original': original,
+                'value': submitted.get(key, original),
+                'version': mark.version if mark is not None else '',
+            })
+        rows.append({'student': student, 'cells': cells})
+
+    context = {
+        'examination': examination,
+        'class_obj': class_obj,
+        'subjects': subjects,
+        'rows': rows,
+    }
+    return render(request, 'students/mark_entry_grid.html', context)
+
+MAX_AUTOSAVE_CELLS = 500
+
+def _parse_autosave_cell(raw, default_exam_id):
+    """Validates one cell of an autosave request; returns (cell, error)."""
+    if not isinstance(raw, dict):
+        return None, "Each cell must be an object."
+    try:
+        cell = {
+            'student': int(raw['student']),
+            'subject': int(raw['subject']),
+            'examination': int(raw.get('examination') or default_exam_id),
+        }
+    except (KeyError, TypeError, ValueError):
+        return None, "student, subject and examination must be numbers."
+
+    score = raw.get('score')
+    if score in (None, ''):
+        cell['score'] = None
+    else:
+        try:
+            cell['score'] = int(score)
+        except (TypeError, ValueError):
+            return cell, f"'{score}' is not a valid score (0-100)."
+        if not 0 <= cell['score'] <= 100:
+            return cell, f"'{score}' is not a valid score (0-100)."
+
+    version = raw.get('version')
+    try:
+        cell['version'] = int(version) if version not in (None, '') else None
+    except (TypeError, ValueError):
+        return cell, "version must be a number."
+    return cell, None
+
+@login_required
+@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
+def mark_template_download(request, exam_id, class_id):
+    """
+    A pre-filled wide-format mark sheet for one class: the roster, a column
+    per class subject and the marks already entered. It uploads back through
+    mark_excel_upload unchanged.
+    """
+    examination = get_object_or_404(Examination, pk=exam_id)
+    class_obj = get_object_or_404(Class, pk=class_id)
+
+    if is_class_teacher(request.user):
+        if not Class.objects.filter(pk=class_obj.pk, class_teacher=request.user).exists():
+            messages.error(request, "You can only download templates for your assigned class.")
+            return redirect('mark_entry_selection')
+
+    # Written to a temporary file and streamed from there
+    target = tempfile.TemporaryFile()
+    mark_template(target, examination, class_obj)
+    target.seek(0)
+    return FileResponse(
+        target, as_attachment=True, filename=template_filename(examination, class_obj),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+@login_required
+@user_passes_test(is_admin_or_headteacher, login_url='/users/login/')
+def mark_template_set_download(request, exam_id):
+    """Mark templates for every class of the school in one .zip."""
+    examination = get_object_or_404(Examination, pk=exam_id)
+    target = tempfile.TemporaryFile()
+    if not mark_template_set(target, examination):
+        target.close()
+        messages.warning(request, "No class has both students and subjects assigned, so there are no templates to download.")
+        return redirect('examination_list')
+    target.seek(0)
+    return FileResponse(
+        target, as_attachment=True, content_type='application/zip',
+        filename=f"mark_templates_{slugify(examination.name)}_{examination.academic_year}.zip",
+    )
+
+@login_required
+@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
+@require_POST
+def mark_autosave(request):
+    """
+    JSON endpoint for saving single mark cells as they are typed.
+
+    Body: {"examination": 1, "cells": [{"student": 5, "subject": 2, "score": 78, "version": 3}, ...]}
+    or one cell on its own. `version` is the version the client last loaded
+    (null if it saw no mark) and `examination` may also be given per cell.
+    Responds with the saved cells, the cells that changed underneath the
+    client (with the stored score and version) and any invalid cells.
+    """
+    if not is_admin_or_teacher(request.user):
+        return JsonResponse({'error': "You do not have permission to enter marks."}, status=403)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+
+    raw_cells = data.get('cells', [data])
+    if not isinstance(raw_cells, list) or not raw_cells:
+        return JsonResponse({'error': 'No cells to save.'}, status=400)
+    if len(raw_cells) > MAX_AUTOSAVE_CELLS:
+        return JsonResponse({'error': f'At most {MAX_AUTOSAVE_CELLS} cells can be saved at once.'}, status=400)
+
+    cells = []
+    errors = []
+    for raw in raw_cells:
+        cell, error = _parse_autosave_cell(raw, data.get('examination'))
+        if error:
+            errors.append({**(cell or {}), 'error': error})
+        else:
+            cells.append(cell)
+
+    examinations = Examination.objects.in_bulk({cell['examination'] for cell in cells})
+    student_classes = dict(
+        Student.objects.filter(pk__in={cell['student'] for cell in cells}).values_list('pk', 'current_class_id')
+    )
+    subject_ids = set(Subject.objects.filter(pk__in={cell['subject'] for cell in cells}).values_list('pk', flat=True))
+    assigned_class_id = None
+    if is_class_teacher(request.user):
+        assigned_class_id = Class.objects.filter(class_teacher=request.user).values_list('pk', flat=True).first()
+
+    valid_cells = []
+    for cell in cells:
+        examination = examinations.get(cell['examination'])
+        if examination is None or cell['student'] not in student_classes or cell['subject'] not in subject_ids:
+            error = "Unknown student, subject or examination."
+        elif examination.is_published:
+            error = "Results for this examination are published; marks can't be changed."
+        elif is_class_teacher(request.user) and student_classes[cell['student']] != assigned_class_id:
+            error = "You can only enter marks for your assigned class."
+        else:
+            valid_cells.append(cell)
+            continue
+        errors.append({**cell, 'error': error})
+
+    result = save_cells(valid_cells)
+    return JsonResponse({**result, 'errors': errors})
+
+# Rejected rows listed on an import page; the summary counts all of them
+MAX_ERRORS_SHOWN = 200
+
+def queue_large_upload(request, kind, excel_file, examination=None):
+    """
+    Hands uploads of IMPORT_BACKGROUND_MIN_BYTES or more to the import worker so
+    they don't time out the request. Returns a redirect to the job's progress
+    page, or None if the file is small enough to import straight away.
+    """
+    if excel_file.size < settings.IMPORT_BACKGROUND_MIN_BYTES:
+        return None
+    job = enqueue_import(kind, excel_file, request.user, examination)
+    messages.info(request, f"'{excel_file.name}' is a large file, so it has been queued for import. You can follow its progress here.")
+    return redirect('import_job_detail', pk=job.pk)
+
+# Rejected-row files from dry runs this session may download
+REJECTED_ROWS_SESSION_KEY = 'rejected_row_files'
+
+def check_upload(request, validate, excel_file, mode):
+    """
+    The dry-run step of an upload. For the 'dry_run' and 'if_clean' modes the
+    whole sheet is validated first (validate_marks / validate_students) and
+    the failing rows are stored for download.
+
+    Returns the template context to show when the upload stops here (always
+    for a dry run, or when an 'if_clean' upload has problems), or None to go
+    on and import. Raises ImportFormatError like the importers.
+    """
+    if mode not in ('dry_run', 'if_clean'):
+        return None
+    report, rejected = validate(excel_file)
+    excel_file.seek(0)
+    if mode == 'if_clean' and not report.errors:
+        return None
+
+    context = {'report': report, 'import_errors': report.errors[:MAX_ERRORS_SHOWN]}
+    if report.errors:
+        token = os.path.splitext(os.path.basename(store_rejected_rows(rejected)))[0]
+        request.session[REJECTED_ROWS_SESSION_KEY] = request.session.get(REJECTED_ROWS_SESSION_KEY, [])[-9:] + [token]
+        context['rejected_rows_token'] = token
+    if mode == 'dry_run':
+        messages.info(request, f"Check complete, nothing was saved. {report.check_summary()}")
+    else:
+        messages.warning(request, f"Nothing was saved because some rows have problems. {report.check_summary()}")
+    return context
+
+@login_required
+def download_rejected_rows(request, token):
+    """The failing rows of a dry run as .xlsx (default) or .csv (?format=csv)."""
+    if token not in request.session.get(REJECTED_ROWS_SESSION_KEY, []):
+        raise Http404("Rejected rows not found.")
+    try:
+        rejected = load_rejected_rows(f"imports/rejected/{token}.csv")
+    except FileNotFoundError:
+        raise Http404("Rejected rows not found.")
+
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="rejected_rows.csv"'
+        rejected.to_csv(response, index=False)
+        return response
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Rejected Rows')
+    sheet.append(list(rejected.columns))
+    for row in rejected.itertuples(index=False, name=None):
+        sheet.append(list(row))
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = 'attachment; filename="rejected_rows.xlsx"'
+    workbook.save(response)
+    return response
+
+def get_import_job_for(user, pk):
+    job = get_object_or_404(ImportJob.objects.select_related('examination'), pk=pk)
+    if job.created_by_id != user.pk and not (user.is_superuser or is_admin_or_headteacher(user)):
+        raise Http404("Import job not found.")
+    return job
+
+@login_required
+def import_job_detail(request, pk):
+    job = get_import_job_for(request.user, pk)
+    context = {
+        'job': job,
+        'progress': job_progress(job),
+        'report': {'failed': job.failed_rows, 'errors': job.errors},
+        'import_errors': job.errors[:MAX_ERRORS_SHOWN],
+    }
+    return render(request, 'students/import_job_detail.html', context)
+
+@login_required
+def import_job_progress(request, pk):
+    """Polled by the progress page: rows processed and failed so far, and the ETA."""
+    return JsonResponse(job_progress(get_import_job_for(request.user, pk)))
+
+
 @login_required
 @user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
 def mark_excel_upload(request):
@@ -870,178 +1019,48 @@ def mark_excel_upload(request):
 
             examination = get_object_or_404(Examination, pk=exam_id_post)
 
+            if examination.is_published:
+                messages.error(request, f"Results for '{examination}' are published, so its marks can't be changed. Ask the head teacher to unpublish it first.")
+                return redirect('mark_entry_selection')
+
             if not excel_file.name.endswith('.xlsx'):
                 messages.error(request, 'Invalid file type. Please upload an Excel (.xlsx) file.')
                 return render(request, 'students/mark_excel_upload.html', {'form': form, 'examination': examination})
 
             try:
-                workbook = openpyxl.load_workbook(excel_file)
-                sheet = workbook.active
-
-                header = [cell.value for cell in sheet[1]]
-                print(f"\n--- DEBUG START ---")
-                print(f"--- DEBUG: Raw headers from Excel: {header} ---")
-
-                _initial_required_headers = ['Prem_Number', 'First_Name', 'Middle_Name', 'Last_Name', 'Subject_Code', 'Score']
-                required_headers_normalized = {h.replace(' ', '_').lower() for h in _initial_required_headers}
-                normalized_header = {h.replace(' ', '_').lower() for h in header if h}
-
-                print(f"--- DEBUG: Normalized headers (as seen by Django): {normalized_header} ---")
-                print(f"--- DEBUG: Required headers (target - normalized): {required_headers_normalized} ---")
-
-                if not required_headers_normalized.issubset(normalized_header):
-                    missing_headers_display = set(_initial_required_headers) - set(h.replace('_', ' ').title() for h in normalized_header if h)
-                    messages.error(request, f'Invalid Excel file format. Missing one or more required columns: {", ".join(sorted(missing_headers_display))}. Expected: {", ".join(_initial_required_headers)}.')
-                    print(f"--- DEBUG: Missing headers (from normalized check): {required_headers_normalized - normalized_header} ---")
-                    print(f"--- DEBUG END ---\n")
-                    return render(request, 'students/mark_excel_upload.html', {'form': form, 'examination': examination})
-
-                # Now, when getting column indices, use the lowercase/underscored names:
-                header_map = {h.replace(' ', '_').lower(): i for i, h in enumerate(header) if h}
-                prem_col = header_map.get('prem_number')
-                first_name_col = header_map.get('first_name')
-                middle_name_col = header_map.get('middle_name')
-                last_name_col = header_map.get('last_name')
-                subject_col = header_map.get('subject_code')
-                score_col = header_map.get('score')
-
-                # Ensure all columns are found before proceeding with row processing (redundant check, but good for clarity)
-                if any(col is None for col in [prem_col, first_name_col, middle_name_col, last_name_col, subject_col, score_col]):
-                    messages.error(request, "One or more required columns were not found in the Excel file.")
-                    return render(request, 'students/mark_excel_upload.html', {'form': form, 'examination': examination})
-
-                # --- START: Debugging variables for row processing ---
-                print("\n--- DEBUG: Starting row processing ---")
-                errors = []
-                processed_count = 0
-                skipped_count = 0
-                # --- END: Debugging variables for row processing ---
-
-                for row_idx, row in enumerate(sheet.iter_rows(min_row=2), start=2):
-                    # --- START: Debugging for each row ---
-                    print(f"\n--- DEBUG: Processing Row {row_idx} ---")
-                    # --- END: Debugging for each row ---
-
-                    # Check if row is entirely empty (optional, but good for robust handling)
-                    if not any(cell.value for cell in row):
-                        print(f"  INFO: Row {row_idx} is empty, skipping.")
-                        skipped_count += 1
-                        continue
-
-                    prem_number = str(row[prem_col].value).strip() if row[prem_col].value is not None else ''
-                    excel_first_name = str(row[first_name_col].value).strip() if row[first_name_col].value is not None else ''
-                    excel_middle_name = str(row[middle_name_col].value).strip() if row[middle_name_col].value is not None else ''
-                    excel_last_name = str(row[last_name_col].value).strip() if row[last_name_col].value is not None else ''
-                    subject_code = str(row[subject_col].value).strip() if row[subject_col].value is not None else ''
-                    score_value = row[score_col].value
-
-                    # --- START: Debugging raw and cleaned values ---
-                    print(f"  Raw values: Adm='{row[prem_col].value}', Sub='{row[subject_col].value}', Score='{row[score_col].value}'")
-                    print(f"  Cleaned values: Prem='{prem_number}', Subject='{subject_code}', Score='{score_value}'")
-                    # --- END: Debugging raw and cleaned values ---
-
-                    if not prem_col_number or not subject_code:
-                        errors.append(f"Row {row_idx}: Prem Number or Subject Code is empty. Skipping row.")
-                        skipped_count += 1
-                        print(f"  SKIPPED: Row {row_idx} - Missing Prem or Subject Code.") # Debug
-                        continue
-
-                    student = None
-                    try:
-                        student = Student.objects.get(prem_number=prem_number)
-                        print(f"  SUCCESS: Row {row_idx} - Student found: ID={student.id}, Name={student.first_name} {student.last_name}, Class={student.current_class.name}") # Debug
-                    except Student.DoesNotExist:
-                        errors.append(f"Row {row_idx}: Student with prem number '{prem_number}' not found.")
-                        skipped_count += 1
-                        print(f"  ERROR: Row {row_idx} - Student not found for prem Number: {prem_number}") # Debug
-                        continue
-                    except Exception as e: # Catch any other unexpected student lookup errors
-                        errors.append(f"Row {row_idx}: Unexpected error finding student '{prem_number}': {e}")
-                        skipped_count += 1
-                        print(f"  CRITICAL ERROR: Row {row_idx} - Unexpected error finding student: {e}") # Debug
-                        continue
-
-                    subject = None
-                    try:
-                        subject = Subject.objects.get(code=subject_code)
-                        print(f"  SUCCESS: Row {row_idx} - Subject found: ID={subject.id}, Name={subject.name}, Code={subject.code}") # Debug
-                    except Subject.DoesNotExist:
-                        errors.append(f"Row {row_idx}: Subject with code '{subject_code}' not found.")
-                        skipped_count += 1
-                        print(f"  ERROR: Row {row_idx} - Subject not found for Code: {subject_code}") # Debug
-                        continue
-                    except Exception as e: # Catch any other unexpected subject lookup errors
-                        errors.append(f"Row {row_idx}: Unexpected error finding subject '{subject_code}': {e}")
-                        skipped_count += 1
-                        print(f"  CRITICAL ERROR: Row {row_idx} - Unexpected error finding subject: {e}") # Debug
-                        continue
-
-                    score = None
-                    try:
-                        # Ensure score_value is not None before attempting conversion
-                        if score_value is None:
-                            raise ValueError("Score is empty.")
-                        
-                        score = int(score_value)
-                        if not (0 <= score <= 100):
-                            errors.append(f"Row {row_idx}: Score for {prem_number} ({subject_code}) must be between 0 and 100. Found: {score_value}.")
-                            skipped_count += 1
-                            print(f"  ERROR: Row {row_idx} - Invalid score range: {score_value}") # Debug
-                            continue
-                        print(f"  SUCCESS: Row {row_idx} - Score parsed successfully: {score}") # Debug
-                    except (ValueError, TypeError) as e:
-                        errors.append(f"Row {row_idx}: Invalid score value for {prem_number} ({subject_code}). Found: '{score_value}'. Score must be a number (Error: {e}).")
-                        skipped_count += 1
-                        print(f"  ERROR: Row {row_idx} - Invalid score type/value: {score_value} (Error: {e})") # Debug
-                        continue
-                    except Exception as e: # Catch any other unexpected score parsing errors
-                        errors.append(f"Row {row_idx}: Unexpected error parsing score '{score_value}': {e}")
-                        skipped_count += 1
-                        print(f"  CRITICAL ERROR: Row {row_idx} - Unexpected error parsing score: {e}") # Debug
-                        continue
-
-
-                    try:
-                        mark, created = Mark.objects.update_or_create(
-                            student=student,
-                            subject=subject,
-                            examination=examination,
-                            defaults={'score': score}
-                        )
-                        processed_count += 1
-                        print(f"  SUCCESS: Row {row_idx} - Mark {'created' if created else 'updated'}: Student={student.prem_number}, Subject={subject.code}, Score={score}") # Debug
-
-                    except Exception as e:
-                        errors.append(f"Row {row_idx}: An error occurred while saving mark for {prem_number} ({subject_code}): {e}")
-                        skipped_count += 1
-                        print(f"  CRITICAL ERROR: Row {row_idx} - Failed to save mark: {e}") # Debug
-                        continue
-
-                # --- START: Debugging after loop ---
-                print(f"\n--- DEBUG: Row processing complete. Processed: {processed_count}, Skipped: {skipped_count} ---")
-                print("--- DEBUG END ---\n")
-                # --- END: Debugging after loop ---
-
-                if errors:
-                    # Use warning for individual row errors so upload message can still be seen
-                    for err in errors:
-                        messages.warning(request, err)
-
-                if processed_count > 0:
-                    messages.success(request, f"Successfully uploaded marks for {processed_count} students.")
-                elif skipped_count > 0:
-                    messages.info(request, f"No marks were successfully uploaded, but {skipped_count} rows were skipped due to issues. Please check warnings above.")
+                checked = check_upload(request, validate_marks, excel_file, form.cleaned_data['upload_mode'])
+                if checked is not None:
+                    return render(request, 'students/mark_excel_upload.html', {
+                        'form': MarkExcelUploadForm(initial={'upload_mode': form.cleaned_data['upload_mode']}),
+                        'examination': examination,
+                        **checked,
+                    })
+
+                queued = queue_large_upload(request, 'marks', excel_file, examination)
+                if queued:
+                    return queued
+
+                report = import_marks(excel_file, examination)
+            except ImportFormatError as e:
+                messages.error(request, f"Invalid Excel file format. {e}")
+                return render(request, 'students/mark_excel_upload.html', {'form': form, 'examination': examination})
+
+            if not report.errors:
+                if report.saved:
+                    messages.success(request, f"Marks uploaded successfully: {report.summary()}")
                 else:
                     messages.info(request, "No marks were found or processed from the Excel file.")
-
                 # Redirect to the selection page after processing is complete
                 return redirect('mark_entry_selection')
 
-            except Exception as e:
-                # This catch-all also needs a print to catch unexpected errors during file parsing
-                print(f"--- DEBUG: An unhandled error occurred during file processing: {e} ---")
-                messages.error(request, f"An unhandled error occurred while processing the Excel file: {e}. Please check file format.")
-                return render(request, 'students/mark_excel_upload.html', {'form': form, 'examination': examination})
+            # Show the rejected rows in one table instead of one message per row
+            messages.warning(request, report.summary())
+            return render(request, 'students/mark_excel_upload.html', {
+                'form': MarkExcelUploadForm(),
+                'examination': examination,
+                'report': report,
+                'import_errors': report.errors[:MAX_ERRORS_SHOWN],
+            })
         else:
             # Form is not valid (e.g., no file selected)
             # Pass examination context back to template if it was retrieved via GET
@@ -1062,10 +1081,24 @@ def mark_excel_upload(request):
         }
         return render(request, 'students/mark_excel_upload.html', context)
 
-@login_required
-@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
-def mark_list(request):
-    form = MarkEntrySelectionForm(request.GET or None)
+# Marks per page of mark_list; further pages load as the user scrolls
+MARK_LIST_PAGE_SIZE = 60
+
+# Keyset order of mark_list: year, term, class, subject and student name as
+# users read the list, with pk as the tie-breaker. Names are annotated onto
+# the rows (see mark_list_page) so the cursor can compare them.
+MARK_LIST_ORDER = (
+    'list_year', 'list_term', 'list_class', 'list_subject', 'list_first_name', 'list_last_name', 'pk',
+)
+MARK_LIST_CURSOR_SALT = 'students.mark_list'
+
+def filter_mark_list(request, form, notify=True):
+    """
+    The marks selected by the mark_list filters (and the class teacher
+    restriction). Returns (marks, selected_examination, selected_class,
+    selected_subject). With notify=False no messages are added, for the JSON
+    endpoint.
+    """
     marks = Mark.objects.all()
 
     selected_examination = None
@@ -1081,7 +1114,7 @@ def mark_list(request):
             marks = marks.filter(examination=examination_filter)
             selected_examination = examination_filter
         if class_filter:
-            marks = marks.filter(student__current_class=class_filter)
+            marks = marks.filter(school_class=class_filter)
             selected_class = class_filter
         if subject_filter:
             marks = marks.filter(subject=subject_filter)
@@ -1090,18 +1123,18 @@ def mark_list(request):
     if is_class_teacher(request.user):
         try:
             user_assigned_class = Class.objects.get(class_teacher=request.user)
-            marks = marks.filter(student__current_class=user_assigned_class)
-            if selected_class and selected_class.pk != user_assigned_class.pk:
+            marks = marks.filter(school_class=user_assigned_class)
+            if notify and selected_class and selected_class.pk != user_assigned_class.pk:
                 messages.warning(request, "As a Class Teacher, you can only view marks for your assigned class. Filter applied accordingly.")
             selected_class = user_assigned_class
         except Class.DoesNotExist:
-            messages.error(request, "You are a Class Teacher but not assigned to any class. Please contact the administrator.")
+            if notify:
+                messages.error(request, "You are a Class Teacher but not assigned to any class. Please contact the administrator.")
+                messages.info(request, "No class assigned. Please contact admin.")
             marks = Mark.objects.none() 
             form.fields['class_name'].queryset = Class.objects.none() 
-            messages.info(request, "No class assigned. Please contact admin.")
-
 
-    if not request.GET and not (selected_examination or selected_class or selected_subject):
+    if not (set(request.GET) & {'examination', 'class_name', 'subject'}) and not (selected_examination or selected_class or selected_subject):
         latest_exam = Examination.objects.order_by('-academic_year', '-term', '-date').first()
         if latest_exam:
             marks = marks.filter(examination=latest_exam)
@@ -1109,20 +1142,121 @@ def mark_list(request):
         else:
             marks = Mark.objects.none() 
 
-    marks = marks.order_by(
-        'examination__academic_year', 'examination__term',
-        'student__current_class__name', 'subject__name', 'student__first_name'
-    )
+    return marks, selected_examination, selected_class, selected_subject
+
+def mark_list_page(marks, after=None):
+    """
+    One page of marks in MARK_LIST_ORDER, starting after the `after` cursor
+    (keyset pagination: the cost of a page doesn't grow with how far the user
+    has scrolled). The cursor is the signed sort key of the last row shown.
+    Only the columns the page shows are loaded. Returns (marks, cursor for
+    the next page or None).
+    """
+    marks = marks.select_related('student', 'school_class', 'subject', 'examination').only(
+        'score', 'student_id', 'subject_id', 'examination_id', 'school_class_id',
+        'student__prem_number', 'student__first_name', 'student__middle_name', 'student__last_name',
+        'school_class__name', 'subject__name', 'examination__name',
+    ).annotate(
+        list_year=F('examination__academic_year'),
+        list_term=F('examination__term'),
+        # Marks without a class sort first instead of breaking the NULL comparisons
+        list_class=Coalesce('school_class__name', Value('')),
+        list_subject=F('subject__name'),
+        list_first_name=F('student__first_name'),
+        list_last_name=F('student__last_name'),
+    ).order_by(*MARK_LIST_ORDER)
+
+    if after:
+        try:
+            values = signing.loads(after, salt=MARK_LIST_CURSOR_SALT)
+        except signing.BadSignature:
+            raise Http404("Invalid page cursor.")
+        if not isinstance(values, list) or len(values) != len(MARK_LIST_ORDER):
+            raise Http404("Invalid page cursor.")
+        # Rows after the cursor: (a, b, ...) > (a0, b0, ...) spelled out field by field
+        after_cursor = Q()
+        for index, field in enumerate(MARK_LIST_ORDER):
+            after_cursor |= Q(**dict(zip(MARK_LIST_ORDER[:index], values)), **{f'{field}__gt': values[index]})
+        marks = marks.filter(after_cursor)
+
+    page = list(marks[:MARK_LIST_PAGE_SIZE + 1])
+    if len(page) <= MARK_LIST_PAGE_SIZE:
+        return page, None
+    page = page[:MARK_LIST_PAGE_SIZE]
+    last = page[-1]
+    return page, signing.dumps([getattr(last, field) for field in MARK_LIST_ORDER], salt=MARK_LIST_CURSOR_SALT)
+
+@login_required
+@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
+def mark_list(request):
+    form = MarkEntrySelectionForm(request.GET or None)
+    export_format = request.GET.get('export')
+    marks, selected_examination, selected_class, selected_subject = filter_mark_list(request, form)
+
+    # Same filters, streamed as a file instead of rendered
+    if export_format in ('csv', 'xlsx'):
+        marks = marks.order_by(
+            'examination__academic_year', 'examination__term',
+            'school_class__name', 'subject__name', 'student__first_name'
+        )
+        parts = [
+            slugify(str(selected.name)) for selected in (selected_examination, selected_class, selected_subject)
+            if selected
+        ]
+        filename = '_'.join(['marks'] + parts)
+        if export_format == 'csv':
+            response = StreamingHttpResponse(mark_export_csv(marks), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+            return response
+        target = tempfile.TemporaryFile()
+        mark_export_xlsx(target, marks)
+        target.seek(0)
+        return FileResponse(
+            target, as_attachment=True, filename=f"{filename}.xlsx",
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+
+    page, next_cursor = mark_list_page(marks)
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('export', None)
 
     context = {
         'form': form,
-        'marks': marks,
+        'marks': page,
+        'next_cursor': next_cursor,
+        'filter_query': query.urlencode(),
         'selected_examination': selected_examination,
         'selected_class': selected_class,
         'selected_subject': selected_subject,
     }
     return render(request, 'students/mark_list.html', context)
 
+@login_required
+@user_passes_test(is_general_school_dashboard_user, login_url='/users/login/')
+def mark_list_data(request):
+    """The next page of mark_list (same filters, ?after=<cursor>) as JSON for infinite scrolling."""
+    form = MarkEntrySelectionForm(request.GET or None)
+    marks, *_ = filter_mark_list(request, form, notify=False)
+    page, next_cursor = mark_list_page(marks, request.GET.get('after'))
+    return JsonResponse({
+        'marks': [
+            {
+                'student': mark.student.get_full_name(),
+                'prem_number': mark.student.prem_number,
+                'class': mark.school_class.name if mark.school_class else '',
+                'class_id': mark.school_class_id,
+                'examination': mark.examination.name,
+                'examination_id': mark.examination_id,
+                'subject': mark.subject.name,
+                'subject_id': mark.subject_id,
+                'score': mark.score,
+            }
+            for mark in page
+        ],
+        'next': next_cursor,
+    })
+
 @login_required
 @user_passes_test(is_admin_or_teacher, login_url='/users/login/')
 def result_selection(request):
@@ -1174,11 +1308,15 @@ def class_results_summary(request):
         examination = Examination.objects.get(id=exam_id)
         class_obj = Class.objects.get(id=class_id)
 
-        # --- IMPORTANT: Move the all_subjects query INSIDE this try block ---
-        all_subjects = Subject.objects.filter(
-            mark__examination=examination,
-            mark__student__current_class=class_obj
-        ).distinct().order_by('name')
+        snapshot = get_published_snapshot(examination, class_obj)
+        if snapshot is not None:
+            all_subjects = snapshot.marked_subjects()
+        else:
+            # --- IMPORTANT: Move the all_subjects query INSIDE this try block ---
+            all_subjects = Subject.objects.filter(
+                mark__examination=examination,
+                mark__school_class=class_obj
+            ).distinct().order_by('name')
 
     except (Examination.DoesNotExist, Class.DoesNotExist):
         messages.error(request, "Selected examination or class not found.")
@@ -1222,9 +1360,7 @@ def student_result_slip(request, exam_id, student_id):
             return redirect('result_selection')
 
     class_for_position = student.current_class
-    all_results_in_class = calculate_results(examination, class_for_position)
-
-    student_result = next((item for item in all_results_in_class if item['student'].id == student.id), None)
+    student_result = get_student_results(examination, student)
 
     if not student_result:
         messages.info(request, "No results found for this student in the selected examination.")
@@ -1320,41 +1456,6 @@ def home_view(request):
             return redirect(reverse('teacher_dashboard'))
     return redirect(reverse('login'))
 
-def process_student_excel_row(row_data, request):
-    try:
-        first_name = row_data.get('first_name')
-        middle_name = row_data.get('middle_name')
-        last_name = row_data.get('last_name')
-        date_of_birth = row_data.get('date_of_birth')
-        gender = row_data.get('gender')
-        prem_number = row_data.get('prem_number')
-        current_class_name = row_data.get('current_class_name')
-
-        if not all([first_name, last_name, prem_number, current_class_name]):
-            raise ValueError("Missing essential data (first name, last name, prem number, class name).")
-
-        try:
-            # Now 'Class' is defined because it's imported at the top
-            current_class = Class.objects.get(name=current_class_name) 
-        except Class.DoesNotExist:
-            raise ValueError(f"Class '{current_class_name}' not found. Please ensure the class exists.")
-
-        # Now 'Student' is defined because it's imported at the top
-        student, created = Student.objects.update_or_create(
-            prem_number=prem_number,
-            defaults={
-                'first_name': first_name,
-                'middle_name': middle_name,
-                'last_name': last_name,
-                'date_of_birth': date_of_birth,
-                'gender': gender,
-                'current_class': current_class,
-            }
-        )
-        return True, f"Student {student.get_full_name()} ({'created' if created else 'updated'})."
-    except Exception as e:
-        return False, f"Error: {e}"
-
 @login_required
 @user_passes_test(is_admin_or_headteacher_or_statistic_teacher, login_url='/users/login/') 
 def upload_students_excel(request):
@@ -1368,33 +1469,32 @@ def upload_students_excel(request):
                 return redirect('upload_students_excel')
 
             try:
-                df = pd.read_excel(excel_file)
-                
-                df.columns = df.columns.str.lower() 
-
-                success_count = 0
-                error_messages = []
-
-                for index, row_data in df.iterrows():
-                    row_number = index + 2 # Excel rows are 1-indexed, and header is row 1
-                    success, message = process_student_excel_row(row_data.to_dict(), request)
-                    if success:
-                        success_count += 1
-                    else:
-                        error_messages.append(f"Row {row_number}: {message}")
-
-                if success_count > 0:
-                    messages.success(request, f"Successfully processed {success_count} student records.")
-                if error_messages:
-                    for msg in error_messages:
-                        messages.warning(request, msg) # Use warning for row-level errors
-                
+                checked = check_upload(request, validate_students, excel_file, form.cleaned_data['upload_mode'])
+                if checked is not None:
+                    return render(request, 'students/upload_students_excel.html', {
+                        'form': StudentExcelUploadForm(initial={'upload_mode': form.cleaned_data['upload_mode']}),
+                        **checked,
+                    })
+
+                queued = queue_large_upload(request, 'students', excel_file)
+                if queued:
+                    return queued
+
+                report = import_students(excel_file)
+            except ImportFormatError as e:
+                messages.error(request, f"Invalid Excel file format. {e}")
+                return redirect('upload_students_excel')
+
+            if not report.errors:
+                messages.success(request, f"Successfully processed the student records: {report.summary()}")
                 return redirect('upload_students_excel') # Or redirect to student list
 
-            except ImportError:
-                messages.error(request, "Please install pandas and openpyxl: pip install pandas openpyxl")
-            except Exception as e:
-                messages.error(request, f"An unexpected error occurred during file processing: {e}")
+            messages.warning(request, report.summary())
+            return render(request, 'students/upload_students_excel.html', {
+                'form': StudentExcelUploadForm(),
+                'report': report,
+                'import_errors': report.errors[:MAX_ERRORS_SHOWN],
+            })
         else:
             messages.error(request, "Please correct the errors below.")
     else:
@@ -1580,30 +1680,6 @@ def delete_student_view(request, pk):
     }
     return render(request, 'students/confirm_delete_student.html', context)
 
-def is_passing_grade(grade):
-    """
-    Returns True if the grade is considered passing, False otherwise.
-    Adjust the logic as needed for your grading system.
-    """
-    return grade in ['A', 'B', 'C', 'D']
-
-def get_grade_from_score(score):
-    """
-    Maps a numeric score to a grade character.
-    """
-    if score is None:
-        return "N/A"
-    if score >= 81:
-        return "A"
-    elif score >= 61:
-        return "B"
-    elif score >= 41:
-        return "C"
-    elif score >= 21:
-        return "D"
-    else:
-        return "F"
-
 @login_required
 def performance_selection_view(request):
     classes = Class.objects.all().order_by('name')
@@ -1655,122 +1731,11 @@ def class_performance_analysis_view(request, class_id, exam_id):
     class_obj = get_object_or_404(Class, pk=class_id)
     examination = get_object_or_404(Examination, pk=exam_id)
 
-    # Get students who attempted the exam (i.e., have at least one non-null mark)
-    students_attempted = Student.objects.filter(
-        current_class=class_obj,
-        mark__examination=examination,
-        mark__score__isnull=False
-    ).distinct()
-    total_students_attempted = students_attempted.count()
-
-    class_results = []
-    for student in students_attempted:
-        marks = Mark.objects.filter(student=student, examination=examination)
-        total_score = sum(mark.score for mark in marks if mark.score is not None)
-        subjects_scored = sum(1 for mark in marks if mark.score is not None)
-        average_score = total_score / subjects_scored if subjects_scored > 0 else 0
-        overall_grade = get_grade_from_score(average_score)
-        
-        class_results.append({
-            'student': student,
-            'total_score': total_score,
-            'average_score': round(average_score, 2),
-            'overall_grade': overall_grade,
-            'is_pass': is_passing_grade(overall_grade)
-        })
-
-    # Sort by total score descending
-    class_results.sort(key=lambda x: x['total_score'], reverse=True)
-
-    # Assign position (handling ties)
-    current_position = 1
-    previous_score = None
-    for i, result in enumerate(class_results):
-        if result['total_score'] != previous_score:
-            current_position = i + 1
-        result['position'] = current_position
-        previous_score = result['total_score']
-
-    top_students = class_results[:10]
-
-    # Get the top 10 failing students
-    bottom_students = class_results[-10:]
-
-    
-    # Grade distribution and pass/fail count
-    grade_keys = ['A', 'B', 'C', 'D', 'E', 'F', 'N/A']
-    overall_grade_distribution = {grade: 0 for grade in grade_keys}
-    overall_pass_count = 0
-    overall_fail_count = 0
-
-    for result in class_results:
-        grade = result['overall_grade']
-        if grade not in overall_grade_distribution:
-            grade = 'N/A'
-        overall_grade_distribution[grade] += 1
-
-        if result['is_pass']:
-            overall_pass_count += 1
-        else:
-            overall_fail_count += 1
-
-    # Calculate pass/fail rates
-    overall_pass_rate = (overall_pass_count / total_students_attempted) * 100 if total_students_attempted > 0 else 0
-    overall_fail_rate = (overall_fail_count / total_students_attempted) * 100 if total_students_attempted > 0 else 0
-
-    # Subject analysis
-    subject_analysis = []
-    subjects = class_obj.subjects.all().order_by('name')
-    
-    for subject in subjects:
-        subject_data = {
-            'name': subject.name,
-            'code': subject.code,
-            'total_scored': 0,
-            'grades': {g: 0 for g in ['A', 'B', 'C', 'D', 'E', 'F']},
-            'pass_count': 0,
-            'fail_count': 0,
-        }
-
-        subject_marks = Mark.objects.filter(
-            examination=examination,
-            subject=subject,
-            student__current_class=class_obj,
-            score__isnull=False
-        ).select_related('student')
-
-        for mark in subject_marks:
-            grade = get_grade_from_score(mark.score)
-            subject_data['total_scored'] += 1
-            if grade in subject_data['grades']:
-                subject_data['grades'][grade] += 1
-            if is_passing_grade(grade):
-                subject_data['pass_count'] += 1
-            else:
-                subject_data['fail_count'] += 1
-
-        if subject_data['total_scored'] > 0:
-            subject_data['pass_percentage'] = (subject_data['pass_count'] / subject_data['total_scored']) * 100
-            subject_data['fail_percentage'] = (subject_data['fail_count'] / subject_data['total_scored']) * 100
-        else:
-            subject_data['pass_percentage'] = 0
-            subject_data['fail_percentage'] = 0
-
-        subject_analysis.append(subject_data)
-
     context = {
         'examination': examination,
         'class_obj': class_obj,
-        'total_students_attempted': total_students_attempted,
-        'overall_grade_distribution': overall_grade_distribution,
-        'overall_pass_count': overall_pass_count,
-        'overall_fail_count': overall_fail_count,
-        'overall_pass_rate': round(overall_pass_rate, 2),
-        'overall_fail_rate': round(overall_fail_rate, 2),
-        'subject_analysis': subject_analysis,
-        'top_students': top_students,
-        'bottom_students': bottom_students,
         'page_title': f'Class Performance - {class_obj.name}',
+        **get_cached_class_analysis(examination, class_obj),
     }
     return render(request, 'students/class_performance_analysis.html', context)
 
@@ -1779,7 +1744,10 @@ def student_result_slip_view(request, student_id, examination_id):
     student = get_object_or_404(Student, pk=student_id)
     examination = get_object_or_404(Examination, pk=examination_id)
 
-    marks = Mark.objects.filter(student=student, examination=examination)
+    marks = Mark.objects.filter(student=student, examination=examination).select_related('subject')
+    # Grade against the class the student sat the examination in
+    class_id = exam_class_ids([(student.pk, examination.pk)])[(student.pk, examination.pk)]
+    scheme = scheme_for(examination, class_id)
 
     total_score = 0
     subject_details = []
@@ -1792,11 +1760,11 @@ def student_result_slip_view(request, student_id, examination_id):
             subject_details.append({
                 'subject_name': mark.subject.name,
                 'score': mark.score,
-                'grade': get_grade(mark.score)
+                'grade': scheme.grade(mark.score)
             })
     
     average_score = (total_score / num_subjects_scored) if num_subjects_scored > 0 else 0
-    overall_grade = get_grade_from_score(average_score)
+    overall_grade = scheme.grade(average_score)
 
     student_position = None # Or implement logic to calculate class position here
 
@@ -1841,46 +1809,52 @@ def calculate_student_result(student, examination):
     Helper function to calculate all results for a student in a given exam.
     This version uses your CustomUser model and the 'role' field.
     """
-    # ... (all your existing calculation logic for position, total, average, etc.) ...
-    students_in_class = Student.objects.filter(current_class=student.current_class)
-
-    class_results = []
-    for s in students_in_class:
-        marks = Mark.objects.filter(student=s, examination=examination)
-        total = sum(mark.score or 0 for mark in marks)
-        class_results.append({
-            'student_id': s.id,
-            'total_score': total,
-            'marks_count': marks.count(),
-        })
+    # NEW: Fetch the class teacher and head teacher using your model structure
+    class_teacher = student.current_class.class_teacher
+    head_teacher = CustomUser.objects.filter(role='headteacher').first()
 
-    sorted_results = sorted(class_results, key=lambda x: x['total_score'], reverse=True)
-    for i in range(len(sorted_results)):
-        if i > 0 and sorted_results[i]['total_score'] == sorted_results[i-1]['total_score']:
-            sorted_results[i]['position'] = sorted_results[i-1]['position']
-        else:
-            sorted_results[i]['position'] = i + 1
+    # The class the student sat the examination in, which may not be their current one
+    class_id = exam_class_ids([(student.pk, examination.pk)])[(student.pk, examination.pk)]
+    snapshot = get_published_snapshot(examination, class_id)
+    if snapshot is not None:
+        frozen = snapshot.student_results(student.pk)
+        if frozen is not None:
+            return {
+                'position': frozen['position'],
+                'total_score': frozen['total_score'],
+                'average_score': frozen['average_score'],
+                'overall_grade': frozen['overall_grade'],
+                'subject_details': [detail for detail in frozen['subject_details'] if detail['score'] is not None],
+                'class_teacher': class_teacher,
+                'head_teacher': head_teacher,
+            }
+
+    exam_result = ExamResult.objects.filter(student=student, examination=examination).first()
 
-    student_result_data = next((res for res in sorted_results if res['student_id'] == student.id), None)
-    student_marks = Mark.objects.filter(student=student, examination=examination)
+    scheme = scheme_for(examination, class_id)
+
+    student_marks = Mark.objects.filter(student=student, examination=examination).select_related('subject')
     subject_details = []
     for mark in student_marks:
         subject_details.append({
             'subject_name': mark.subject.name,
             'score': mark.score,
-            'grade': get_grade(mark.score)
+            'grade': scheme.grade(mark.score)
         })
 
-    total_score = student_result_data['total_score']
-    average_score = Decimal(total_score) / Decimal(student_result_data['marks_count']) if student_result_data['marks_count'] > 0 else None
-    overall_grade = get_grade(average_score)
+    if exam_result:
+        total_score = exam_result.total_score
+        average_score = exam_result.average_score
+        overall_grade = exam_result.overall_grade
+        position = exam_result.position
+    else:
+        total_score = 0
+        average_score = None
+        overall_grade = scheme.grade(None)
+        position = None
 
-    # NEW: Fetch the class teacher and head teacher using your model structure
-    class_teacher = student.current_class.class_teacher
-    head_teacher = CustomUser.objects.filter(role='headteacher').first()
-    
     return {
-        'position': student_result_data['position'],
+        'position': position,
         'total_score': total_score,
         'average_score': average_score,
         'overall_grade': overall_grade,
@@ -1892,46 +1866,39 @@ def calculate_student_result(student, examination):
 def download_class_summary_pdf(request, exam_id, class_id):
     examination = get_object_or_404(Examination, pk=exam_id)
     class_obj = get_object_or_404(Class, pk=class_id)
-    
-    # ... (your data retrieval and calculation logic remains the same) ...
-    # This part of the code is unchanged from my last response
-    all_subjects = Subject.objects.filter(classes_assigned=class_obj).order_by('code')
-    students_in_class = Student.objects.filter(current_class=class_obj).order_by('prem_number')
-    
-    results = []
-    
-    for student in students_in_class:
-        marks = Mark.objects.filter(student=student, examination=examination)
-        total_score = sum(mark.score or 0 for mark in marks)
-        
-        if marks.exists():
-            average_score = Decimal(total_score) / Decimal(marks.count())
-        else:
-            average_score = None
-            
-        overall_grade = get_grade(average_score)
 
-        subject_details = [{'subject_code': mark.subject.code, 'score': mark.score} for mark in marks]
-        
-        results.append({
-            'student': student,
-            'total_score': total_score,
-            'average_score': average_score,
-            'overall_grade': overall_grade,
-            'subject_details': subject_details,
-            'position': None
+    snapshot = get_published_snapshot(examination, class_obj)
+    if snapshot is not None:
+        all_subjects = snapshot.class_subjects()
+        exam_results = []
+        sorted_results = [{
+            **row,
+            'subject_details': [detail for detail in row['subject_details'] if detail['score'] is not None],
+        } for row in snapshot.class_results() if row['position'] is not None]
+    else:
+        all_subjects = Subject.objects.filter(classes_assigned=class_obj).order_by('code')
+        subjects_by_id = {subject.pk: subject for subject in Subject.objects.all()}
+        score_matrix = load_score_matrix(examination, class_obj)
+
+        exam_results = ExamResult.objects.filter(
+            examination=examination, school_class=class_obj
+        ).select_related('student').order_by('position', 'student__prem_number')
+        sorted_results = []
+
+    for exam_result in exam_results:
+        student_scores = score_matrix.get(exam_result.student_id, {})
+        sorted_results.append({
+            'student': exam_result.student,
+            'total_score': exam_result.total_score,
+            'average_score': exam_result.average_score,
+            'overall_grade': exam_result.overall_grade,
+            'subject_details': [
+                {'subject_code': subjects_by_id[subject_id].code, 'score': score}
+                for subject_id, score in student_scores.items()
+            ],
+            'position': exam_result.position,
         })
 
-    sorted_results = sorted(results, key=lambda x: x['total_score'], reverse=True)
-
-    if sorted_results:
-        sorted_results[0]['position'] = 1
-        for i in range(1, len(sorted_results)):
-            if sorted_results[i]['total_score'] == sorted_results[i-1]['total_score']:
-                sorted_results[i]['position'] = sorted_results[i-1]['position']
-            else:
-                sorted_results[i]['position'] = i + 1
-
     # 2. Render HTML and generate PDF
     html_string = render_to_string('students/class_results_pdf.html', {
         'examination': examination,
@@ -2005,115 +1972,34 @@ def class_analysis_pdf(request, exam_id, class_id):
     examination = get_object_or_404(Examination, pk=exam_id)
     class_obj = get_object_or_404(Class, pk=class_id)
 
-    # Reuse the logic from your main view:
-    students_attempted = Student.objects.filter(
-        current_class=class_obj,
-        mark__examination=examination,
-        mark__score__isnull=False
-    ).distinct()
-
-    class_results = []
-    for student in students_attempted:
-        marks = Mark.objects.filter(student=student, examination=examination)
-        total_score = sum(mark.score for mark in marks if mark.score is not None)
-        subjects_scored = sum(1 for mark in marks if mark.score is not None)
-        average_score = total_score / subjects_scored if subjects_scored > 0 else 0
-        overall_grade = get_grade_from_score(average_score)
-
-        class_results.append({
-            'student': student,
-            'total_score': total_score,
-            'average_score': round(average_score, 2),
-            'overall_grade': overall_grade,
-            'is_pass': is_passing_grade(overall_grade)
-        })
-
-    overall_grade_distribution = {grade: 0 for grade in ['A', 'B', 'C', 'D', 'E', 'F', 'N/A']}
-    overall_pass_count = 0
-    overall_fail_count = 0
-
-    for result in class_results:
-        grade = result['overall_grade']
-        if grade not in overall_grade_distribution:
-            grade = 'N/A'
-        overall_grade_distribution[grade] += 1
-        if result['is_pass']:
-            overall_pass_count += 1
-        else:
-            overall_fail_count += 1
-
-    total_students = len(class_results)
-    overall_pass_rate = (overall_pass_count / total_students) * 100 if total_students > 0 else 0
-    overall_fail_rate = (overall_fail_count / total_students) * 100 if total_students > 0 else 0
-
-    # Subject analysis (same as your main view)
-    subject_analysis = []
-    subjects = class_obj.subjects.all().order_by('name')
-    for subject in subjects:
-        subject_data = {
-            'name': subject.name,
-            'code': subject.code,
-            'total_scored': 0,
-            'grades': {g: 0 for g in ['A', 'B', 'C', 'D', 'E', 'F']},
-            'pass_count': 0,
-            'fail_count': 0,
-        }
-        marks_for_subject = Mark.objects.filter(
-            examination=examination,
-            subject=subject,
-            student__current_class=class_obj,
-            score__isnull=False
-        ).select_related('student')
-
-        for mark in marks_for_subject:
-            grade = get_grade_from_score(mark.score)
-            subject_data['total_scored'] += 1
-            if grade in subject_data['grades']:
-                subject_data['grades'][grade] += 1
-            if is_passing_grade(grade):
-                subject_data['pass_count'] += 1
-            else:
-                subject_data['fail_count'] += 1
+    # Same computation as the class performance page
+    analysis = get_cached_class_analysis(examination, class_obj)
 
-        if subject_data['total_scored'] > 0:
-            subject_data['pass_percentage'] = (subject_data['pass_count'] / subject_data['total_scored']) * 100
-            subject_data['fail_percentage'] = (subject_data['fail_count'] / subject_data['total_scored']) * 100
-        else:
-            subject_data['pass_percentage'] = 0
-            subject_data['fail_percentage'] = 0
-        subject_analysis.append(subject_data)
-
-    # Top students
-    class_results.sort(key=lambda x: x['total_score'], reverse=True)
-    top_students = class_results[:10]
-   
     # Format top students for PDF
     top_students_for_pdf = [{
-        'name': f"{r['student'].first_name} {r['student'].last_name}",
-        'average': r['average_score'],
-        'grade': r['overall_grade']
-    } for r in top_students]
-
-    bottom_students = sorted(class_results, key=lambda x: x['total_score'])[:10]
+        'name': f"{r.student.first_name} {r.student.last_name}",
+        'average': r.average_score,
+        'grade': r.overall_grade
+    } for r in analysis['top_students']]
 
+    # Weakest student first
     bottom_students_for_pdf = [{
-        #'position_from_bottom': idx + 1,
-        'name': f"{r['student'].first_name} {r['student'].last_name}",
-        'average': r['average_score'],
-        'grade': r['overall_grade']
-    } for r in bottom_students]
+        'name': f"{r.student.first_name} {r.student.last_name}",
+        'average': r.average_score,
+        'grade': r.overall_grade
+    } for r in reversed(analysis['bottom_students'])]
 
     context = {
         'examination': examination,
         'class_obj': class_obj,
-        'overall_grade_distribution': overall_grade_distribution,
-        'subject_performance': subject_analysis,
+        'overall_grade_distribution': analysis['overall_grade_distribution'],
+        'subject_performance': analysis['subject_analysis'],
         'top_students': top_students_for_pdf,
-        'bottom_students':bottom_students_for_pdf,
-        'overall_pass_count': overall_pass_count,
-        'overall_fail_count': overall_fail_count,
-        'overall_pass_rate': round(overall_pass_rate, 2),
-        'overall_fail_rate': round(overall_fail_rate, 2),
+        'bottom_students': bottom_students_for_pdf,
+        'overall_pass_count': analysis['overall_pass_count'],
+        'overall_fail_count': analysis['overall_fail_count'],
+        'overall_pass_rate': analysis['overall_pass_rate'],
+        'overall_fail_rate': analysis['overall_fail_rate'],
     }
 
     template_path = 'students/class_analysis_pdf_template.html'
@@ -2155,6 +2041,8 @@ def student_promotion_and_graduation(request):
                     return redirect('student_promotion_and_graduation')
 
                 students_to_promote.update(current_class=next_class)
+                # update() skips the Student signal that enrolls students in open examinations
+                enroll_students(Student.objects.filter(current_class=next_class))
             
             messages.success(request, f"Successfully promoted {len(students_to_promote)} students from {current_class.name} to {next_class.name}.")
             